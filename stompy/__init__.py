@@ -7,10 +7,13 @@ from . import joystick
 from . import kinematics
 from . import leg
 from . import log
+from . import profiler
+from . import scheduler
 from . import signaler
+from . import telemetry
 
 
 __all__ = [
     'body',
     'consts', 'controllers', 'joystick', 'kinematics', 'leg', 'log',
-    'signaler']
+    'profiler', 'scheduler', 'signaler', 'telemetry']
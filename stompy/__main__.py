@@ -3,12 +3,25 @@
 Main script
 - program: -t <type> -s <serial[s]>
 - ui: ...
+- run: run the controller without a ui, publishing telemetry
+  [-a <host:port> to also stream telemetry over udp]
+  [-L <rate> control loop rate (Hz), rounded to a PLAN_TICK divisor]
+  [--status-period <seconds> between status logs]
+- viewer: run the ui for a controller started with 'run'
+- dashboard: -a <host:port> text display of udp telemetry
+- emulate: emulate leg and body teensies on ptys
+  [-n <leg numbers> e.g. 1,2,3,4,5,6]
+- sweep: simulate restriction configs and rank them
+  -P <name>=<v0,v1,...> (grid) or -P <name>=<low:high> with -N <n> (random)
+  [--paths forward,arc,turn,mixed -o <results.csv> -j <processes>]
+
+ui and run connect to found teensies or to ports given with
+-l <leg ports> and -b <body ports> (e.g. the emulated ptys)
 """
 
 import argparse
 import sys
 
-from . import ui
 from . import utils
 
 
@@ -16,16 +29,90 @@ parser = argparse.ArgumentParser(
     description="go stompy go!")
 
 parser.add_argument(
-    "command", type=str, choices=["program", "ui"])
+    "command", type=str,
+    choices=[
+        "program", "ui", "run", "viewer", "dashboard", "emulate", "sweep"])
 parser.add_argument("-t", "--type", type=str, default=None)
+parser.add_argument(
+    "-a", "--address", type=str, default=None,
+    help="udp telemetry address host:port (multicast or unicast)")
+parser.add_argument(
+    "-r", "--rate", type=float, default=10.,
+    help="udp telemetry rate (Hz)")
+parser.add_argument(
+    "-L", "--loop-rate", type=float, default=100.,
+    help="control loop rate (Hz)")
+parser.add_argument(
+    "--status-period", type=float, default=5.,
+    help="seconds between headless status logs")
+parser.add_argument(
+    "-l", "--legs", type=str, default=None,
+    help="comma separated leg teensy ports")
+parser.add_argument(
+    "-b", "--bodies", type=str, default=None,
+    help="comma separated body teensy ports")
+parser.add_argument(
+    "-n", "--leg-numbers", type=str, default="1,2,3,4,5,6",
+    help="comma separated leg numbers to emulate")
+parser.add_argument(
+    "-p", "--report-period", type=float, default=0.01,
+    help="emulated leg report period (seconds)")
+parser.add_argument(
+    "-P", "--param", type=str, action="append", default=None,
+    help="swept restriction parameter name=v0,v1,... or name=low:high")
+parser.add_argument(
+    "-N", "--n-random", type=int, default=None,
+    help="number of random sweep configs")
+parser.add_argument(
+    "--paths", type=str, default="forward",
+    help="comma separated sweep joystick paths")
+parser.add_argument(
+    "-o", "--output", type=str, default="sweep.csv",
+    help="sweep results table")
+parser.add_argument(
+    "-j", "--jobs", type=int, default=None,
+    help="sweep processes (default: number of cpus)")
+parser.add_argument(
+    "--seed", type=int, default=None, help="random sweep seed")
 #parser.add_argument("-s", "--serials", type=str, default=None)
 
 args = parser.parse_args(sys.argv[1:])
 
+
+def split_ports(ports):
+    if ports is None:
+        return None
+    return [p for p in ports.split(',') if p]
+
+
 if args.command == 'ui':
+    from . import ui
     # start ui
     print("Starting ui")
-    ui.start()
+    ui.start(split_ports(args.legs), split_ports(args.bodies))
+elif args.command == 'run':
+    from . import headless
+    print("Starting headless controller")
+    headless.run(
+        split_ports(args.legs), split_ports(args.bodies), args.address,
+        args.rate, args.loop_rate, args.status_period)
+elif args.command == 'viewer':
+    from . import ui
+    print("Starting viewer")
+    ui.remote.start()
+elif args.command == 'dashboard':
+    from . import telemetry
+    telemetry.dashboard.run(args.address)
+elif args.command == 'emulate':
+    from . import emulator
+    emulator.run(
+        [int(ln) for ln in args.leg_numbers.split(',')],
+        report_period=args.report_period)
+elif args.command == 'sweep':
+    from .restriction import sweep
+    sweep.run(
+        args.param, args.n_random, split_ports(args.paths), args.output,
+        args.jobs, args.seed)
 elif args.command == 'program':
     # program teensies
     if args.type is not None:
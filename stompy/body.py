@@ -4,11 +4,13 @@ import logging
 import sys
 import time
 import traceback
+import weakref
 
 import pycomando
 import serial
 
 from . import log
+from . import scheduler
 from . import signaler
 from . import utils
 
@@ -62,6 +64,8 @@ cmds = {
     },
 }
 
+HEARTBEAT_PERIOD = 0.5
+
 reports = {
     'imu': {
         'feed_pressure': 100,  # ms
@@ -111,17 +115,24 @@ class TeensyBody(BodyController):
         self.com.register_protocol(1, self._text)
 
         # setup report callbacks
+        # (hold self weakly, a cycle through mgr would keep __del__ from
+        # ever running)
+        ref = weakref.ref(self)
+
         def make_callback(n):
             cbn = n
 
             def cb(*args):
+                body = ref()
+                if body is None:
+                    return
                 vs = [a.value for a in args]
                 #print("%s: %s" % (cbn, vs))
                 if len(vs) == 1:
-                    self.log.debug({cbn: vs[0]})
+                    body.log.debug({cbn: vs[0]})
                 else:
-                    self.log.debug({cbn: vs})
-                self.trigger(cbn, *vs)
+                    body.log.debug({cbn: vs})
+                body.trigger(cbn, *vs)
             return cb
 
         r = reports.get(name, {})
@@ -130,19 +141,38 @@ class TeensyBody(BodyController):
             # setup reporting periods
             self.mgr.trigger(k, r[k])
 
+        # weak: cancelled when the body is collected (or closed)
+        self.heartbeat_task = scheduler.default.every(
+            HEARTBEAT_PERIOD, self.send_heartbeat,
+            name='heartbeat.%s' % name,
+            priority=scheduler.PRIORITY_HEARTBEAT, weak=True)
+
+    def close(self):
+        """Stop sending heartbeats"""
+        scheduler.default.cancel(self.heartbeat_task)
+
     def __del__(self):
+        if not hasattr(self, 'heartbeat_task'):
+            # failed to connect
+            return
+        self.close()
         # disable reports
         r = reports.get(self.name, {})
         #print("body disabling reports")
         for k in r:
             self.mgr.trigger(k, 0)
 
+    def send_heartbeat(self):
+        self.mgr.trigger('heartbeat')
+        self._last_hb = time.time()
+
     def update(self):
-        # heartbeat
-        t = time.time()
-        if (t - self._last_hb > 0.5):
-            self.mgr.trigger('heartbeat')
-            self._last_hb = t
+        # without a running scheduler heartbeats are sent here
+        if (
+                not self.heartbeat_task.cancelled and
+                not scheduler.default.running(HEARTBEAT_PERIOD) and
+                (time.time() - self._last_hb) > HEARTBEAT_PERIOD):
+            self.send_heartbeat()
         try:
             self.com.handle_stream()
         except Exception as e:
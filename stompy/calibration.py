@@ -1,5 +1,13 @@
 #!/usr/bin/env python
+"""
+Per leg calibration commands
+
+Saved calibrations (~/.stompy/calibrations/<leg name>) are loaded on the
+first call to get_setup (not at import).
+"""
 
+import errno
+import logging
 import os
 import cPickle as pickle
 
@@ -8,8 +16,13 @@ import numpy
 from . import consts
 
 
+logger = logging.getLogger(__name__)
+
 default_cal_dir = "~/.stompy/calibrations"
 setup = {}
+# set when calibrations have been loaded, or there are none to load
+# (see get_setup)
+loaded = False
 """
 setup = {
     1: [  # fl calibration: 180114
@@ -163,9 +176,17 @@ setup = {
 
 # load calibrations from ~/.stompy/calibrations/<leg>?
 def load_calibrations(directory=default_cal_dir, append=False):
+    global loaded
     d = os.path.abspath(os.path.expanduser(directory))
     # look for legs
-    fns = os.listdir(d)
+    try:
+        fns = os.listdir(d)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        logger.warning("No calibrations directory: %s" % (d, ))
+        loaded = True
+        return
     for fn in fns:
         # lookup leg number
         if fn not in consts.LEG_NUMBER_BY_NAME:
@@ -180,14 +201,19 @@ def load_calibrations(directory=default_cal_dir, append=False):
         else:
             # overwrite
             setup[ln] = cal_data
+    loaded = True
 
 
-# load initial calibrations
-load_calibrations(append=False)
+def get_setup():
+    """Calibrations by leg number, loaded on the first call"""
+    if not loaded:
+        load_calibrations(append=False)
+    return setup
 
 
 def save_calibrations(directory=default_cal_dir):
     d = os.path.abspath(os.path.expanduser(directory))
+    setup = get_setup()
     for ln in setup:
         leg_name = consts.LEG_NAME_BY_NUMBER[ln]
         fn = os.path.join(d, leg_name)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
+from . import loop
 from . import multileg
 
 
-__all__ = ['multileg']
+__all__ = ['loop', 'multileg']
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Estop fast path
+
+An estop from any source (a leg report, the foot too close check, deadman
+release) is broadcast to the legs through one channel.
+The estop is first written to every leg, then every port is flushed,
+before any state is updated or signals are triggered so no other work
+(ui updates, logging, plans sent from estop callbacks, waiting on one
+leg's port) delays the other legs.
+
+Each source passes the time the estop was detected (when the leg
+report was received, the xyz report that put a foot too close, the
+deadman release event) so latency is measured from detection to the
+last leg being flushed, for every broadcast, logged and kept in latency
+(a StatsMonitor).
+"""
+
+import time
+
+from .. import consts
+from .. import log
+from .. import signaler
+from .. import utils
+
+
+class EstopChannel(signaler.Signaler):
+    def __init__(self, legs):
+        super(EstopChannel, self).__init__()
+        self.legs = legs
+        self.latency = utils.StatsMonitor()
+        self.last_latency = None
+        self.last_source = None
+        self._broadcasting = False
+
+    def broadcast(
+            self, value, source, exclude=None, only_enabled=False, t=None):
+        """Send estop value to all legs (except exclude)
+
+        t is the time the estop was detected (now if None).
+
+        The estop is written to every leg even if its last known estop
+        is already value (the leg may not agree, e.g. after a dropped
+        frame), only legs whose estop changed update state and signal.
+        If only_enabled, only legs that are not already estopped are sent
+        the estop. Returns the legs that were sent the estop.
+
+        Estops signaled by legs during a broadcast are part of that
+        broadcast and are ignored.
+        """
+        if t is None:
+            t = time.time()
+        if self._broadcasting:
+            return []
+        self._broadcasting = True
+        try:
+            lns = []
+            for ln in self.legs:
+                if ln == exclude:
+                    continue
+                leg = self.legs[ln]
+                if only_enabled and leg.estop != consts.ESTOP_OFF:
+                    continue
+                # write first, update state and signal after
+                leg.send_estop(value, flush=False)
+                lns.append(ln)
+            for ln in lns:
+                self.legs[ln].flush()
+            dt = time.time() - t
+            # set_estop only logs and signals changes
+            changed = [ln for ln in lns if self.legs[ln].estop != value]
+            for ln in changed:
+                self.legs[ln].set_estop(value, send=False)
+        finally:
+            self._broadcasting = False
+        if len(lns) == 0:
+            return lns
+        self.last_latency = dt
+        self.last_source = source
+        self.latency.update(dt)
+        log.info({'estop_broadcast': {
+            'value': value, 'source': source, 'legs': lns,
+            'changed': changed, 'latency': dt}})
+        self.trigger('broadcast', value, source, dt)
+        return lns
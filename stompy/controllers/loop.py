@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"""
+Fixed rate control loop
+
+The controller update runs on deadlines spaced one period apart, the
+period is PLAN_TICK divided by a whole number (the requested rate is
+rounded) so updates stay in phase with leg plan ticks. Deadlines come
+from a monotonic clock (time.monotonic or, on linux with python 2,
+clock_gettime(CLOCK_MONOTONIC) through ctypes; other platforms fall back
+to time.time with a warning) so they don't jump with ntp or clock
+changes, and the loop sleeps until the next deadline instead of a fixed
+time so time spent working does not add to the period.
+
+If an update runs past the next deadline it is an overrun: missed
+deadlines are skipped (keeping phase) and non-critical work (telemetry,
+display...) is skipped for that tick. Non-critical work is never skipped
+twice in a row so it is slowed but not starved.
+
+Lateness (start - deadline), period (time between starts) and busy time
+(critical and non-critical work) are recorded.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import sys
+import time
+
+from .. import consts
+from .. import signaler
+from .. import utils
+
+
+logger = logging.getLogger(__name__)
+
+# clock id, only valid on linux
+CLOCK_MONOTONIC = 1
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _find_monotonic():
+    """Return a monotonic clock (seconds), time.time if none is found"""
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    if not sys.platform.startswith('linux'):
+        logger.warning(
+            "No monotonic clock on %s, control loop deadlines use "
+            "time.time" % (sys.platform, ))
+        return time.time
+    try:
+        lib = ctypes.CDLL(
+            ctypes.util.find_library('rt') or
+            ctypes.util.find_library('c'), use_errno=True)
+        clock_gettime = lib.clock_gettime
+    except (OSError, AttributeError):
+        logger.warning(
+            "No monotonic clock, control loop deadlines use time.time")
+        return time.time
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+    ts = _timespec()
+    ts_ref = ctypes.byref(ts)
+
+    def monotonic():
+        if clock_gettime(CLOCK_MONOTONIC, ts_ref) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, "clock_gettime failed")
+        return ts.tv_sec + ts.tv_nsec * 1E-9
+
+    return monotonic
+
+
+monotonic = _find_monotonic()
+
+
+class ControlLoop(signaler.Signaler):
+    def __init__(self, update, rate=100., clock=monotonic, sleep=time.sleep):
+        """Call update (critical work) at rate (Hz, see set_rate)"""
+        super(ControlLoop, self).__init__()
+        self.update = update
+        self.clock = clock
+        self.sleep = sleep
+        # [func, skipped last tick]
+        self.tasks = []
+        self.deadline = None
+        self.running = False
+        self.set_rate(rate)
+        self.lateness = utils.StatsMonitor()
+        self.period_stats = utils.StatsMonitor()
+        self.busy = utils.StatsMonitor()
+        self.reset_stats()
+
+    def set_rate(self, rate):
+        """Set the loop rate, rounded to a whole number of updates per
+        PLAN_TICK (if known)"""
+        if consts.PLAN_TICK is None:
+            self.period = 1. / rate
+        else:
+            n = max(1, int(rate * consts.PLAN_TICK + 0.5))
+            self.period = consts.PLAN_TICK / n
+        # restart phase
+        self.deadline = None
+
+    @property
+    def rate(self):
+        return 1. / self.period
+
+    def add(self, func):
+        """Add non-critical work, run after update unless overloaded"""
+        self.tasks.append([func, False])
+
+    def remove(self, func):
+        self.tasks = [t for t in self.tasks if t[0] is not func]
+
+    def reset_stats(self):
+        self.lateness.reset()
+        self.period_stats.reset()
+        self.busy.reset()
+        self.n_ticks = 0
+        self.n_overruns = 0
+        self.n_missed = 0
+        self.n_skipped = 0
+        self._last_start = None
+
+    def tick(self, t=None):
+        """Run one update now, schedule the next deadline"""
+        if t is None:
+            t = self.clock()
+        if self.deadline is None:
+            self.deadline = t
+        self.lateness.update(t - self.deadline)
+        if self._last_start is not None:
+            self.period_stats.update(t - self._last_start)
+        self._last_start = t
+        self.n_ticks += 1
+        self.update()
+        late = self.clock() > self.deadline + self.period
+        for task in self.tasks:
+            if late and not task[1]:
+                task[1] = True
+                self.n_skipped += 1
+                continue
+            task[1] = False
+            task[0]()
+        end = self.clock()
+        self.busy.update(end - t)
+        # skip missed deadlines, keep phase
+        n = int((end - self.deadline) / self.period)
+        if n > 0:
+            self.n_overruns += 1
+            self.n_missed += n
+            self.trigger('overrun', end - self.deadline - self.period)
+        self.deadline += (n + 1) * self.period
+
+    def next_delay(self):
+        """Seconds until the next deadline (0 if due)"""
+        if self.deadline is None:
+            return 0.
+        return max(0., self.deadline - self.clock())
+
+    def poll(self):
+        """Tick if the next deadline has passed (for an external event
+        loop), returns True if a tick was run"""
+        t = self.clock()
+        if self.deadline is not None and t < self.deadline:
+            return False
+        self.tick(t)
+        return True
+
+    def step(self):
+        """Sleep until the next deadline and tick"""
+        if self.deadline is not None:
+            dt = self.deadline - self.clock()
+            if dt > 0:
+                self.sleep(dt)
+        self.tick()
+
+    def run(self):
+        """Tick until stop is called"""
+        self.running = True
+        while self.running:
+            self.step()
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        return {
+            'period': self.period,
+            'ticks': self.n_ticks,
+            'overruns': self.n_overruns,
+            'missed': self.n_missed,
+            'skipped': self.n_skipped,
+            'lateness': {
+                'mean': self.lateness.mean,
+                'min': self.lateness.min,
+                'max': self.lateness.max,
+            },
+            'busy': {
+                'mean': self.busy.mean,
+                'max': self.busy.max,
+            },
+        }
+
+    def __str__(self):
+        return (
+            "%s[period=%.2f ms, ticks=%i, overruns=%i, missed=%i, "
+            "skipped=%i]\n  lateness=%s\n  period=%s\n  busy=%s" % (
+                self.__class__.__name__, self.period * 1000., self.n_ticks,
+                self.n_overruns, self.n_missed, self.n_skipped,
+                self.lateness, self.period_stats, self.busy))
@@ -24,10 +24,15 @@ import time
 import numpy
 
 #from . import calibrator
+from .. import body
 from .. import consts
+from .. import joystick
 from .. import leg
 from .. import log
 from .. import restriction
+from . import estop
+from .. import profiler
+from .. import scheduler
 from .. import signaler
 
 
@@ -67,6 +72,10 @@ class MultiLeg(signaler.Signaler):
         self.bodies = bodies
         #self.calibrator = calibrator.CalibrationRoutine()
         self.res = restriction.body.Body(legs)
+        # per stage, leg and signal timing (see report_stats)
+        self.profiler = profiler.default
+        # loop.ControlLoop calling update (if any), for report_stats
+        self.loop = None
         self.leg_index = sorted(legs)[0]
         self.leg = self.legs[self.leg_index]
         # if a foot gets within this distance of leg 0, throw an estop
@@ -84,16 +93,26 @@ class MultiLeg(signaler.Signaler):
         self.speed_step = 0.05
         self.speed_scalar_range = (0.1, 2.0)
         self.joy = joy
+        # filtered joystick axes (normalized to -1 to 1)
+        self.input = None
         if self.joy is not None:
             self.joy.on('buttons', self.on_buttons)
-            self.joy.on('axes', self.on_axes)
+            self.input = joystick.filters.InputFilter(
+                self.joy, mid=thumb_mid, scale=thumb_scale,
+                deadband=thumb_db)
+            self.input.on('axes', self.on_axes)
         self.deadman = False
 
         # stop all legs
         self.all_legs('set_estop', consts.ESTOP_DEFAULT)
 
         # monitor estop of all legs, broadcast when stopped
+        self.estop_channel = estop.EstopChannel(self.legs)
+        # leg reports (xyz, angles...) are coalesced to the latest of
+        # each leg and triggered once per update
+        self.events = signaler.EventQueue()
         for i in self.legs:
+            self.legs[i].event_queue = self.events
             self.legs[i].on('estop', lambda v, ln=i: self.on_leg_estop(v, ln))
             self.legs[i].on('xyz', lambda v, ln=i: self.on_leg_xyz(v, ln))
 
@@ -137,11 +156,12 @@ class MultiLeg(signaler.Signaler):
             self.res.set_speed(self.speed_scalar)
 
     def on_leg_estop(self, value, leg_number):
-        self.trigger('estop', value)
         if value:
-            for i in self.legs:
-                if i != leg_number and self.legs[i].estop == consts.ESTOP_OFF:
-                    self.legs[i].set_estop(value)
+            # stop the other legs before anything else
+            self.estop_channel.broadcast(
+                value, 'leg.%s' % leg_number, exclude=leg_number,
+                only_enabled=True, t=self.legs[leg_number].estop_time)
+        self.trigger('estop', value)
 
     def on_leg_xyz(self, xyz, leg_number):
         # find lowest 3 legs (most negative)
@@ -172,6 +192,43 @@ class MultiLeg(signaler.Signaler):
         else:
             self.all_legs('stop')
 
+    def _resolve_config(self, path):
+        # path is relative to the controller, e.g. controller.res.cfg.eps
+        ts = path.split('.')
+        if ts[0] == 'controller':
+            ts = ts[1:]
+        obj = self
+        while len(ts) > 1:
+            obj = getattr(obj, ts.pop(0))
+        return obj, ts[0]
+
+    def get_config(self, path):
+        obj, attr = self._resolve_config(path)
+        if isinstance(obj, dict):
+            return obj[attr]
+        return getattr(obj, attr)
+
+    def set_config(self, path, value):
+        """Set a config value converting value to the type of the old value
+
+        Returns the converted value
+        """
+        obj, attr = self._resolve_config(path)
+        if isinstance(obj, dict):
+            old_value = obj[attr]
+        else:
+            old_value = getattr(obj, attr)
+        if isinstance(old_value, bool) and not isinstance(value, bool):
+            value = str(value).lower() in ('1', 'true', 'yes', 'on')
+        else:
+            value = type(old_value)(value)
+        if isinstance(obj, dict):
+            obj[attr] = value
+        else:
+            setattr(obj, attr, value)
+        log.info({'set_config': (path, value)})
+        return value
+
     def all_legs(self, cmd, *args, **kwargs):
         log.info({"all_legs": (cmd, args, kwargs)})
         for leg in self.legs:
@@ -232,7 +289,11 @@ class MultiLeg(signaler.Signaler):
                 self.deadman = True
                 self.set_target()
             elif not buttons['deadman'] and self.deadman:
-                self.all_legs('set_estop', 1)
+                t = None
+                if self.joy is not None:
+                    t = self.joy.button_times.get('deadman', None)
+                self.estop_channel.broadcast(
+                    consts.ESTOP_SOFT, 'deadman', t=t)
                 self.all_legs('stop')
                 self.deadman = False
         if 'restrict_leg' in buttons and self.mode == 'body_restriction':
@@ -242,13 +303,36 @@ class MultiLeg(signaler.Signaler):
                 foot.restriction_modifier = buttons['restrict_leg']
         if buttons.get('report_stats', 0):
             print(self.leg.loop_time_stats)
+            print("Estop latency: %s" % (self.estop_channel.latency, ))
+            print(scheduler.default)
+            if self.loop is not None:
+                print(self.loop)
+            print("Swing targets: %s" % (self.res.swing_targets, ))
+            if self.input is not None:
+                print("Joystick input: %s" % (self.input, ))
+            print("Leg events: %s" % (self.events, ))
+            for i in sorted(self.legs):
+                print("  %s: %s" % (i, self.legs[i].event_stats()))
+            if self.profiler.enabled:
+                print(self.profiler)
+                log.info({'profile': self.profiler.stats()})
         if buttons.get('reset_stats', 0):
             print("Resetting loop time stats")
             self.leg.loop_time_stats.reset()
+            self.estop_channel.latency.reset()
+            scheduler.default.reset_stats()
+            if self.loop is not None:
+                self.loop.reset_stats()
+            self.res.swing_targets.reset_stats()
+            if self.input is not None:
+                self.input.reset_stats()
+            self.events.reset_stats()
+            for i in self.legs:
+                self.legs[i].reset_event_stats()
+            self.profiler.reset_stats()
 
     def on_axes(self, axes):
-        # check if target vector has changed > some amount
-        # if so, read and send new target
+        # filtered axes, only signaled when changed by > min_change
         if any((n in axes for n in ('x', 'y', 'z'))):
             if self.deadman:
                 self.set_target()
@@ -265,13 +349,8 @@ class MultiLeg(signaler.Signaler):
         #        az -= thumb_db
         #    else:
         #        az += thumb_db
-        xyz = []
-        for axis in ('x', 'y', 'z'):
-            jv = self.joy.axes.get(axis, thumb_mid) - thumb_mid
-            if abs(jv) < thumb_db:
-                jv = 0
-            jv = max(-1., min(1., jv / float(thumb_scale)))
-            xyz.append(jv)
+        # filtered, deadbanded and scaled (see joystick.filters)
+        xyz = [self.input.axes[axis] for axis in ('x', 'y', 'z')]
         #lx = self.joy.axes.get('x0', thumb_mid) - thumb_mid
         #ly = self.joy.axes.get('y0', thumb_mid) - thumb_mid
         #rx = self.joy.axes.get('x1', thumb_mid) - thumb_mid
@@ -386,9 +465,27 @@ class MultiLeg(signaler.Signaler):
                 restriction.body.BodyTarget((crx, cry), rs, dz))
 
     def update(self):
+        p = self.profiler
+        start = t = p.start()
         if self.joy is not None:
             self.joy.update()
-        self.all_legs('update')
+            self.input.update()
+        t = p.lap('stage.joystick', t)
+        # heartbeats, joystick reports and other periodic work
+        scheduler.default.run()
+        t = p.lap('stage.scheduler', t)
+        if p.enabled:
+            # time each leg
+            for ln in sorted(self.legs):
+                self.legs[ln].update()
+                t = p.lap('leg.%s' % ln, t)
+        else:
+            self.all_legs('update')
+        self.events.flush()
+        t = p.lap('stage.events', t)
+        # restriction and foot states from this tick's leg samples
+        self.res.step()
+        t = p.lap('stage.restriction', t)
         if self.mode in ('body_move', 'body_restriction'):
             if self.min_hip_override:
                 # check if override should be turned off
@@ -406,16 +503,56 @@ class MultiLeg(signaler.Signaler):
                 # check if any foot has x < self.min_hip_distance
                 all_stopped = True
                 trigger_estop = False
+                # time of the first report with a foot too close
+                t_detect = None
                 for l in self.legs:
                     if self.legs[l].estop == consts.ESTOP_OFF:  # enabled
                         all_stopped = False
-                    if self.legs[l].xyz.get('x', 0) < self.min_hip_distance:
+                    xyz = self.legs[l].xyz
+                    if xyz.get('x', 0) < self.min_hip_distance:
                         # set estop
                         trigger_estop = True
+                        tl = xyz.get('time', None)
+                        if tl is not None and (
+                                t_detect is None or tl < t_detect):
+                            t_detect = tl
                 # one of the legs is too close to the hip and not all
                 # are stopped so trigger an estop on all legs
                 if not all_stopped and trigger_estop:
+                    self.estop_channel.broadcast(
+                        consts.ESTOP_DEFAULT, 'foot_too_close', t=t_detect)
                     print("estopping because foot too close to hip")
-                    self.all_legs('set_estop', consts.ESTOP_DEFAULT)
+        t = p.lap('stage.hip_check', t)
         # update all body teensies
         [self.bodies[k].update() for k in self.bodies]
+        p.lap('stage.bodies', t)
+        p.stop('tick', start)
+
+
+def connect(leg_ports=None, body_ports=None):
+    """Connect to joystick, legs and bodies and return a MultiLeg
+
+    Ports default to found teensies (see leg.teensy.connect_to_teensies)
+    """
+    if joystick.ps3.available():
+        joy = joystick.ps3.PS3Joystick()
+        # read events in the background, reported by the scheduler
+        joy.start_update_thread()
+    elif joystick.steel.available():
+        joy = joystick.steel.SteelJoystick()
+        print("Connected to steel joystick")
+    else:
+        joy = None
+
+    legs = leg.teensy.connect_to_teensies(leg_ports)
+
+    if len(legs) == 0:
+        raise IOError("No teensies found")
+
+    lns = sorted(legs.keys())
+    print("Connected to legs: %s" % (lns, ))
+
+    bodies = body.connect_to_teensies(body_ports)
+    print("Connected to bodies: %s" % (sorted(bodies.keys())))
+
+    return MultiLeg(legs, joy, bodies)
@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+"""
+Emulate leg and body teensies on pseudo terminals
+
+Each emulated teensy opens a pty and speaks the comando protocol on the
+master side so leg.teensy.Teensy and body.TeensyBody can connect to the
+slave device (e.g. /dev/pts/5) without modification.
+
+Wire format (comando):
+    frame: [n][payload: n bytes][checksum: xor of payload bytes]
+    payload: [protocol index][protocol bytes]
+    command protocol: [command id][args packed little endian]
+
+Commands come from the same tables the host uses (leg.teensy.cmds and
+body.cmds). The emulator receives the command arguments and replies
+with (or streams) the command results. As with the firmware, trailing
+arguments can be omitted (for example 'calf_scale' with no arguments
+is a query).
+
+Leg joint motion is simulated with leg.teensy.FakeTeensy. A leg that does
+not receive a heartbeat for consts.HEARTBEAT_TIMEOUT seconds while
+enabled goes to ESTOP_HEARTBEAT (like the firmware).
+
+Start with: python -m stompy emulate [-n 1,2,3,4,5,6]
+"""
+
+import errno
+import fcntl
+import os
+import pty
+import select
+import struct
+import time
+import tty
+
+import numpy
+
+from . import body
+from . import consts
+from .leg import teensy
+
+
+PROTOCOL_COMMAND = 0
+PROTOCOL_TEXT = 1
+
+TYPES = {
+    'bool': '?',
+    'byte': 'B',
+    'char': 'b',
+    'int': 'i',
+    'int32': 'i',
+    'uint32': 'I',
+    'float': 'f',
+}
+
+
+def parse_command(spec):
+    """Parse 'name(arg,...)=result,...' to (name, args, results)"""
+    name, _, results = spec.partition('=')
+    args = ''
+    if '(' in name:
+        name, args = name.rstrip(')').split('(')
+
+    def split(s):
+        return [TYPES[t.strip()] for t in s.split(',') if t.strip()]
+
+    return name.strip(), split(args), split(results)
+
+
+def pack_values(types, values):
+    if len(values) > len(types):
+        raise ValueError(
+            "Too many values [%s] for types %s" % (values, types))
+    return struct.pack('<' + ''.join(types[:len(values)]), *values)
+
+
+def unpack_values(types, bs):
+    """Unpack as many values of types as are present in bs"""
+    values = []
+    o = 0
+    for t in types:
+        n = struct.calcsize('<' + t)
+        if o + n > len(bs):
+            break
+        values.append(struct.unpack('<' + t, bytes(bs[o:o + n]))[0])
+        o += n
+    return values
+
+
+def checksum(bs):
+    cs = 0
+    for b in bytearray(bs):
+        cs ^= b
+    return cs
+
+
+def build_frame(protocol, bs):
+    payload = bytearray([protocol]) + bytearray(bs)
+    if len(payload) > 255:
+        raise ValueError("Message too long: %s" % len(payload))
+    return bytes(
+        bytearray([len(payload)]) + payload + bytearray([checksum(payload)]))
+
+
+class EmulatedTeensy(object):
+    """A command table served on the master side of a pty
+
+    Received commands call on_<command name>(*args) if defined.
+    """
+    def __init__(self, cmds):
+        self.master, self._slave = pty.openpty()
+        # no echo or line processing, data is binary
+        tty.setraw(self._slave)
+        flags = fcntl.fcntl(self.master, fcntl.F_GETFL)
+        fcntl.fcntl(self.master, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.port = os.ttyname(self._slave)
+        self.commands = {}
+        self.command_ids = {}
+        for cid in cmds:
+            name, args, results = parse_command(cmds[cid])
+            self.commands[cid] = (name, args, results)
+            self.command_ids[name] = cid
+        self._buffer = bytearray()
+        self.n_received = 0
+        self.n_sent = 0
+        self.n_dropped = 0
+        self.n_invalid = 0
+
+    def fileno(self):
+        return self.master
+
+    def _write(self, data):
+        try:
+            os.write(self.master, data)
+            self.n_sent += 1
+        except OSError as e:
+            # host is not reading (or not connected), drop like serial
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EIO):
+                raise
+            self.n_dropped += 1
+
+    def send(self, name, *values):
+        """Send command results"""
+        cid = self.command_ids[name]
+        bs = bytearray([cid]) + bytearray(
+            pack_values(self.commands[cid][2], values))
+        self._write(build_frame(PROTOCOL_COMMAND, bs))
+
+    def send_text(self, text):
+        self._write(build_frame(PROTOCOL_TEXT, text.encode('ascii')))
+
+    def receive_command(self, bs):
+        cid = bs[0]
+        if cid not in self.commands:
+            self.send_text("Unknown command: %s" % cid)
+            return
+        name, args, _ = self.commands[cid]
+        self.n_received += 1
+        f = getattr(self, 'on_' + name, None)
+        if f is not None:
+            f(*unpack_values(args, bs[1:]))
+
+    def receive_frame(self, payload):
+        if len(payload) < 2:
+            return
+        if payload[0] == PROTOCOL_COMMAND:
+            self.receive_command(payload[1:])
+
+    def read(self):
+        """Read and handle all available frames, never blocks"""
+        try:
+            data = os.read(self.master, 4096)
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EIO):
+                raise
+            return
+        self._buffer.extend(data)
+        buf = self._buffer
+        while len(buf):
+            n = buf[0]
+            if len(buf) < n + 2:
+                break
+            payload = buf[1:n + 1]
+            if checksum(payload) != buf[n + 1]:
+                # resync on the next byte
+                self.n_invalid += 1
+                del buf[0]
+                continue
+            del buf[:n + 2]
+            self.receive_frame(payload)
+
+    def update(self, t):
+        pass
+
+    def close(self):
+        os.close(self.master)
+        os.close(self._slave)
+
+
+class LegEmulator(EmulatedTeensy):
+    def __init__(
+            self, leg_number, report_period=0.01,
+            heartbeat_timeout=consts.HEARTBEAT_TIMEOUT):
+        super(LegEmulator, self).__init__(teensy.cmds)
+        self.leg = teensy.FakeTeensy(leg_number)
+        self.leg.estop = consts.ESTOP_DEFAULT
+        # report estops raised by the simulation (limits, heartbeat)
+        self.leg.on('estop', lambda v: self.send('estop', v))
+        self.report_period = report_period
+        self.heartbeat_timeout = heartbeat_timeout
+        self.reports = {
+            'report_adc': True,
+            'report_pid': True,
+            'report_pwm': True,
+            'report_xyz': True,
+            'report_angles': True,
+            'report_loop_time': True,
+        }
+        self.pid_enabled = True
+        self.pid_configs = {}
+        self.pwm_limits = {}
+        self.adc_limits = {}
+        self.following_error_thresholds = {}
+        self.calf_scale = (1., 0.)
+        self.dither = (0, 0)
+        t = time.time()
+        self.last_heartbeat = t
+        self.last_report = t
+        self.last_update = t
+        self.loop_time = 0
+
+    @property
+    def leg_number(self):
+        return self.leg.leg_number
+
+    def on_heartbeat(self):
+        self.last_heartbeat = time.time()
+
+    def on_estop(self, value=None):
+        if value is not None:
+            if value == consts.ESTOP_OFF:
+                # heartbeat timer restarts on enable
+                self.last_heartbeat = time.time()
+            self.leg.estop = value
+        self.send('estop', self.leg.estop)
+
+    def on_pwm(self, *values):
+        if len(values) == 3:
+            self.leg.pwm.update(dict(zip(('hip', 'thigh', 'knee'), values)))
+        self.send(
+            'pwm', self.leg.pwm['hip'], self.leg.pwm['thigh'],
+            self.leg.pwm['knee'])
+
+    def on_plan(self, *values):
+        try:
+            self.leg._new_plan(list(values))
+        except (NotImplementedError, ValueError, UnboundLocalError) as e:
+            self.send_text("Plan not followed: %s" % (e, ))
+
+    def on_enable_pid(self, value=None):
+        if value is not None:
+            self.pid_enabled = bool(value)
+        self.send('enable_pid', self.pid_enabled)
+
+    def _indexed_config(self, name, store, default, index, values):
+        if len(values) == len(default):
+            store[index] = tuple(values)
+        self.send(name, index, *store.get(index, default))
+
+    def on_pid_config(self, index, *values):
+        self._indexed_config(
+            'pid_config', self.pid_configs, (0., 0., 0., 0., 0.),
+            index, values)
+
+    def on_pwm_limits(self, index, *values):
+        self._indexed_config(
+            'pwm_limits', self.pwm_limits, (0, 0, 0, 0), index, values)
+
+    def on_adc_limits(self, index, *values):
+        self._indexed_config(
+            'adc_limits', self.adc_limits, (0., 0.), index, values)
+
+    def on_following_error_threshold(self, index, *values):
+        self._indexed_config(
+            'following_error_threshold', self.following_error_thresholds,
+            (0., ), index, values)
+
+    def on_leg_number(self, value=None):
+        if value is not None:
+            self.leg.leg_number = value
+        self.send('leg_number', self.leg.leg_number)
+
+    def on_calf_scale(self, *values):
+        if len(values) == 2:
+            self.calf_scale = tuple(values)
+        self.send('calf_scale', *self.calf_scale)
+
+    def on_report_time(self, value=None):
+        if value is not None:
+            self.report_period = value / 1000.
+        self.send('report_time', int(self.report_period * 1000))
+
+    def on_pid_seed_time(self):
+        self.send('pid_seed_time', consts.PLAN_TICK)
+
+    def on_dither(self, *values):
+        if len(values) == 2:
+            self.dither = tuple(values)
+        self.send('dither', *self.dither)
+
+    def _on_report(self, name, values):
+        if len(values):
+            self.reports[name] = bool(values[0])
+
+    def receive_command(self, bs):
+        name = self.commands.get(bs[0], ('', ))[0]
+        if name in self.reports:
+            self.n_received += 1
+            self._on_report(
+                name, unpack_values(self.commands[bs[0]][1], bs[1:]))
+            return
+        super(LegEmulator, self).receive_command(bs)
+
+    def send_reports(self):
+        leg = self.leg
+        r = self.reports
+        if r['report_adc']:
+            self.send('report_adc', *[
+                int(max(0, leg.adc[k]))
+                for k in ('hip', 'thigh', 'knee', 'calf')])
+        if r['report_pid']:
+            vs = []
+            for k in ('output', 'set_point', 'error'):
+                vs.extend([leg.pid[k][j] for j in ('hip', 'thigh', 'knee')])
+            self.send('report_pid', *vs)
+        if r['report_pwm']:
+            self.send('report_pwm', *[
+                int(leg.pwm[j]) for j in ('hip', 'thigh', 'knee')])
+        if r['report_xyz']:
+            self.send(
+                'report_xyz', leg.xyz['x'], leg.xyz['y'], leg.xyz['z'])
+        if r['report_angles']:
+            a = leg.angles
+            self.send(
+                'report_angles', a['hip'], a['thigh'], a['knee'], a['calf'],
+                True)
+        if r['report_loop_time']:
+            self.send('report_loop_time', self.loop_time)
+
+    def update(self, t):
+        if (
+                self.leg.estop == consts.ESTOP_OFF and
+                (t - self.last_heartbeat) > self.heartbeat_timeout):
+            self.leg.set_estop(consts.ESTOP_HEARTBEAT)
+        dt = t - self.last_update
+        self.last_update = t
+        self.leg._follow_plan(t, dt)
+        self.loop_time = int((time.time() - t) * 1E6)
+        if self.report_period > 0 and (
+                t - self.last_report) >= self.report_period:
+            self.last_report = t
+            self.send_reports()
+
+
+class BodyEmulator(EmulatedTeensy):
+    """Emulate a body teensy, sensors report at the host set period"""
+    def __init__(self, name='imu'):
+        super(BodyEmulator, self).__init__(body.cmds[name])
+        self.name = name
+        self.name_index = [
+            k for k in body.names if body.names[k] == name][0]
+        # sensor name: [period (s), last report time]
+        self.sensors = {}
+        self.actuators = {}
+        for cid in self.commands:
+            n, args, results = self.commands[cid]
+            if args == ['B'] and len(results) and all(
+                    r == 'f' for r in results):
+                self.sensors[n] = [0., 0.]
+            elif len(args) == 1 and args == results:
+                self.actuators[n] = 0
+
+    def on_name(self):
+        self.send('name', self.name_index)
+
+    def receive_command(self, bs):
+        name = self.commands.get(bs[0], ('', ))[0]
+        if name in self.sensors or name in self.actuators:
+            self.n_received += 1
+            values = unpack_values(self.commands[bs[0]][1], bs[1:])
+            if name in self.sensors:
+                if len(values):
+                    self.sensors[name][0] = values[0] / 1000.
+                else:
+                    self.send(name, *self.sense(name, time.time()))
+            else:
+                if len(values):
+                    self.actuators[name] = values[0]
+                self.send(name, self.actuators[name])
+            return
+        super(BodyEmulator, self).receive_command(bs)
+
+    def sense(self, name, t):
+        if name == 'heading':
+            return (
+                numpy.sin(t * 0.5), numpy.cos(t * 0.3),
+                (t * 2.) % 360.)
+        if name == 'engine_rpm':
+            return (1800. + 10. * numpy.sin(t), )
+        if name.endswith('pressure'):
+            return (1200. + 50. * numpy.sin(t * 2.), )
+        if name.endswith('temp'):
+            return (120. + numpy.sin(t * 0.1), )
+        return (numpy.sin(t), )
+
+    def update(self, t):
+        for name in self.sensors:
+            period, last = self.sensors[name]
+            if period > 0 and (t - last) >= period:
+                self.sensors[name][1] = t
+                self.send(name, *self.sense(name, t))
+
+
+class Emulator(object):
+    """Serve several emulated teensies from one process"""
+    def __init__(
+            self, leg_numbers=None, body_names=None, report_period=0.01):
+        if leg_numbers is None:
+            leg_numbers = [1, 2, 3, 4, 5, 6]
+        if body_names is None:
+            body_names = ['imu']
+        if consts.PLAN_TICK is None:
+            consts.PLAN_TICK = 0.025
+        self.legs = [
+            LegEmulator(ln, report_period=report_period)
+            for ln in leg_numbers]
+        self.bodies = [BodyEmulator(n) for n in body_names]
+        self.devices = self.legs + self.bodies
+
+    @property
+    def leg_ports(self):
+        return [l.port for l in self.legs]
+
+    @property
+    def body_ports(self):
+        return [b.port for b in self.bodies]
+
+    def update(self, timeout=0.001):
+        r, _, _ = select.select(self.devices, [], [], timeout)
+        for d in r:
+            d.read()
+        t = time.time()
+        for d in self.devices:
+            d.update(t)
+
+    def run(self):
+        try:
+            while True:
+                self.update()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        for d in self.devices:
+            d.close()
+
+
+def run(leg_numbers=None, body_names=None, report_period=0.01):
+    e = Emulator(leg_numbers, body_names, report_period)
+    for l in e.legs:
+        print("Leg %s on %s" % (l.leg_number, l.port))
+    for b in e.bodies:
+        print("Body %s on %s" % (b.name, b.port))
+    print(
+        "Connect with: python -m stompy run -l %s -b %s" % (
+            ','.join(e.leg_ports), ','.join(e.body_ports)))
+    e.run()
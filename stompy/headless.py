@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+Run the controller without a ui (python -m stompy run)
+
+No gui toolkit is loaded. MultiLeg is updated by a fixed rate control
+loop (see controllers.loop), telemetry is published to shared memory
+(for python -m stompy viewer) and optionally streamed over udp, and a
+status summary is logged (and printed) every status_period seconds.
+
+Runner can also run the loop in its own thread (as the ui does) so
+nothing else (like widget updates) can delay controller updates.
+"""
+
+import threading
+import time
+
+from . import controllers
+from . import log
+from . import scheduler
+from . import telemetry
+
+
+def status(controller, loop=None):
+    """Summary of the controller state for logging"""
+    c = controller
+    s = {
+        'time': time.time(),
+        'mode': c.mode,
+        'deadman': c.deadman,
+        'halted': c.res.halted,
+        'speed': c.speed_scalar,
+        'estop': {ln: c.legs[ln].estop for ln in c.legs},
+        'states': {ln: c.res.feet[ln].state for ln in c.res.feet},
+        'restriction': {
+            ln: (
+                None if c.res.feet[ln].restriction is None else
+                c.res.feet[ln].restriction['r'])
+            for ln in c.res.feet},
+    }
+    if loop is not None:
+        s['loop'] = loop.stats()
+    return s
+
+
+def format_status(s):
+    line = "mode: %s deadman: %s halted: %s estop: %s states: %s" % (
+        s['mode'], s['deadman'], s['halted'],
+        ','.join([str(s['estop'][ln]) for ln in sorted(s['estop'])]),
+        ','.join([str(s['states'][ln]) for ln in sorted(s['states'])]))
+    if 'loop' in s:
+        l = s['loop']
+        line += " loop: %i ticks %i overruns %.2f ms late" % (
+            l['ticks'], l['overruns'], l['lateness']['mean'] * 1000.)
+    return line
+
+
+class Runner(object):
+    """Control loop with telemetry for a connected controller
+
+    address: udp telemetry host:port (None to not stream)
+    rate: udp telemetry rate (Hz)
+    loop_rate: control loop rate (Hz, see controllers.loop.ControlLoop)
+    status_period: seconds between status logs (None to not log)
+    """
+    def __init__(
+            self, controller, address=None, rate=10., loop_rate=100.,
+            status_period=5.):
+        c = controller
+        self.controller = c
+        self.bus = telemetry.shm.Publisher(c)
+        print("Publishing telemetry to %s" % self.bus.ring.filename)
+        self.stream = None
+        if address is not None:
+            self.stream = telemetry.udp.Publisher(c, address, rate)
+            print("Streaming telemetry to %s:%s" % self.stream.address)
+        self.loop = controllers.loop.ControlLoop(c.update, loop_rate)
+        c.loop = self.loop
+        # telemetry is skipped when the loop is overloaded
+        self.loop.add(self.bus.update)
+        if self.stream is not None:
+            self.loop.add(self.stream.update)
+        print("Control loop period: %.2f ms" % (self.loop.period * 1000., ))
+        self.status_task = None
+        if status_period is not None:
+            self.status_task = scheduler.default.every(
+                status_period, self.report_status, name='status',
+                priority=scheduler.PRIORITY_LOW)
+        self.thread = None
+
+    def report_status(self):
+        s = status(self.controller, self.loop)
+        log.info({'status': s})
+        print(format_status(s))
+
+    def run(self):
+        """Run the loop (in this thread) until stop is called"""
+        self.loop.run()
+
+    def start(self):
+        """Run the loop in a new (daemon) thread"""
+        self.thread = threading.Thread(target=self.run, name='control_loop')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=1.):
+        self.loop.stop()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def close(self):
+        self.stop()
+        if self.status_task is not None:
+            scheduler.default.cancel(self.status_task)
+            self.status_task = None
+        print(self.loop)
+        self.bus.close()
+        if self.stream is not None:
+            self.stream.close()
+
+
+def run(
+        leg_ports=None, body_ports=None, address=None, rate=10.,
+        loop_rate=100., status_period=5.):
+    """Connect and run the controller until interrupted (see Runner)"""
+    c = controllers.multileg.connect(leg_ports, body_ports)
+    runner = Runner(c, address, rate, loop_rate, status_period)
+    try:
+        runner.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runner.close()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
+from . import filters
 from . import ps3
 from . import steel
 
-__all__ = ['ps3', 'steel']
+__all__ = ['filters', 'ps3', 'steel']
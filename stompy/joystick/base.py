@@ -1,17 +1,27 @@
 #!/usr/bin/env python
 
+import threading
 import time
 
+from .. import scheduler
 from .. import signaler
 
 
 class Joystick(signaler.Signaler):
     def __init__(self, report_period=0.1):
         super(Joystick, self).__init__()
-        self.report_period = 0.1
         self.last_report = time.time()
+        # changes are collected and reported every report_period
+        # reports carry the deadman so they are never deferred
+        self.report_task = scheduler.default.every(
+            report_period, self._check_report, name='joystick_report',
+            priority=scheduler.PRIORITY_HEARTBEAT, weak=True)
         self.buttons = {}
+        # time each button last changed (for estop latency)
+        self.button_times = {}
         self.axes = {}
+        # held while reporting or collecting changes (from any thread)
+        self._lock = threading.Lock()
         self._reset_updates()
         self.mapping = {
             'buttons': {},
@@ -23,17 +33,25 @@ class Joystick(signaler.Signaler):
             'buttons': {},
             'axes': {}}
 
+    @property
+    def report_period(self):
+        return self.report_task.period
+
+    @report_period.setter
+    def report_period(self, period):
+        self.report_task.period = period
+
     def _check_report(self):
-        t = time.time()
-        if (t - self.last_report) > self.report_period:
-            for k in self._update:
-                if len(self._update[k]):
-                    # trigger events:
-                    #  'buttons', dict of buttons changed
-                    #  'axes', dict of axes updated
-                    self.trigger(k, self._update[k])
-            self.last_report = t
+        with self._lock:
+            update = self._update
             self._reset_updates()
+        for k in update:
+            if len(update[k]):
+                # trigger events:
+                #  'buttons', dict of buttons changed
+                #  'axes', dict of axes updated
+                self.trigger(k, update[k])
+        self.last_report = time.time()
 
     def _report_axis(self, axis, value):
         self._update['axes'][axis] = value
@@ -45,16 +63,22 @@ class Joystick(signaler.Signaler):
                 value = c(value)
             self._update['axes'][k] = value
             self.axes[k] = value
-        self._check_report()
 
-    def _report_button(self, button, value):
+    def _report_button(self, button, value, t=None):
+        if t is None:
+            t = time.time()
         self._update['buttons'][button] = value
         self.buttons[button] = value
+        self.button_times[button] = t
         if button in self.mapping['buttons']:
             k = self.mapping['buttons'][button]
             self._update['buttons'][k] = value
             self.buttons[k] = value
-        self._check_report()
+            self.button_times[k] = t
 
     def update(self):
-        self._check_report()
+        # without a running scheduler changes are reported here
+        if (
+                not scheduler.default.running(self.report_period) and
+                (time.time() - self.last_report) > self.report_period):
+            self._check_report()
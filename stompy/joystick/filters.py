@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Joystick axis filtering
+
+Raw axis reports (0 - 255, centered at mid) are low-pass filtered (time
+constant tau), passed through a deadband with hysteresis (an axis
+becomes active above deadband + hysteresis and returns to 0 below
+deadband - hysteresis) and scaled to -1 to 1.
+
+Filtered axes are only signaled ('axes', dict of all axes) when one
+changes by more than min_change and at most once per min_interval.
+An axis returning to 0 is signaled right away so stopping is never
+delayed.
+
+update must be called periodically (every control loop tick) so the
+filtered values settle between joystick reports.
+"""
+
+import math
+import time
+
+from .. import signaler
+
+
+class AxisFilter(object):
+    def __init__(self, cfg):
+        """cfg: InputFilter with the filter parameters"""
+        self.cfg = cfg
+        self.raw = cfg.mid
+        self.filtered = cfg.mid
+        self.active = False
+        self.value = 0.
+        self.t = None
+
+    def step(self, t):
+        """Advance the filter to time t, returns the scaled value"""
+        cfg = self.cfg
+        if self.t is None or cfg.tau <= 0:
+            self.filtered = self.raw
+        else:
+            a = 1. - math.exp(-max(0., t - self.t) / cfg.tau)
+            self.filtered += a * (self.raw - self.filtered)
+        self.t = t
+        d = self.filtered - cfg.mid
+        if self.active:
+            self.active = abs(d) > (cfg.deadband - cfg.hysteresis)
+        else:
+            self.active = abs(d) > (cfg.deadband + cfg.hysteresis)
+        if self.active:
+            self.value = max(-1., min(1., d / float(cfg.scale)))
+        else:
+            self.value = 0.
+        return self.value
+
+
+class InputFilter(signaler.Signaler):
+    def __init__(
+            self, joystick, axes=('x', 'y', 'z'), mid=130, scale=125,
+            deadband=10, hysteresis=3, tau=0.05, min_change=0.02,
+            min_interval=0.1):
+        super(InputFilter, self).__init__()
+        self.joystick = joystick
+        self.mid = mid
+        self.scale = scale
+        self.deadband = deadband
+        self.hysteresis = hysteresis
+        self.tau = tau
+        self.min_change = min_change
+        self.min_interval = min_interval
+        self.filters = {a: AxisFilter(self) for a in axes}
+        # last signaled values
+        self.axes = {a: 0. for a in axes}
+        self.last_signal_time = None
+        self.reset_stats()
+        self.joystick.on('axes', self.on_axes)
+
+    def reset_stats(self):
+        self.n_reports = 0
+        self.n_signals = 0
+
+    def on_axes(self, axes):
+        for a in axes:
+            if a in self.filters:
+                self.filters[a].raw = axes[a]
+                self.n_reports += 1
+
+    def update(self, t=None):
+        """Step the filters, signal 'axes' if they changed enough"""
+        if t is None:
+            t = time.time()
+        values = {a: self.filters[a].step(t) for a in self.filters}
+        changed = [a for a in values if values[a] != self.axes[a]]
+        if len(changed) == 0:
+            return
+        if not any([values[a] == 0. for a in changed]):
+            if max([
+                    abs(values[a] - self.axes[a])
+                    for a in changed]) < self.min_change:
+                return
+            if (
+                    self.last_signal_time is not None and
+                    (t - self.last_signal_time) < self.min_interval):
+                return
+        self.axes = values
+        self.last_signal_time = t
+        self.n_signals += 1
+        self.trigger('axes', dict(values))
+
+    def __str__(self):
+        return "%s[reports=%i, signals=%i, axes=%s]" % (
+            self.__class__.__name__, self.n_reports, self.n_signals,
+            self.axes)
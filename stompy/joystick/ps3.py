@@ -1,15 +1,18 @@
 #!/usr/bin/env python
 
+import errno
+import logging
 import os
 import select
 import struct
 import threading
-import time
 
 from . import base
 from .. import signaler
 
 
+logger = logging.getLogger(__name__)
+
 DEFAULT_FN = '/dev/input/by-id/usb-Sony_' \
     'PLAYSTATION_R_3_Controller-event-joystick'
 #DEFAULT_FN = '/dev/input/by-id/usb-SHANWAN_' \
@@ -146,8 +149,23 @@ default_mapping = {
     },
 }
 
-POLL_TIMEOUT = 0.001
-THREAD_SLEEP = 0.01
+# reader thread select timeout, only used to check for stop
+THREAD_TIMEOUT = 0.1
+# axis value reported (for all axes) when the reader thread fails
+AXIS_CENTER = 128
+# max events per read
+READ_EVENTS = 64
+
+EVENT = struct.Struct(FMT)
+
+
+def decode_events(data):
+    """(t_sec, t_usec, ev_type, code, value) for each event in data"""
+    n = len(data) // NB
+    if hasattr(EVENT, 'iter_unpack'):
+        return EVENT.iter_unpack(data[:n * NB])
+    # python 2
+    return [EVENT.unpack_from(data, i * NB) for i in range(n)]
 
 
 def available(fn=None):
@@ -158,6 +176,19 @@ def available(fn=None):
 
 #class PS3Joystick(signaler.Signaler):
 class PS3Joystick(base.Joystick):
+    """Evdev joystick
+
+    Events are read in bulk (non-blocking) either by update or, once
+    start_update_thread is called, by a background thread so the
+    control loop never waits on the device. Axis and button values
+    are coalesced and reported once per report_period (see
+    base.Joystick).
+
+    If the reader thread fails (e.g. the joystick is unplugged) the
+    error is logged, all buttons are reported released (releasing the
+    deadman estops the legs) and axes centered, and the device is
+    closed.
+    """
     def __init__(self, fn=None):
         super(PS3Joystick, self).__init__()
         self.mapping = default_mapping
@@ -165,11 +196,46 @@ class PS3Joystick(base.Joystick):
         if fn is None:
             fn = DEFAULT_FN
         self.fn = fn
-        self.f = open(fn, 'rb+')
+        self.fd = None
+        self.open()
+        self._buffer = b''
+        self._update_thread = None
+        self._stop_thread = False
+        self.n_events = 0
+        self.n_reads = 0
         #self.keys = {}
         #self.axes = {}
         #self.report_ev_types = set((0x01, 0x03))
 
+    def open(self):
+        if self.fd is None:
+            self.fd = os.open(self.fn, os.O_RDWR | os.O_NONBLOCK)
+
+    def close(self):
+        if self.fd is None:
+            return
+        fd, self.fd = self.fd, None
+        try:
+            os.close(fd)
+        except OSError as e:
+            # the device may already be gone
+            logger.warning("Joystick %s close failed: %s" % (self.fn, e))
+
+    def release_all(self):
+        """Report all buttons released and all axes centered"""
+        mapped_axes = set([
+            k[0] if isinstance(k, tuple) else k
+            for k in self.mapping['axes'].values()])
+        with self._lock:
+            for button in list(self.buttons):
+                if button in self.mapping['buttons'].values():
+                    continue
+                self._report_button(button, 0)
+            for axis in list(self.axes):
+                if axis in mapped_axes:
+                    continue
+                self._report_axis(axis, AXIS_CENTER)
+
     def lookup_name(self, code, key, default='unknown'):
         if self.codes is None:
             # check against possible codes
@@ -186,55 +252,78 @@ class PS3Joystick(base.Joystick):
             return default
         return self.codes[key].get(code, default)
 
-    def read_event(self):
-        t_sec, t_usec, ev_type, code, value = struct.unpack(
-            FMT, self.f.read(NB))
-
-        e = {
-            'ev_type': ev_type,
-            'code': code,
-            'time': t_sec + t_usec / 1000000.,
-            'value': value}
+    def handle_event(self, ev_type, code, value, t=None):
         if ev_type == 0x01:  # keys
-            e['type'] = 'button'
-            e['name'] = self.lookup_name(code, 'keys')
-            self._report_button(e['name'], value)
-            #self.keys[e['name']] = value
+            self._report_button(self.lookup_name(code, 'keys'), value, t)
         elif ev_type == 0x03:  # axes
-            e['type'] = 'axis'
-            e['name'] = self.lookup_name(code, 'abs_axes')
-            self._report_axis(e['name'], value)
-            #self.axes[e['name']] = value
-        return e
-
-    def update(self, max_time=0.005):
-        # read multiple events per update
-        st = time.time()
-        evs = []
-        while (time.time() - st) < max_time:
-            rf, _, _ = select.select([self.f, ], [], [], POLL_TIMEOUT)
-            if len(rf) == 0:
+            self._report_axis(self.lookup_name(code, 'abs_axes'), value)
+
+    def read_events(self):
+        """Read and handle all available events, returns the number read"""
+        n = 0
+        if self.fd is None:
+            return n
+        while True:
+            try:
+                data = os.read(self.fd, NB * READ_EVENTS)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if len(data) == 0:
                 break
-            e = self.read_event()
-            #if e['ev_type'] in self.report_ev_types:
-            #    evs.append(e)
-            #    self.trigger('event', e)
-            #    if 'type' in e:
-            #        self.trigger(e['type'], e)
+            self.n_reads += 1
+            data = self._buffer + data
+            nb = (len(data) // NB) * NB
+            self._buffer = data[nb:]
+            with self._lock:
+                for (ts, tus, ev_type, code, value) in decode_events(data):
+                    # event time (CLOCK_REALTIME, same as time.time)
+                    self.handle_event(
+                        ev_type, code, value, ts + tus * 1E-6)
+                    n += 1
+            if len(data) < NB * READ_EVENTS:
+                break
+        self.n_events += n
+        return n
+
+    def update(self, max_time=None):
+        # the update thread (if running) reads events
+        if self._update_thread is None:
+            self.read_events()
         super(PS3Joystick, self).update()
-        return evs
 
     def _update_thread_function(self):
-        while True:
-            self.update(poll=True)
-            time.sleep(THREAD_SLEEP)
+        try:
+            while not self._stop_thread:
+                rf, _, _ = select.select(
+                    [self.fd, ], [], [], THREAD_TIMEOUT)
+                if len(rf):
+                    self.read_events()
+        except Exception:
+            logger.exception(
+                "Joystick %s read failed, releasing all buttons" % self.fn)
+            self.release_all()
+        finally:
+            self.close()
 
     def start_update_thread(self):
+        if self._update_thread is not None:
+            return
+        self.open()
+        self._stop_thread = False
         self._update_thread = threading.Thread(
             target=self._update_thread_function)
         self._update_thread.daemon = True
         self._update_thread.start()
 
+    def stop_update_thread(self):
+        if self._update_thread is None:
+            return
+        self._stop_thread = True
+        self._update_thread.join()
+        self._update_thread = None
+
 
 def test_read_axes():
     ignore = {
@@ -2,5 +2,6 @@
 
 from . import body
 from . import leg
+from . import reach
 
-__all__ = ['body', 'leg']
+__all__ = ['body', 'leg', 'reach']
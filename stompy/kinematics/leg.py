@@ -29,10 +29,12 @@ def x_with_vertical_calf(z):
 
 
 def angles_to_calf_angle(hip, thigh, knee):
-    _, p1, p2 = angles_to_points(hip, thigh, knee)
-    dx = p2[0] - p1[0]
+    # angle of knee link from vertical (see angles_to_points)
+    # works on scalars or arrays
+    a = geometry.KNEE_REST_ANGLE - knee - thigh
+    dx = numpy.cos(a) * numpy.cos(hip)
     # invert dz to fix quadrant
-    dz = -(p2[2] - p1[2])
+    dz = -numpy.sin(a)
     return numpy.arctan2(dx, dz)
 
 
@@ -145,44 +147,56 @@ def circle_point_at_y(c, y):
     return dx + cx, cx - dx
 
 
-limit_circles_2d = {}
-# thigh_min: blue: thigh min, knee sweep
-#  radius = knee_length
-#  center = computed thigh min pt[1]
-# thigh_max: green: thigh max, knee sweep
-#  radius = knee_length
-#  center = computed thigh max pt[1]
-# knee_min: orange: knee min, thigh sweep
-#  radius = computed hip pt[0] to angle pt[2]
-#  center = hip_length in x
-# knee_max: red: knee max, thigh sweep
-#  radius = computed hip pt[0] to angle pt[2]
-#  center = hip_length in x
-lpts = numpy.array(list(
-    angles_to_points(0, geometry.THIGH_MIN_ANGLE, geometry.KNEE_MIN_ANGLE)))
-kmax_radius = numpy.linalg.norm(lpts[2] - lpts[0])
-cx, _, cy = lpts[1]
-limit_circles_2d['thigh_min'] = {
-    'center': (cx, cy), 'radius': geometry.KNEE_LENGTH}
-lpts = numpy.array(list(
-    angles_to_points(0, geometry.THIGH_MAX_ANGLE, geometry.KNEE_MAX_ANGLE)))
-kmin_radius = numpy.linalg.norm(lpts[2] - lpts[0])
-cx, _, cy = lpts[1]
-limit_circles_2d['thigh_max'] = {
-    'center': (cx, cy), 'radius': geometry.KNEE_LENGTH}
-cx, cy = geometry.HIP_LENGTH, 0.
-limit_circles_2d['knee_min'] = {
-    'center': (cx, cy), 'radius': kmin_radius}
-limit_circles_2d['knee_max'] = {
-    'center': (cx, cy), 'radius': kmax_radius}
-z_min = (
-    limit_circles_2d['thigh_max']['center'][1] -
-    limit_circles_2d['thigh_max']['radius'])
-z_max = max(
-    circle_intersection(
-        limit_circles_2d['knee_max'], limit_circles_2d['thigh_min']),
-    key=lambda i: i[0])[1]
-del cx, cy, lpts, kmin_radius, kmax_radius
+# computed on first use (see compute_limit_circles)
+limit_circles_2d = None
+z_min = None
+z_max = None
+
+
+def compute_limit_circles():
+    """Compute limit_circles_2d, z_min and z_max (once), return
+    limit_circles_2d"""
+    global limit_circles_2d, z_min, z_max
+    if limit_circles_2d is not None:
+        return limit_circles_2d
+    circles = {}
+    # thigh_min: blue: thigh min, knee sweep
+    #  radius = knee_length
+    #  center = computed thigh min pt[1]
+    # thigh_max: green: thigh max, knee sweep
+    #  radius = knee_length
+    #  center = computed thigh max pt[1]
+    # knee_min: orange: knee min, thigh sweep
+    #  radius = computed hip pt[0] to angle pt[2]
+    #  center = hip_length in x
+    # knee_max: red: knee max, thigh sweep
+    #  radius = computed hip pt[0] to angle pt[2]
+    #  center = hip_length in x
+    lpts = numpy.array(list(angles_to_points(
+        0, geometry.THIGH_MIN_ANGLE, geometry.KNEE_MIN_ANGLE)))
+    kmax_radius = numpy.linalg.norm(lpts[2] - lpts[0])
+    cx, _, cy = lpts[1]
+    circles['thigh_min'] = {
+        'center': (cx, cy), 'radius': geometry.KNEE_LENGTH}
+    lpts = numpy.array(list(angles_to_points(
+        0, geometry.THIGH_MAX_ANGLE, geometry.KNEE_MAX_ANGLE)))
+    kmin_radius = numpy.linalg.norm(lpts[2] - lpts[0])
+    cx, _, cy = lpts[1]
+    circles['thigh_max'] = {
+        'center': (cx, cy), 'radius': geometry.KNEE_LENGTH}
+    cx, cy = geometry.HIP_LENGTH, 0.
+    circles['knee_min'] = {
+        'center': (cx, cy), 'radius': kmin_radius}
+    circles['knee_max'] = {
+        'center': (cx, cy), 'radius': kmax_radius}
+    z_min = (
+        circles['thigh_max']['center'][1] -
+        circles['thigh_max']['radius'])
+    z_max = max(
+        circle_intersection(circles['knee_max'], circles['thigh_min']),
+        key=lambda i: i[0])[1]
+    limit_circles_2d = circles
+    return limit_circles_2d
 
 
 def limits_at_z_2d(z):
@@ -200,22 +214,23 @@ def limits_at_z_2d(z):
     - if outside thigh_min and knee_min
      find point on thigh_max at z (with smallest x)
     """
+    circles = compute_limit_circles()
     if z > z_max or z < z_min:
         return None, None
     # right point
     if z > 0:
         # use right of knee_max
-        r = max(circle_point_at_y(limit_circles_2d['knee_max'], z))
+        r = max(circle_point_at_y(circles['knee_max'], z))
     else:
         # use min of rights of knee_max and thigh_max
         r = min([
-            max(circle_point_at_y(limit_circles_2d['knee_max'], z)),
-            max(circle_point_at_y(limit_circles_2d['thigh_max'], z))])
+            max(circle_point_at_y(circles['knee_max'], z)),
+            max(circle_point_at_y(circles['thigh_max'], z))])
     # left point
-    tminxs = circle_point_at_y(limit_circles_2d['thigh_min'], z)
-    kminxs = circle_point_at_y(limit_circles_2d['knee_min'], z)
+    tminxs = circle_point_at_y(circles['thigh_min'], z)
+    kminxs = circle_point_at_y(circles['knee_min'], z)
     if tminxs is None and kminxs is None:  # below both
-        l = min(circle_point_at_y(limit_circles_2d['thigh_max'], z))
+        l = min(circle_point_at_y(circles['thigh_max'], z))
     elif tminxs is None:
         l = max(kminxs)
     elif kminxs is None:
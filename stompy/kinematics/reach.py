@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+Voxel map of the reachable workspace of a leg
+
+The leg frame workspace is divided into voxels, each marked reachable
+(inverse kinematics inside the joint limits at all 8 corners, so a voxel
+on the boundary is only reachable if all of it is) or not, along with a
+signed
+distance to the workspace boundary (inches, positive inside). Queries
+are vectorized lookups (no inverse kinematics).
+
+Middle legs have different hip limits so maps are per leg type. Maps
+are built the first time they are needed and cached on disk
+(~/.stompy/reach) keyed by the leg geometry and resolution.
+"""
+
+import hashlib
+import os
+
+import numpy
+
+from .. import consts
+from .. import geometry
+from . import leg
+
+
+VERSION = 2
+DEFAULT_RESOLUTION = 2.0
+cache_directory = os.path.expanduser(os.path.join('~', '.stompy', 'reach'))
+
+# loaded maps by (leg type, resolution)
+maps = {}
+
+
+def leg_type(leg_number):
+    if leg_number in consts.MIDDLE_LEGS:
+        return 'middle'
+    return 'corner'
+
+
+def distance_transform(mask, resolution):
+    """Distance from each voxel to the nearest voxel where mask is False
+
+    Exact euclidean distance, computed one axis at a time
+    """
+    big = float(sum(mask.shape)) ** 2.
+    d = numpy.where(mask, big, 0.)
+    for axis in range(mask.ndim):
+        d = numpy.moveaxis(d, axis, -1)
+        n = d.shape[-1]
+        j = numpy.arange(n)
+        out = numpy.empty_like(d)
+        for i in range(n):
+            # min over j of d[..., j] + (i - j) ** 2
+            out[..., i] = (d + (i - j) ** 2.).min(axis=-1)
+        d = numpy.moveaxis(out, -1, axis)
+    return numpy.sqrt(d) * resolution
+
+
+def workspace_bounds(leg_number, n=25):
+    """Min and max leg frame x, y, z reachable within the joint limits"""
+    limits = geometry.get_limits(leg_number)
+    h, t, k = numpy.meshgrid(*[
+        numpy.linspace(limits[j][0], limits[j][1], n)
+        for j in ('hip', 'thigh', 'knee')])
+    x, y, z = list(leg.angles_to_points(h, t, k))[-1]
+    pts = numpy.column_stack([x.ravel(), y.ravel(), z.ravel()])
+    return pts.min(axis=0), pts.max(axis=0)
+
+
+class ReachMap(object):
+    def __init__(self, origin, resolution, reachable, distance):
+        self.origin = numpy.asarray(origin, dtype='f8')
+        self.resolution = float(resolution)
+        self.reachable = reachable
+        self.distance = distance
+        self.shape = numpy.array(reachable.shape)
+
+    @classmethod
+    def build(cls, leg_number, resolution=DEFAULT_RESOLUTION):
+        vmin, vmax = workspace_bounds(leg_number)
+        # pad so the boundary is inside the map
+        origin = vmin - 2 * resolution
+        shape = numpy.ceil(
+            (vmax - vmin) / resolution).astype(int) + 5
+        # voxel corners
+        axes = [
+            origin[i] + numpy.arange(shape[i] + 1) * resolution
+            for i in range(3)]
+        x, y, z = numpy.meshgrid(*axes, indexing='ij')
+        with numpy.errstate(invalid='ignore'):
+            angles = leg.point_to_angles(x, y, z)
+        limits = geometry.get_limits(leg_number)
+        corners = numpy.ones(x.shape, dtype=bool)
+        for (j, a) in zip(('hip', 'thigh', 'knee'), angles):
+            jmin, jmax = limits[j]
+            with numpy.errstate(invalid='ignore'):
+                corners &= (a >= jmin) & (a <= jmax)
+        # a voxel is reachable if all 8 of its corners are
+        reachable = numpy.ones(tuple(shape), dtype=bool)
+        for i in (0, 1):
+            for j in (0, 1):
+                for k in (0, 1):
+                    reachable &= corners[
+                        i:i + shape[0], j:j + shape[1], k:k + shape[2]]
+        distance = (
+            distance_transform(reachable, resolution) -
+            distance_transform(~reachable, resolution))
+        return cls(origin, resolution, reachable, distance.astype('f4'))
+
+    @classmethod
+    def load(cls, filename):
+        d = numpy.load(filename)
+        return cls(
+            d['origin'], float(d['resolution']), d['reachable'],
+            d['distance'])
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            numpy.savez_compressed(
+                f, origin=self.origin, resolution=self.resolution,
+                reachable=self.reachable, distance=self.distance)
+
+    def indices(self, pts):
+        """Voxel indices of (n, 3) points and a mask of in map points"""
+        pts = numpy.atleast_2d(numpy.asarray(pts, dtype='f8'))
+        ijk = numpy.floor((pts - self.origin) / self.resolution).astype(int)
+        inside = ((ijk >= 0) & (ijk < self.shape)).all(axis=1)
+        ijk[~inside] = 0
+        return ijk, inside
+
+    def is_reachable(self, pts):
+        """Bool array, True where points are in the reachable workspace"""
+        ijk, inside = self.indices(pts)
+        return inside & self.reachable[ijk[:, 0], ijk[:, 1], ijk[:, 2]]
+
+    def margin(self, pts):
+        """Distance (inches) to the workspace boundary, negative outside
+
+        Points outside the map return -inf
+        """
+        ijk, inside = self.indices(pts)
+        d = self.distance[ijk[:, 0], ijk[:, 1], ijk[:, 2]].astype('f8')
+        d[~inside] = -numpy.inf
+        return d
+
+
+def cache_filename(leg_number, resolution):
+    limits = geometry.get_limits(leg_number)
+    key = repr((
+        VERSION, resolution,
+        [tuple(float(v) for v in limits[j])
+         for j in ('hip', 'thigh', 'knee')],
+        geometry.HIP_LENGTH, geometry.THIGH_LENGTH, geometry.KNEE_LENGTH,
+        geometry.THIGH_REST_ANGLE, geometry.KNEE_REST_ANGLE,
+        geometry.BASE_BETA))
+    return os.path.join(
+        cache_directory, '%s_%s.npz' % (
+            leg_type(leg_number),
+            hashlib.md5(key.encode('ascii')).hexdigest()))
+
+
+def get_map(leg_number, resolution=DEFAULT_RESOLUTION):
+    """Reach map for a leg, loaded from the disk cache or built"""
+    key = (leg_type(leg_number), resolution)
+    if key in maps:
+        return maps[key]
+    fn = cache_filename(leg_number, resolution)
+    if os.path.exists(fn):
+        m = ReachMap.load(fn)
+    else:
+        m = ReachMap.build(leg_number, resolution)
+        try:
+            os.makedirs(cache_directory)
+        except OSError:
+            if not os.path.isdir(cache_directory):
+                raise
+        # other processes might be building the same map
+        tfn = '%s.%i' % (fn, os.getpid())
+        m.save(tfn)
+        os.rename(tfn, fn)
+    maps[key] = m
+    return m
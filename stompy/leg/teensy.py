@@ -18,6 +18,7 @@ from .. import geometry
 from .. import kinematics
 from .. import log
 from . import plans
+from .. import scheduler
 from .. import signaler
 from .. import transforms
 from .. import utils
@@ -67,6 +68,8 @@ class LegController(signaler.Signaler):
         self.log = log.make_logger(self.leg_name)
 
         self.estop = None
+        # time the last estop change was detected
+        self.estop_time = None
 
         self.adc = {}
         self.angles = {}
@@ -74,8 +77,22 @@ class LegController(signaler.Signaler):
         self.pid = {}
         self.pwm = {}
 
-    def set_estop(self, value):
+    def send_estop(self, value, flush=True):
+        """Write estop to the leg now, without updating state or signaling
+
+        If not flush, the estop may stay buffered until flush is called.
+        Used by the estop fast path (see controllers.estop)"""
+        pass
+
+    def flush(self):
+        """Write anything buffered for the leg"""
+        pass
+
+    def set_estop(self, value, send=True, t=None):
         if value != self.estop:
+            if t is None:
+                t = time.time()
+            self.estop_time = t
             self.estop = value
             self.log.info({'estop': value})
             self.trigger('estop', value)
@@ -306,11 +323,11 @@ class FakeTeensy(LegController):
             # generate events:
             self.pwm['time'] = t
             self.pid['time'] = t
-            self.trigger('adc', self.adc)
-            self.trigger('pwm', self.pwm)
-            self.trigger('pid', self.pid)
-            self.trigger('angles', self.angles)
-            self.trigger('xyz', self.xyz)
+            self.defer('adc', self.adc)
+            self.defer('pwm', self.pwm)
+            self.defer('pid', self.pid)
+            self.defer('angles', self.angles)
+            self.defer('xyz', self.xyz)
             self._last_update = t
 
 
@@ -321,7 +338,8 @@ def print_message(msg):
 class Teensy(LegController):
     def __init__(self, port):
         self.port = port
-        self.com = pycomando.Comando(serial.Serial(self.port, 9600))
+        self.serial = serial.Serial(self.port, 9600)
+        self.com = pycomando.Comando(self.serial)
         self.cmd = pycomando.protocols.command.CommandProtocol()
         self.text = pycomando.protocols.TextProtocol()
         self.com.register_protocol(0, self.cmd)
@@ -345,7 +363,7 @@ class Teensy(LegController):
         self.com.register_protocol(1, self._text)
 
         # load calibration setup
-        for v in calibration.setup.get(self.leg_number, []):
+        for v in calibration.get_setup().get(self.leg_number, []):
             self.log.debug({'calibration': v})
             f, args = v
             logger.debug("Calibration: %s, %s" % (f, args))
@@ -370,6 +388,11 @@ class Teensy(LegController):
 
         # send first heartbeat
         self.send_heartbeat()
+        # weak: cancelled when the leg is collected (or closed)
+        self.heartbeat_task = scheduler.default.every(
+            consts.HEARTBEAT_PERIOD, self.send_heartbeat,
+            name='heartbeat.%s' % self.leg_name,
+            priority=scheduler.PRIORITY_HEARTBEAT, weak=True)
 
         self.mgr.on('report_xyz', self.on_report_xyz)
         self.mgr.on('report_angles', self.on_report_angles)
@@ -388,15 +411,14 @@ class Teensy(LegController):
 
     def merge_calf_calibration(self):
         # merge into setup calibration
-        inds = [
-            i for (i, v) in enumerate(calibration.setup[self.leg_number])
-            if v[0] == 'calf_scale']
+        setup = calibration.get_setup()[self.leg_number]
+        inds = [i for (i, v) in enumerate(setup) if v[0] == 'calf_scale']
         if len(inds) >= 1:
             # remove existing calf scales
             for i in inds[::-1]:
-                calibration.setup[self.leg_number].pop(i)
+                setup.pop(i)
         cal = self.calibrators['calf']
-        calibration.setup[self.leg_number].append(
+        setup.append(
             ('calf_scale', (cal.slope, cal.offset)))
 
     def compute_calf_zero(self, load=0, merge=True):
@@ -420,7 +442,7 @@ class Teensy(LegController):
 
     def on_estop(self, severity):
         #print("Received estop: %s" % severity)
-        super(Teensy, self).set_estop(severity.value)
+        super(Teensy, self).set_estop(severity.value, t=time.time())
 
     def send_plan(self, *args, **kwargs):
         pp = self._pack_plan(*args, **kwargs)
@@ -429,9 +451,19 @@ class Teensy(LegController):
         self.trigger('plan', pp)
         self.mgr.trigger('plan', *pp)
 
-    def set_estop(self, value):
+    def send_estop(self, value, flush=True):
         self.mgr.trigger('estop', value)
-        super(Teensy, self).set_estop(value)
+        if flush:
+            self.flush()
+
+    def flush(self):
+        # don't leave the estop in the output buffer
+        self.serial.flush()
+
+    def set_estop(self, value, send=True, t=None):
+        if send:
+            self.send_estop(value)
+        super(Teensy, self).set_estop(value, t=t)
 
     def set_pwm(self, hip, thigh, knee):
         self.mgr.trigger('pwm', hip, thigh, knee)
@@ -447,7 +479,7 @@ class Teensy(LegController):
             'knee': knee.value, 'calf': calf.value,
             'time': time.time()}
         self.log.debug({'adc': self.adc})
-        self.trigger('adc', self.adc)
+        self.defer('adc', self.adc)
 
     def on_report_xyz(self, x, y, z):
         t = time.time()
@@ -456,7 +488,7 @@ class Teensy(LegController):
             'x': x, 'y': y, 'z': z,
             'time': t}
         self.log.debug({'xyz': self.xyz})
-        self.trigger('xyz', self.xyz)
+        self.defer('xyz', self.xyz)
 
     def on_report_angles(self, h, t, k, c, v):
         self.angles = {
@@ -464,7 +496,7 @@ class Teensy(LegController):
             'calf': c.value,
             'valid': bool(v), 'time': time.time()}
         self.log.debug({'angles': self.angles})
-        self.trigger('angles', self.angles)
+        self.defer('angles', self.angles)
 
     def on_report_pid(self, ho, to, ko, hs, ts, ks, he, te, ke):
         self.pid = {
@@ -485,7 +517,7 @@ class Teensy(LegController):
                 'knee': ke.value,
             }}
         self.log.debug({'pid': self.pid})
-        self.trigger('pid', self.pid)
+        self.defer('pid', self.pid)
 
     def on_report_pwm(self, h, t, k):
         """
@@ -505,7 +537,7 @@ class Teensy(LegController):
             'hip': h.value, 'thigh': t.value, 'knee': k.value,
             'time': time.time()}
         self.log.debug({'pwm': self.pwm})
-        self.trigger('pwm', self.pwm)
+        self.defer('pwm', self.pwm)
 
     def on_report_loop_time(self, t):
         self.loop_time_stats.update(t.value)
@@ -517,7 +549,19 @@ class Teensy(LegController):
         self.last_heartbeat = time.time()
         # print("HB: %s" % self.last_heartbeat)
 
+    def close(self):
+        """Stop sending heartbeats (the leg will heartbeat estop)"""
+        scheduler.default.cancel(self.heartbeat_task)
+
     def update(self):
+        # without a running scheduler (e.g. a script only calling update)
+        # heartbeats are sent here
+        if (
+                not self.heartbeat_task.cancelled and
+                not scheduler.default.running(consts.HEARTBEAT_PERIOD) and
+                (time.time() - self.last_heartbeat) >
+                consts.HEARTBEAT_PERIOD):
+            self.send_heartbeat()
         try:
             self.com.handle_stream()
         except Exception as e:
@@ -530,8 +574,6 @@ class Teensy(LegController):
                 'traceback': tbs,
                 'exception': e}})
             raise e
-        if (time.time() - self.last_heartbeat) > consts.HEARTBEAT_PERIOD:
-            self.send_heartbeat()
 
 
 def connect_to_teensies(ports=None):
@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 """
 Write timestamped dicts to pickle file
+
+pylab is only imported by the plotting functions (it is slow to import
+and not needed to write logs).
 """
 
 import atexit
@@ -12,7 +15,6 @@ import cPickle as pickle
 import time
 
 import numpy
-import pylab
 
 
 def find_newest_log():
@@ -72,6 +74,7 @@ def filter_events(d, pass_filter, legs=None):
 
 
 def plot_events(d, value=None, legs=None):
+    import pylab
     if legs is None:
         legs = sorted(d.keys())
     # TODO colormap
@@ -86,6 +89,7 @@ def plot_events(d, value=None, legs=None):
 def plot_key(
         data, key, subkeys=None, show=True, name=None, legend=True,
         normalize_time=True, remove_imu=True, remove_base=True):
+    import pylab
     if isinstance(data, (str, unicode)):
         if name is None:
             name = data
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+Wall time profiling of control loop stages, legs and signal events
+
+Nothing is recorded unless the profiler is enabled (default off) so
+instrumented code only pays for an attribute check. Hot paths time
+consecutive stages with start/lap/stop:
+
+    t = profiler.default.start()  # None when disabled
+    ...
+    t = profiler.default.lap('stage.a', t)
+    ...
+    profiler.default.stop('stage.b', t)
+
+other code can use 'with profiler.default.timed(name):'. Signaler times
+every triggered event as 'signal.<class>.<event>'. Times are inclusive,
+a stage includes the signals triggered within it.
+
+Each name keeps a histogram of times (log spaced bins) for percentiles.
+"""
+
+import bisect
+import time
+
+from . import utils
+
+
+# histogram bin edges (seconds), 1 us to 1 s with 4 bins per decade
+BIN_EDGES = [10. ** (e / 4.) for e in range(-24, 1)]
+
+
+class Histogram(object):
+    def __init__(self, edges=None):
+        if edges is None:
+            edges = BIN_EDGES
+        self.edges = edges
+        self.reset()
+
+    def reset(self):
+        # counts[i] is the number of values < edges[i] (and >= edges[i-1])
+        self.counts = [0] * (len(self.edges) + 1)
+        self.stats = utils.StatsMonitor()
+
+    def update(self, v):
+        self.counts[bisect.bisect_right(self.edges, v)] += 1
+        self.stats.update(v)
+
+    def percentile(self, p):
+        """Upper bin edge below which p percent of values fall"""
+        if self.stats.n == 0:
+            return float('nan')
+        target = self.stats.n * p / 100.
+        total = 0
+        for (i, c) in enumerate(self.counts):
+            total += c
+            if total >= target:
+                break
+        if i == len(self.edges):
+            return self.stats.max
+        return min(self.edges[i], self.stats.max)
+
+
+class _Timer(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = self.profiler.clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.profiler.record(self.name, self.profiler.clock() - self.t0)
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+
+class Profiler(object):
+    def __init__(self, clock=time.time):
+        self.enabled = False
+        self.clock = clock
+        self.histograms = {}
+        self._null_timer = _NullTimer()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def record(self, name, dt):
+        h = self.histograms.get(name)
+        if h is None:
+            h = self.histograms[name] = Histogram()
+        h.update(dt)
+
+    def start(self):
+        """Start time for lap/stop (None when disabled)"""
+        if not self.enabled:
+            return None
+        return self.clock()
+
+    def lap(self, name, t0):
+        """Record time since t0 as name, return the start of the next lap"""
+        if t0 is None:
+            return None
+        t = self.clock()
+        self.record(name, t - t0)
+        return t
+
+    def stop(self, name, t0):
+        self.lap(name, t0)
+
+    def timed(self, name):
+        """Context manager recording the time of a block as name"""
+        if not self.enabled:
+            return self._null_timer
+        return _Timer(self, name)
+
+    def stats(self):
+        return {
+            name: {
+                'n': h.stats.n,
+                'total': h.stats.sum,
+                'mean': h.stats.mean,
+                'min': h.stats.min,
+                'max': h.stats.max,
+                'p50': h.percentile(50),
+                'p99': h.percentile(99),
+                'histogram': list(h.counts),
+            } for (name, h) in self.histograms.items()}
+
+    def reset_stats(self):
+        self.histograms = {}
+
+    def __str__(self):
+        lines = [
+            "%s[enabled=%s]" % (self.__class__.__name__, self.enabled),
+            "  %-32s %8s %9s %9s %9s %9s %9s" % (
+                'name', 'n', 'total s', 'mean ms', 'p50 ms', 'p99 ms',
+                'max ms')]
+        hs = sorted(
+            self.histograms.items(), key=lambda nh: -nh[1].stats.sum)
+        for (name, h) in hs:
+            lines.append(
+                "  %-32s %8i %9.3f %9.3f %9.3f %9.3f %9.3f" % (
+                    name[-32:], h.stats.n, h.stats.sum,
+                    h.stats.mean * 1000., h.percentile(50) * 1000.,
+                    h.percentile(99) * 1000., h.stats.max * 1000.))
+        return '\n'.join(lines)
+
+
+# used by the control loop and Signaler
+default = Profiler()
@@ -10,11 +10,17 @@ it will produce 'requests' for plans that will be 'accepted'
 import numpy
 
 from . import cfg
+from . import collision
 from .. import consts
+from . import engine
 from .. import kinematics
 from . import leg
 from .. import log
 from .. import signaler
+from . import stability
+from . import terrain
+from .. import transforms
+from .. import utils
 
 
 class BodyTarget(object):
@@ -52,10 +58,35 @@ class Body(signaler.Signaler):
                     self.neighbors[n] = [inds[i - 1], inds[0]]
                 else:
                     self.neighbors[n] = [inds[i - 1], inds[i + 1]]
+        self.engine = engine.RestrictionEngine(sorted(self.legs))
+        self.swing_targets = leg.SwingTargetCache(self.cfg)
+        # ground heights from touchdowns of all feet
+        self.height_map = terrain.HeightMap()
+        # leg origins in the body frame, for stance speed radii
+        self.leg_origins = numpy.array([
+            kinematics.body.leg_to_body(i, 0., 0., 0.)
+            for i in sorted(self.legs)])
+        self.radii = utils.LRUCache(256)
+        # body to leg transforms for stance plans of all feet
+        self.body_to_leg_transforms = numpy.array([
+            numpy.asarray(kinematics.body.body_to_leg_transforms[i])
+            for i in sorted(self.legs)])
+        # stance plans blending to a new target (see set_target)
+        self._blend = None
+        self._blend_ticks = 0
+        # signals 'margin' every step
+        self.support = stability.SupportPolygon(sorted(self.legs))
+        # foot positions and swings, signals 'collision' when feet are
+        # too close to each other or another hip
+        self.foot_index = collision.FootIndex(
+            sorted(self.legs), self.leg_origins)
+        self.collisions = []
         for i in self.legs:
-            self.feet[i] = leg.Foot(self.legs[i], self.cfg, **kwargs)
-            self.feet[i].on(
-                'restriction', lambda s, ln=i: self.on_restriction(s, ln))
+            self.feet[i] = leg.Foot(
+                self.legs[i], self.cfg, restriction_engine=self.engine,
+                swing_targets=self.swing_targets,
+                height_map=self.height_map, foot_index=self.foot_index,
+                **kwargs)
         self.disable()
 
     def enable(self, foot_states):
@@ -68,19 +99,28 @@ class Body(signaler.Signaler):
         self.cfg.speed_scalar = speed_scalar
         self.set_target(self.target)
 
+    def furthest_leg_radius(self, bxy):
+        """Distance from body point bxy to the furthest leg origin
+
+        bxy is rounded to leg.SWING_TARGET_RESOLUTION (joystick derived
+        centers rarely repeat exactly) and the distance is calculated
+        from the rounded point so cached and fresh values match.
+        """
+        x = leg.quantize(bxy[0], leg.SWING_TARGET_RESOLUTION)
+        y = leg.quantize(bxy[1], leg.SWING_TARGET_RESOLUTION)
+        key = (x, y)
+        mr = self.radii.get(key)
+        if mr is None:
+            d = self.leg_origins - (x, y, 0.)
+            mr = numpy.sqrt((d * d).sum(axis=1).max())
+            self.radii.set(key, mr)
+        return mr
+
     def calc_stance_speed(self, bxy, mag):
         # scale to pid future time ms
         speed = mag * self.cfg.get_speed('stance') * consts.PLAN_TICK
         # find furthest foot
-        x, y = bxy
-        z = 0.
-        mr = None
-        for i in self.feet:
-            tx, ty, tz = kinematics.body.body_to_leg(i, x, y, z)
-            r = tx * tx + ty * ty + tz * tz
-            if mr is None or r > mr:
-                mr = r
-        mr = numpy.sqrt(mr)
+        mr = self.furthest_leg_radius(bxy)
         # TODO account for radius sign
         rspeed = speed / mr
         if numpy.abs(rspeed) > self.cfg.get_speed('angular'):
@@ -92,7 +132,37 @@ class Body(signaler.Signaler):
             rs = 1.
         return rspeed * rs
 
-    def set_target(self, target, update_swing=True):
+    def stance_matrices(self, target):
+        """Leg frame stance plan matrices (n, 4, 4) of all feet
+
+        Feet are in sorted leg order, each matrix is a rotation of
+        target.speed about the rotation center (see Foot.set_target)
+        """
+        bx, by = target.rotation_center
+        c = numpy.einsum(
+            'nij,j->ni', self.body_to_leg_transforms, (bx, by, 0., 1.))
+        s = numpy.sin(target.speed)
+        co = numpy.cos(target.speed)
+        m = numpy.zeros((len(c), 4, 4))
+        m[:, 0, 0] = co
+        m[:, 0, 1] = -s
+        m[:, 1, 0] = s
+        m[:, 1, 1] = co
+        m[:, 2, 2] = 1.
+        m[:, 3, 3] = 1.
+        # translate the rotation center to the origin and back
+        m[:, 0, 3] = c[:, 0] - (co * c[:, 0] - s * c[:, 1])
+        m[:, 1, 3] = c[:, 1] - (s * c[:, 0] + co * c[:, 1])
+        return m
+
+    def set_target(self, target, update_swing=True, blend=True):
+        """Set a new BodyTarget
+
+        With cfg.target_blend_ticks stance plans ramp (see
+        transforms.blend) from the current plans to the new target over
+        that many steps unless blend is False. Swing targets change
+        immediately.
+        """
         if not isinstance(target, BodyTarget):
             raise ValueError("Body.set_target requires BodyTarget")
         self.logger.debug({"set_target": (target, update_swing)})
@@ -104,10 +174,157 @@ class Body(signaler.Signaler):
             target = BodyTarget((0., 0.), 0., 0.)
             # only update non-swing
             update_swing = False
+            blend = False
         self.target = target
-        for i in self.feet:
+        lns = sorted(self.feet)
+        matrices = self.stance_matrices(target)
+        self._blend = None
+        self._blend_ticks = 0
+        n = self.cfg.target_blend_ticks
+        if (
+                blend and n > 0 and
+                all([self.feet[i].leg_target is not None for i in lns])):
+            current = numpy.array([
+                numpy.asarray(self.feet[i].leg_target) for i in lns])
+            self._blend = transforms.blend(current, matrices, n)
+            self._blend_ticks = n - 1
+            matrices = next(self._blend)
+        for (i, m) in zip(lns, matrices):
             self.feet[i].set_target(
-                target, update_swing=update_swing)
+                target, update_swing=update_swing,
+                leg_target=numpy.matrix(m))
+
+    def blend_step(self):
+        """Send the next stance plans of a blend in progress"""
+        if self._blend_ticks <= 0:
+            return
+        self._blend_ticks -= 1
+        matrices = next(self._blend)
+        if self._blend_ticks == 0:
+            self._blend = None
+        for (i, m) in zip(sorted(self.feet), matrices):
+            foot = self.feet[i]
+            foot.leg_target = numpy.matrix(m)
+            if foot.state not in (None, 'swing'):
+                foot.send_plan()
+
+    def calculate_restrictions(self, samples):
+        """Calculate restriction for several feet in one evaluation
+
+        samples is a dict of {leg_number: (xyz, angles)}, each foot
+        stores and signals its new restriction (see
+        leg.Foot.calculate_restriction)
+        """
+        lns = sorted(samples)
+        if len(lns) == 0:
+            return
+        feet = [self.feet[ln] for ln in lns]
+        r, idr, dr = self.engine.evaluate(
+            self.engine.rows(lns),
+            [samples[ln][0]['time'] for ln in lns],
+            [f.joint_angles(samples[ln][1]) for (f, ln) in zip(feet, lns)],
+            [f.restriction_modifier for f in feet],
+            [f.previous_restriction() for f in feet],
+            self.cfg)
+        for (i, ln) in enumerate(lns):
+            self.feet[ln].set_restriction(
+                samples[ln][0]['time'], r[i], idr[i], dr[i])
+
+    def predict(self, lns):
+        """Predict time until each stance foot in lns reaches r_max
+
+        Each stance foot is stepped forward through its stance plan
+        (leg_target) from its last sample. The result is stored in
+        foot.time_to_limit (None for feet not in stance).
+        """
+        feet = []
+        for ln in lns:
+            foot = self.feet[ln]
+            if foot.state == 'stance' and foot.leg_target is not None:
+                feet.append(foot)
+            else:
+                foot.time_to_limit = None
+        if len(feet) == 0:
+            return
+        ttl = self.engine.time_to_limit(
+            self.engine.rows([f.leg.leg_number for f in feet]),
+            [(f.xyz['x'], f.xyz['y'], f.xyz['z']) for f in feet],
+            [f.leg_target for f in feet],
+            [f.restriction_modifier for f in feet],
+            self.cfg.r_max, self.cfg,
+            horizon=self.cfg.predict_horizon, step=self.cfg.predict_step)
+        for (f, t) in zip(feet, ttl):
+            f.time_to_limit = float(t)
+        self.logger.debug({'time_to_limit': {
+            f.leg.leg_number: f.time_to_limit for f in feet}})
+
+    def is_restricted(self, leg_number):
+        """Foot is restricted enough to be lifted
+
+        r is above r_thresh or, in predictive mode, the foot is
+        predicted to reach r_max within lift_lead_time
+        """
+        foot = self.feet[leg_number]
+        if foot.restriction is None:
+            return False
+        if foot.restriction['r'] > self.cfg.r_thresh:
+            return True
+        return (
+            self.cfg.predictive and foot.time_to_limit is not None and
+            foot.time_to_limit < self.cfg.lift_lead_time)
+
+    def step(self):
+        """Process the latest sample of every foot, call once per tick
+
+        A target blend in progress advances one step. Restriction is
+        calculated for all feet with a new xyz and angles
+        sample in one evaluation (and, in predictive mode, time to limit
+        is predicted for the stance feet), the support polygon margin is
+        updated, then lift/halt decisions and foot states are updated in
+        leg order. Plans are held until the
+        end of the step so each foot sends at most one plan.
+        """
+        lns = [ln for ln in sorted(self.feet) if self.feet[ln].has_sample]
+        if len(lns) == 0:
+            return
+        for ln in self.feet:
+            self.feet[ln].hold_plans()
+        try:
+            self.blend_step()
+            self.calculate_restrictions({
+                ln: (self.feet[ln].xyz, self.feet[ln].angles)
+                for ln in lns})
+            if self.cfg.predictive and self.enabled:
+                self.predict(lns)
+            states = {ln: self.feet[ln].state for ln in self.feet}
+            for ln in lns:
+                self.support.set_position(ln, self.feet[ln].xyz)
+            self.support.update(
+                states, max([self.feet[ln].xyz['time'] for ln in lns]))
+            self.check_collisions()
+            for ln in lns:
+                foot = self.feet[ln]
+                self.on_restriction(foot.restriction, ln, states)
+                foot.update_state()
+                states[ln] = foot.state
+        finally:
+            for ln in self.feet:
+                self.feet[ln].release_plans()
+
+    def check_collisions(self):
+        """Update foot positions and check for feet that are too close
+
+        Signals 'collision' with a list of (leg, leg or 'hip.<leg>',
+        distance) when the set of close feet changes
+        """
+        self.foot_index.set_positions(self.support.body_xyz)
+        collisions = self.foot_index.check(
+            self.cfg.foot_clearance, self.cfg.hip_clearance)
+        if [c[:2] for c in collisions] != [c[:2] for c in self.collisions]:
+            if len(collisions):
+                self.logger.warning({'collisions': collisions})
+            self.trigger('collision', collisions)
+        self.collisions = collisions
 
     def disable(self):
         self.logger.debug("disable")
@@ -127,7 +344,9 @@ class Body(signaler.Signaler):
                     '_pre_halt_target': self.target,
                 }})
             self._pre_halt_target = self.target
-            self.set_target(BodyTarget((0., 0.), 0., 0.), update_swing=False)
+            self.set_target(
+                BodyTarget((0., 0.), 0., 0.), update_swing=False,
+                blend=False)
             self.halted = True
 
     def get_speed_by_restriction(self):
@@ -136,7 +355,38 @@ class Body(signaler.Signaler):
             if self.feet[i].state not in ('swing', 'lower')])
         return max(0., min(1., 1. - rmax))
 
-    def on_restriction(self, restriction, leg_number):
+    def is_stable_without(self, leg_number, states):
+        """Support polygon keeps min_stability_margin if foot is lifted
+
+        Without a min_stability_margin a foot is not lifted if either
+        of its neighbors is up.
+        """
+        if self.cfg.min_stability_margin is None:
+            ns = self.neighbors.get(leg_number, [])
+            if len(ns) == 0:
+                return False
+            return all([states[n] in ('stance', 'wait') for n in ns])
+        return (
+            self.support.compute_margin(states, exclude=(leg_number, )) >=
+            self.cfg.min_stability_margin)
+
+    def lift_order(self, leg_number, last_lift_times):
+        """Sort key for choosing which restricted foot to lift
+
+        Least recently lifted first or, in predictive mode, the foot
+        predicted to reach r_max first
+        """
+        t = self.feet[leg_number].time_to_limit
+        if not self.cfg.predictive or t is None:
+            t = numpy.inf
+        return (t, last_lift_times[leg_number])
+
+    def on_restriction(self, restriction, leg_number, states=None):
+        """Make halt and lift decisions for a new foot restriction
+
+        states is a dict of current foot states (kept up to date by
+        step), it is updated if the foot is lifted
+        """
         if not self.enabled:
             return
         # TODO only unhalt on low-passed r?
@@ -167,7 +417,7 @@ class Body(signaler.Signaler):
             return
         # TODO scale stance speed by restriction?
         if (
-                (restriction['r'] > self.cfg.r_thresh) and
+                self.is_restricted(leg_number) and
                 self.feet[leg_number].state == 'stance'):
             #if self.halted:
             #    print(
@@ -175,17 +425,10 @@ class Body(signaler.Signaler):
             #        restriction)
             # lift?
             # check n_feet up
-            states = {i: self.feet[i].state for i in self.feet}
+            if states is None:
+                states = {i: self.feet[i].state for i in self.feet}
             n_up = len([
                 s for s in states.values() if s not in ('stance', 'wait')])
-            # check if neighbors are up
-            if len(self.neighbors.get(leg_number, [])) == 0:
-                #if self.halted:
-                #    print("halted but no neighbors")
-                return
-            ns = self.neighbors[leg_number]
-            n_states = [states[n] for n in ns]
-            ns_up = len([s for s in n_states if s not in ('stance', 'wait')])
             # check if any other feet are restricted:
             last_lift_times = {}
             for ln in self.feet:
@@ -194,17 +437,17 @@ class Body(signaler.Signaler):
                     continue
                 if states[ln] not in ('stance', 'wait'):
                     continue
-                if (
-                        self.feet[ln].restriction is not None and
-                        self.feet[ln].restriction['r'] > self.cfg.r_thresh):
+                if self.is_restricted(ln):
                     # found another restricted foot
                     #other_restricted.append(ln)
                     last_lift_times[ln] = self.feet[ln].last_lift_time
             #if self.halted:
             #    print("last_lift_times: %s" % last_lift_times)
-            #    print("ns_up: %s, n_up: %s" % (ns_up, n_up))
+            #    print("n_up: %s" % (n_up, ))
             #  yes? pick least recently lifted
-            if ns_up == 0 and n_up < self.cfg.max_feet_up:
+            if (
+                    n_up < self.cfg.max_feet_up and
+                    self.is_stable_without(leg_number, states)):
                 n_can_lift = self.cfg.max_feet_up - n_up
                 #if self.halted:
                 #    print("n_can_lift: %s" % n_can_lift)
@@ -216,14 +459,17 @@ class Body(signaler.Signaler):
                     # only allow this foot if it was moved later than
                     # the other restricted feet
                     ln_by_lt = sorted(
-                        last_lift_times, key=lambda ln: last_lift_times[ln])
+                        last_lift_times,
+                        key=lambda ln: self.lift_order(ln, last_lift_times))
                     #if self.halted:
                     #    print(
                     #        "ln_by_lt: %s[%s]" %
                     #        (ln_by_lt, ln_by_lt[:n_can_lift+1]))
                     if leg_number in ln_by_lt[:n_can_lift+1]:
                         self.feet[leg_number].set_state('lift')
+                        states[leg_number] = 'lift'
                 else:
                     #if self.halted:
                     #    print("lift %s" % leg_number)
                     self.feet[leg_number].set_state('lift')
+                    states[leg_number] = 'lift'
@@ -32,6 +32,39 @@ class RestrictionConfig(signaler.Signaler):
         self.min_hip_distance = 25.0
         self.target_calf_angle = 0.0
         self.speed_by_restriction = False
+        # lift stance feet predicted to reach r_max within lift_lead_time
+        self.predictive = False
+        self.lift_lead_time = 1.5
+        self.predict_horizon = 5.0
+        self.predict_step = 0.1
+        # only lift if the remaining support polygon keeps this margin
+        # (inches from the center of mass), None to instead only lift if
+        # neither neighbor is up
+        self.min_stability_margin = 15.0
+        # use touchdown heights (see terrain) for swing and lower, lower
+        # at swing speed until lower_approach above the expected ground
+        self.use_terrain = False
+        self.lower_approach = 3.0
+        # swing along precomputed waypoints (see trajectory) blending
+        # lift, swing and lower
+        self.swing_trajectory = False
+        self.swing_spacing = 1.0
+        self.swing_lookahead = 3
+        # feet (or swings) closer than foot_clearance to another foot or
+        # hip_clearance to another hip are signaled (see collision),
+        # with avoid_collisions swings are shortened to stay clear
+        self.foot_clearance = 12.0
+        self.hip_clearance = 18.0
+        self.avoid_collisions = False
+        # ramp stance plans from the old to a new body target over this
+        # many steps (0 to switch immediately)
+        self.target_blend_ticks = 0
+
+    def __setattr__(self, name, value):
+        super(RestrictionConfig, self).__setattr__(name, value)
+        # signal changes to anything that caches on config values
+        if name[0] != '_' and '_callbacks' in self.__dict__:
+            self.trigger('changed', name, value)
 
     def get_speed(self, mode):
         if mode not in self.speeds:
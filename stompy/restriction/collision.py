@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Foot to foot and foot to hip proximity checks (body frame, x y plane)
+
+Each foot is indexed as a segment: a supporting foot is a point (start
+== end), a swinging foot is the segment from lift off to its swing
+target. All pairs of feet and all feet against the other legs' hips
+are checked together each tick.
+"""
+
+import numpy
+
+
+def point_segment_distances(p, a, b):
+    """Distances from points p to segments a-b, all (n, 2)"""
+    ab = b - a
+    l2 = (ab * ab).sum(axis=1)
+    t = numpy.zeros(len(p))
+    nz = l2 > 0
+    t[nz] = numpy.clip(((p - a) * ab).sum(axis=1)[nz] / l2[nz], 0., 1.)
+    c = a + ab * t[:, numpy.newaxis]
+    return numpy.sqrt(((p - c) ** 2.).sum(axis=1))
+
+
+def _cross(a, b):
+    return a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]
+
+
+def segment_distances(a0, a1, b0, b1):
+    """Minimum distances between segments a0-a1 and b0-b1, all (n, 2)"""
+    d = numpy.minimum(
+        numpy.minimum(
+            point_segment_distances(a0, b0, b1),
+            point_segment_distances(a1, b0, b1)),
+        numpy.minimum(
+            point_segment_distances(b0, a0, a1),
+            point_segment_distances(b1, a0, a1)))
+    # crossing segments
+    da = a1 - a0
+    db = b1 - b0
+    s0 = _cross(da, b0 - a0)
+    s1 = _cross(da, b1 - a0)
+    s2 = _cross(db, a0 - b0)
+    s3 = _cross(db, a1 - b0)
+    d[((s0 * s1) < 0) & ((s2 * s3) < 0)] = 0.
+    return d
+
+
+class FootIndex(object):
+    def __init__(self, leg_numbers, hips):
+        """hips: body frame x, y of each leg's hip (leg origin)"""
+        self.leg_numbers = list(leg_numbers)
+        self.index = {ln: i for (i, ln) in enumerate(self.leg_numbers)}
+        n = len(self.leg_numbers)
+        self.hips = numpy.asarray(hips, dtype='f8')[:, :2]
+        self.starts = numpy.empty((n, 2))
+        self.starts.fill(numpy.nan)
+        self.ends = self.starts.copy()
+        self.swinging = numpy.zeros(n, dtype=bool)
+        # all foot pairs, and every foot against every other hip
+        ii, jj = numpy.triu_indices(n, 1)
+        self.pairs = (ii, jj)
+        fi, hi = numpy.nonzero(~numpy.eye(n, dtype=bool))
+        self.hip_pairs = (fi, hi)
+
+    def set_positions(self, xy):
+        """Set current body frame foot positions (n, 2), nan if unknown"""
+        xy = numpy.asarray(xy)[:, :2]
+        self.starts[~self.swinging] = xy[~self.swinging]
+        self.ends[~self.swinging] = xy[~self.swinging]
+
+    def set_swing(self, leg_number, start, end):
+        i = self.index[leg_number]
+        self.starts[i] = start[:2]
+        self.ends[i] = end[:2]
+        self.swinging[i] = True
+
+    def clear_swing(self, leg_number):
+        i = self.index[leg_number]
+        self.swinging[i] = False
+        self.ends[i] = self.starts[i]
+
+    def foot_distances(self):
+        """Distances between all foot pairs (see pairs)"""
+        ii, jj = self.pairs
+        return segment_distances(
+            self.starts[ii], self.ends[ii], self.starts[jj], self.ends[jj])
+
+    def hip_distances(self):
+        """Distances of each foot to each other hip (see hip_pairs)"""
+        fi, hi = self.hip_pairs
+        return point_segment_distances(
+            self.hips[hi], self.starts[fi], self.ends[fi])
+
+    def check(self, clearance, hip_clearance):
+        """Return [(leg, other leg or 'hip.<leg>', distance), ...] closer
+        than the clearances"""
+        lns = self.leg_numbers
+        found = []
+        with numpy.errstate(invalid='ignore'):
+            d = self.foot_distances()
+            ii, jj = self.pairs
+            for k in numpy.nonzero(d < clearance)[0]:
+                found.append((lns[ii[k]], lns[jj[k]], float(d[k])))
+            d = self.hip_distances()
+            fi, hi = self.hip_pairs
+            for k in numpy.nonzero(d < hip_clearance)[0]:
+                found.append(
+                    (lns[fi[k]], 'hip.%s' % lns[hi[k]], float(d[k])))
+        return found
+
+    def swing_clearance(self, leg_number, start, end):
+        """Closest approach of a proposed swing to other feet and hips"""
+        i = self.index[leg_number]
+        others = numpy.array(
+            [j for j in range(len(self.leg_numbers)) if j != i], dtype=int)
+        n = len(others)
+        if n == 0:
+            return numpy.inf, numpy.inf
+        a0 = numpy.tile(numpy.asarray(start, dtype='f8')[:2], (n, 1))
+        a1 = numpy.tile(numpy.asarray(end, dtype='f8')[:2], (n, 1))
+        with numpy.errstate(invalid='ignore'):
+            d = segment_distances(
+                a0, a1, self.starts[others], self.ends[others])
+            h = point_segment_distances(self.hips[others], a0, a1)
+        d = d[~numpy.isnan(d)]
+        return (
+            d.min() if len(d) else numpy.inf,
+            h.min() if len(h) else numpy.inf)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Evaluate restriction for several feet in one numpy call
+
+Joint limits are converted to per-leg normalizers (limit midpoint and
+1 / half range) once when the engine is created. Angles for all feet are
+stacked into one (n, 3) array [hip, thigh, knee] and r, idr and dr are
+computed together (see leg.Foot.calculate_restriction for the meaning of
+each value).
+
+time_to_limit predicts when stance feet will become restricted by
+stepping each foot forward through its per tick stance transform.
+"""
+
+import numpy
+
+from .. import consts
+from .. import geometry
+from .. import kinematics
+
+
+JOINTS = ('hip', 'thigh', 'knee')
+
+
+class RestrictionEngine(object):
+    def __init__(self, leg_numbers):
+        self.leg_numbers = list(leg_numbers)
+        self.index = {ln: i for (i, ln) in enumerate(self.leg_numbers)}
+        limits = numpy.array([
+            [geometry.get_limits(ln)[j] for j in JOINTS]
+            for ln in self.leg_numbers], dtype='f8')
+        # per leg and joint normalizers, shape (n legs, 3)
+        self.jmin = limits[:, :, 0]
+        self.jmax = limits[:, :, 1]
+        self.jmid = (self.jmax + self.jmin) / 2.
+        self.inv_jabsmax = 1. / numpy.maximum(
+            numpy.abs(self.jmid - self.jmax),
+            numpy.abs(self.jmin - self.jmid))
+
+    def rows(self, leg_numbers):
+        return numpy.array([self.index[ln] for ln in leg_numbers], dtype=int)
+
+    def restriction(
+            self, rows, angles, limit_eps, calf_eps, max_calf_angle):
+        """Restriction (r) for stacked angles [hip, thigh, knee]"""
+        a = numpy.asarray(angles, dtype='f8')
+        jmid = self.jmid[rows]
+        jl = numpy.where(
+            a > jmid, a - self.jmax[rows], self.jmin[rows] - a)
+        # take 'max' across joint angles, only the worst sets restriction
+        r = numpy.minimum(
+            1.0, numpy.exp(limit_eps * jl * self.inv_jabsmax[rows])).max(
+                axis=1)
+        # calf angle, if eps == 0, skip
+        if calf_eps > 0.001:
+            ca = numpy.abs(kinematics.leg.angles_to_calf_angle(
+                a[:, 0], a[:, 1], a[:, 2]))
+            r = numpy.maximum(r, numpy.minimum(1.0, numpy.exp(
+                calf_eps * ((ca - max_calf_angle) / max_calf_angle))))
+        return r
+
+    def evaluate(
+            self, rows, t, angles, modifiers, previous, cfg):
+        """Evaluate restriction for stacked feet
+
+        rows: engine rows (see rows) of the feet
+        t: time of each sample
+        angles: (n, 3) hip, thigh, knee angles
+        modifiers: restriction modifier of each foot
+        previous: (n, 3) previous time, r and dr of each foot
+            (nan time if there is no previous restriction)
+        cfg: RestrictionConfig
+
+        Returns r, idr, dr arrays
+        """
+        t = numpy.asarray(t, dtype='f8')
+        r = self.restriction(
+            rows, angles, cfg.eps, cfg.calf_eps, cfg.max_calf_angle)
+        r += numpy.asarray(modifiers, dtype='f8')
+        previous = numpy.asarray(previous, dtype='f8').reshape((-1, 3))
+        pt = previous[:, 0]
+        has_previous = ~numpy.isnan(pt)
+        idr = numpy.zeros_like(r)
+        dr = numpy.zeros_like(r)
+        # a repeated sample time has no slope, keep the smoothed value
+        same = has_previous & (t <= pt)
+        dr[same] = previous[same, 2]
+        p = has_previous & (t > pt)
+        if p.any():
+            idr[p] = (r[p] - previous[p, 1]) / (t[p] - pt[p])
+            dr[p] = (
+                previous[p, 2] * cfg.dr_smooth +
+                idr[p] * (1. - cfg.dr_smooth))
+        return r, idr, dr
+
+    def time_to_limit(
+            self, rows, xyz, matrices, modifiers, r_limit, cfg,
+            horizon=5.0, step=0.1):
+        """Predict seconds until each foot reaches r_limit
+
+        rows: engine rows (see rows) of the feet
+        xyz: (n, 3) current foot positions in the leg frame
+        matrices: per foot 4x4 leg frame transform applied every
+            PLAN_TICK (the stance plan)
+        modifiers: restriction modifier of each foot
+        r_limit: restriction considered limited
+        horizon: seconds to look ahead
+        step: seconds between predicted positions (rounded to a
+            multiple of PLAN_TICK)
+
+        Positions leaving the reachable workspace count as limited.
+        Returns an array of times, inf if the limit is not reached
+        within horizon.
+        """
+        rows = numpy.asarray(rows, dtype=int)
+        n = len(rows)
+        ticks = max(1, int(round(step / consts.PLAN_TICK)))
+        dt = ticks * consts.PLAN_TICK
+        n_steps = max(1, int(numpy.ceil(horizon / dt)))
+        # transforms for one prediction step
+        ms = numpy.array([
+            numpy.linalg.matrix_power(numpy.asarray(m, dtype='f8'), ticks)
+            for m in matrices]).reshape((n, 4, 4))
+        p = numpy.ones((n, 4), dtype='f8')
+        p[:, :3] = numpy.asarray(xyz, dtype='f8').reshape((n, 3))
+        pts = numpy.empty((n_steps, n, 3), dtype='f8')
+        for i in range(n_steps):
+            p = numpy.einsum('nij,nj->ni', ms, p)
+            pts[i] = p[:, :3]
+        pts = pts.reshape((-1, 3))
+        with numpy.errstate(invalid='ignore'):
+            angles = numpy.column_stack(kinematics.leg.point_to_angles(
+                pts[:, 0], pts[:, 1], pts[:, 2]))
+            reachable = ~numpy.isnan(angles).any(axis=1)
+            angles[~reachable] = 0.
+            r = self.restriction(
+                numpy.tile(rows, n_steps), angles,
+                cfg.eps, cfg.calf_eps, cfg.max_calf_angle)
+        r += numpy.tile(numpy.asarray(modifiers, dtype='f8'), n_steps)
+        limited = ((r >= r_limit) | ~reachable).reshape((n_steps, n))
+        hit = limited.any(axis=0)
+        ttl = numpy.empty(n, dtype='f8')
+        ttl.fill(numpy.inf)
+        ttl[hit] = (limited[:, hit].argmax(axis=0) + 1) * dt
+        return ttl
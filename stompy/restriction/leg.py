@@ -11,12 +11,21 @@ import time
 
 import numpy
 
+from . import collision
 from .. import consts
+from . import engine
 from .. import geometry
 from .. import kinematics
+from . import terrain
+from . import trajectory
 from .. import log
 from .. import signaler
 from .. import transforms
+from .. import utils
+
+
+# rotation centers are rounded to this (inches) for swing target caching
+SWING_TARGET_RESOLUTION = 0.5
 
 
 def swing_position_from_intersections(tc, rspeed, c0, ipts, step_ratio):
@@ -104,6 +113,60 @@ def calculate_translation_swing_target(
     return sp
 
 
+def quantize(value, resolution):
+    return round(value / resolution) * resolution
+
+
+class SwingTargetCache(utils.LRUCache):
+    """Cache of swing targets, cleared when a keyed config value changes
+
+    Rotation targets are keyed by leg number, rotation center (rounded to
+    SWING_TARGET_RESOLUTION), direction of rotation and the config values
+    the target depends on (key_fields). Targets are calculated with the
+    rounded center so a cached value is the same as a freshly calculated
+    one. Other config changes (e.g. speed_scalar) keep the cache.
+    """
+    key_fields = (
+        'lower_height', 'step_ratio', 'min_hip_distance',
+        'target_calf_angle')
+
+    def __init__(self, cfg, max_size=256):
+        super(SwingTargetCache, self).__init__(max_size)
+        self.cfg = cfg
+        self.cfg.on('changed', self.on_cfg_changed)
+
+    def on_cfg_changed(self, name, value):
+        # entries for old values can't be hit again
+        if name in self.key_fields:
+            self.clear()
+
+    def rotation_target(self, leg_number, rx, ry, rspeed):
+        cfg = self.cfg
+        rx = quantize(rx, SWING_TARGET_RESOLUTION)
+        ry = quantize(ry, SWING_TARGET_RESOLUTION)
+        # only the direction of rotation changes the target
+        rsign = float(numpy.sign(rspeed))
+        key = (
+            'rotation', leg_number, rx, ry, rsign, cfg.lower_height,
+            cfg.step_ratio, cfg.min_hip_distance, cfg.target_calf_angle)
+        return self.get_or_compute(
+            key, calculate_swing_target,
+            rx, ry, cfg.lower_height, leg_number, rsign, cfg.step_ratio,
+            min_hip_distance=cfg.min_hip_distance,
+            target_calf_angle=cfg.target_calf_angle)
+
+    def translation_target(self, leg_number, dx, dy, step_ratio):
+        cfg = self.cfg
+        key = (
+            'translation', leg_number, dx, dy, cfg.lower_height,
+            step_ratio, cfg.min_hip_distance, cfg.target_calf_angle)
+        return self.get_or_compute(
+            key, calculate_translation_swing_target,
+            dx, dy, cfg.lower_height, leg_number, None, step_ratio,
+            min_hip_distance=cfg.min_hip_distance,
+            target_calf_angle=cfg.target_calf_angle)
+
+
 def calculate_restriction(
         xyz, angles, limits, limit_eps, calf_eps, max_calf_angle):
     # use angle limits to compute restriction
@@ -133,30 +196,78 @@ def calculate_restriction(
 
 class Foot(signaler.Signaler):
     def __init__(
-            self, leg, cfg):
+            self, leg, cfg, restriction_engine=None, swing_targets=None,
+            height_map=None, foot_index=None, clock=time.time):
+        """clock: time source for lift bookkeeping (simulations pass
+        their simulated clock)"""
         super(Foot, self).__init__()
         self.leg = leg
         self.cfg = cfg
+        self.clock = clock
         self.limits = geometry.get_limits(self.leg.leg_number)
+        # loaded (or built) on first use, see reach_map
+        self._reach_map = None
+        # shared with the other feet when created by restriction.body.Body
+        if restriction_engine is None:
+            restriction_engine = engine.RestrictionEngine(
+                [self.leg.leg_number])
+        self.engine = restriction_engine
+        self.engine_row = self.engine.index[self.leg.leg_number]
+        if swing_targets is None:
+            swing_targets = SwingTargetCache(self.cfg)
+        self.swing_targets = swing_targets
+        if height_map is None:
+            height_map = terrain.HeightMap()
+        self.height_map = height_map
+        if foot_index is None:
+            ln = self.leg.leg_number
+            foot_index = collision.FootIndex(
+                [ln], [kinematics.body.leg_to_body(ln, 0., 0., 0.)])
+        self.foot_index = foot_index
         self.logger = log.make_logger(
             'Res-%s' %
             consts.LEG_NAME_BY_NUMBER[self.leg.leg_number])
-        self.leg.on('xyz', self.on_xyz)
-        self.leg.on('angles', self.on_angles)
-        self.last_lift_time = time.time()
+        self.leg.on('xyz', self.on_xyz, weak=True)
+        self.leg.on('angles', self.on_angles, weak=True)
+        self.last_lift_time = self.clock()
         self.leg_target = None
         self.body_target = None
         self.swing_target = None
         self.swing_info = None
+        # body frame x, y where the current swing started
+        self.swing_start = None
+        # trajectory.SwingTrajectory when swinging along waypoints
+        self.trajectory = None
         self.unloaded_height = None
+        # expected ground height (leg frame) at the swing target
+        self.ground_height = None
+        self._lower_fast = False
         # stance -> lift -> swing -> lower -> wait
         self.state = None
         self.restriction = None
+        # predicted seconds until r_max in stance (see Body.predict)
+        self.time_to_limit = None
         self.xyz = None
         self.angles = None
         self.restriction_modifier = 0.
+        # while held, plans are only sent by release_plans
+        self._hold_plans = False
+        self._plan_pending = False
+
+    def hold_plans(self):
+        self._hold_plans = True
+
+    def release_plans(self):
+        """Stop holding plans, send the latest one if any were held"""
+        self._hold_plans = False
+        if self._plan_pending:
+            self.send_plan()
 
     def send_plan(self):
+        if self._hold_plans:
+            self._plan_pending = True
+            return
+        self._plan_pending = False
         #print("res.send_plan: [%s]%s" % (self.leg.leg_number, self.state))
         if self.state is None or self.leg_target is None:
             # TODO always stop on disable?
@@ -179,31 +290,53 @@ class Foot(signaler.Signaler):
                 matrix=T,
                 speed=0)
         elif self.state == 'swing':
-            z = self.unloaded_height + self.cfg.lift_height
+            z = self.unloaded_height
             if self.swing_info is None:  # assume target of 0, 0
-                sp = calculate_translation_swing_target(
-                    0, 0, self.cfg.lower_height,
-                    self.leg.leg_number, None, 0.,
-                    min_hip_distance=self.cfg.min_hip_distance,
-                    target_calf_angle=self.cfg.target_calf_angle)
+                sp = self.swing_targets.translation_target(
+                    self.leg.leg_number, 0, 0, 0.)
             elif len(self.swing_info) == 3:  # rotation
                 rx, ry, rspeed = self.swing_info
-                sp = calculate_swing_target(
-                    rx, ry, self.cfg.lower_height,
-                    self.leg.leg_number, rspeed, self.cfg.step_ratio,
-                    min_hip_distance=self.cfg.min_hip_distance,
-                    target_calf_angle=self.cfg.target_calf_angle)
+                sp = self.swing_targets.rotation_target(
+                    self.leg.leg_number, rx, ry, rspeed)
             else:  # translation
                 lx, ly = self.swing_info
-                sp = calculate_translation_swing_target(
-                    lx, ly, self.cfg.lower_height,
-                    self.leg.leg_number, None, self.cfg.step_ratio,
-                    min_hip_distance=self.cfg.min_hip_distance,
-                    target_calf_angle=self.cfg.target_calf_angle)
+                sp = self.swing_targets.translation_target(
+                    self.leg.leg_number, lx, ly, self.cfg.step_ratio)
+            sp = self.clear_swing_target(sp)
             self.swing_target = sp[0], sp[1]
+            self.ground_height = None
+            if self.cfg.use_terrain:
+                self.ground_height = self.expected_ground(sp[0], sp[1])
+            if self.ground_height is not None:
+                # clear the expected ground at the target
+                z = max(z, self.ground_height)
+            z += self.cfg.lift_height
+            if self.cfg.swing_trajectory and self.trajectory is None:
+                self.trajectory = self.plan_trajectory(sp, z)
+            if self.trajectory is not None:
+                self.leg.send_plan(
+                    mode=consts.PLAN_TARGET_MODE,
+                    frame=consts.PLAN_LEG_FRAME,
+                    linear=tuple(self.trajectory.target),
+                    speed=self.cfg.get_speed('swing'))
+                return
             # print(self.swing_target, z)
-            # TODO check if point is valid
-            # TODO error out on invalid
+            target = self.clamp_to_reach(sp, z)
+            if target is None:
+                # nothing reachable towards the target, hold the foot
+                self.logger.error({'unreachable_swing_target': {
+                    'target': (sp[0], sp[1], z),
+                    'margin': float(
+                        self.reach_map.margin([(sp[0], sp[1], z)])[0])}})
+                self.leg.send_plan(mode=consts.PLAN_STOP_MODE)
+                return
+            if target is not sp:
+                self.logger.warning({'clamped_swing_target': {
+                    'target': (sp[0], sp[1], z),
+                    'clamped': (float(target[0]), float(target[1]))}})
+                sp = target
+                # swing is done at the clamped target
+                self.swing_target = sp[0], sp[1]
             self.leg.send_plan(
                 mode=consts.PLAN_TARGET_MODE,
                 frame=consts.PLAN_LEG_FRAME,
@@ -213,7 +346,10 @@ class Foot(signaler.Signaler):
                     z),
                 speed=self.cfg.get_speed('swing'))
         elif self.state == 'lower':
-            v = -self.cfg.get_speed('lower')
+            if self._lower_fast:
+                v = -self.cfg.get_speed('swing')
+            else:
+                v = -self.cfg.get_speed('lower')
             T = (
                 self.leg_target *
                 transforms.translation_3d(0, 0, v * consts.PLAN_TICK))
@@ -223,17 +359,23 @@ class Foot(signaler.Signaler):
                 matrix=T,
                 speed=0)
 
-    def set_target(self, target, update_swing=True):
+    def set_target(self, target, update_swing=True, leg_target=None):
+        """Set the body target, leg_target is the stance plan matrix
+        (computed from target if None)"""
         self.logger.debug({'set_target': (target, update_swing)})
         bx, by = target.rotation_center
         rx, ry, rz = kinematics.body.body_to_leg(
             self.leg.leg_number, bx, by, 0)
-        lT = transforms.rotation_about_point_3d(
-            rx, ry, rz, 0, 0, target.speed)
+        if leg_target is None:
+            lT = transforms.rotation_about_point_3d(
+                rx, ry, rz, 0, 0, target.speed)
+        else:
+            lT = leg_target
         # TODO add z change
         if update_swing:
             self.swing_info = (rx, ry, target.speed)
             self.swing_target = None
+            self.trajectory = None
         self.leg_target = lT
         self.send_plan()
 
@@ -244,11 +386,19 @@ class Foot(signaler.Signaler):
             self.restriction['dr'] = 0.
         self.state = state
         self.logger.debug({'state': state})
+        self.trajectory = None
+        self.swing_start = None
+        self.foot_index.clear_swing(self.leg.leg_number)
         if self.state == 'lift':
             self.unloaded_height = None
-            self.last_lift_time = time.time()
+            self.last_lift_time = self.clock()
         elif self.state == 'swing':
-            pass
+            xyz = self.leg.xyz
+            if 'x' in xyz:
+                self.swing_start = kinematics.body.leg_to_body(
+                    self.leg.leg_number, xyz['x'], xyz['y'], xyz['z'])[:2]
+        elif self.state == 'lower':
+            self._lower_fast = self.ground_height is not None
         self.send_plan()
         self.trigger('state', state)
 
@@ -261,27 +411,138 @@ class Foot(signaler.Signaler):
             - idr: slope of restriction change from last to new value
             - dr: smoothed idr
         """
-        r = calculate_restriction(
-            xyz, angles, self.limits, self.cfg.eps,
-            self.cfg.calf_eps, self.cfg.max_calf_angle)
-        # TODO use calf angle
-        # add in the 'manual' restriction modifier (set from ui/controller)
-        r += self.restriction_modifier
-        if self.restriction is not None:
-            pt = self.restriction['time']
-            dt = (xyz['time'] - pt)
-            idr = (r - self.restriction['r']) / dt
-            dr = (
-                self.restriction['dr'] * self.cfg.dr_smooth +
-                idr * (1. - self.cfg.dr_smooth))
-        else:  # if no previous value, can't calculate dr
-            idr = 0.
-            dr = 0.
+        # the 'manual' restriction modifier (set from ui/controller)
+        # is added to r
+        r, idr, dr = self.engine.evaluate(
+            [self.engine_row], [xyz['time']], [self.joint_angles(angles)],
+            [self.restriction_modifier], [self.previous_restriction()],
+            self.cfg)
+        self.set_restriction(xyz['time'], r[0], idr[0], dr[0])
+
+    def joint_angles(self, angles):
+        return angles['hip'], angles['thigh'], angles['knee']
+
+    def previous_restriction(self):
+        """Return time, r, dr of the last restriction (nan if none)"""
+        if self.restriction is None:
+            # if no previous value, can't calculate dr
+            return numpy.nan, numpy.nan, numpy.nan
+        return (
+            self.restriction['time'], self.restriction['r'],
+            self.restriction['dr'])
+
+    def set_restriction(self, t, r, idr, dr):
         self.restriction = {
-            'time': xyz['time'], 'r': r, 'dr': dr, 'idr': idr}
+            'time': t, 'r': float(r), 'dr': float(dr), 'idr': float(idr)}
         self.logger.debug({'restriction': self.restriction})
         self.trigger('restriction', self.restriction)
 
+    def expected_ground(self, x, y):
+        """Expected ground height (leg frame) under leg x, y (or None)"""
+        if self.restriction is None:
+            return None
+        ln = self.leg.leg_number
+        bx, by, _ = kinematics.body.leg_to_body(ln, x, y, 0.)
+        h = self.height_map.query(bx, by, self.restriction['time'])
+        if h is None:
+            return None
+        return kinematics.body.body_to_leg(ln, bx, by, h)[2]
+
+    def touchdown(self, xyz):
+        """Record a loaded foot at xyz (leg frame) in the height map"""
+        bx, by, bz = kinematics.body.leg_to_body(
+            self.leg.leg_number, xyz['x'], xyz['y'], xyz['z'])
+        self.height_map.add(bx, by, bz, xyz['time'])
+        self.trigger('touchdown', xyz)
+
+    def clear_swing_target(self, sp):
+        """Check a swing to leg frame target sp against the other feet
+
+        The swing (from swing_start) is stored in the foot index. If it
+        passes closer than foot_clearance to another foot or hip_clearance
+        to another hip a warning is logged and, with avoid_collisions, the
+        swing is shortened to the longest clear fraction (or none).
+        Returns the (possibly shortened) target.
+        """
+        if self.swing_start is None:
+            return sp
+        ln = self.leg.leg_number
+        start = numpy.array(self.swing_start)
+        end = numpy.array(kinematics.body.leg_to_body(
+            ln, sp[0], sp[1], 0.)[:2])
+        fractions = (1., )
+        if self.cfg.avoid_collisions:
+            fractions = (1., 0.75, 0.5, 0.25, 0.)
+        for f in fractions:
+            e = start + (end - start) * f
+            fd, hd = self.foot_index.swing_clearance(ln, start, e)
+            if fd >= self.cfg.foot_clearance and hd >= self.cfg.hip_clearance:
+                break
+        else:
+            self.logger.warning({'swing_collision': {
+                'target': (sp[0], sp[1]), 'foot_distance': float(fd),
+                'hip_distance': float(hd)}})
+        self.foot_index.set_swing(ln, start, e)
+        if f == 1.:
+            return sp
+        self.logger.debug({'shortened_swing': f})
+        x, y, _ = kinematics.body.body_to_leg(ln, e[0], e[1], 0.)
+        return x, y
+
+    def plan_trajectory(self, sp, z):
+        """Swing waypoints from the foot to above swing target sp
+
+        Passes through height z and ends lower_approach above the
+        expected ground. Returns None if the path leaves the joint limits
+        (the swing then uses a single target plan).
+        """
+        xyz = self.leg.xyz
+        if 'z' not in xyz:
+            return None
+        lower_height = self.cfg.lower_height
+        if self.ground_height is not None:
+            lower_height = self.ground_height
+        pts = trajectory.swing_path(
+            (xyz['x'], xyz['y'], xyz['z']),
+            (sp[0], sp[1], lower_height + self.cfg.lower_approach),
+            z, spacing=self.cfg.swing_spacing)
+        if not trajectory.in_limits(self.leg.leg_number, pts):
+            self.logger.debug({'swing_trajectory': 'out of limits'})
+            return None
+        return trajectory.SwingTrajectory(pts, self.cfg.swing_lookahead)
+
+    @property
+    def reach_map(self):
+        if self._reach_map is None:
+            self._reach_map = kinematics.reach.get_map(self.leg.leg_number)
+        return self._reach_map
+
+    def clamp_to_reach(self, sp, z):
+        """Pull leg frame swing target sp (at height z) back towards the
+        foot until the reach map marks it reachable
+
+        Returns the (possibly moved) x, y or None if no point between the
+        foot and sp is reachable.
+        """
+        m = self.reach_map
+        if m.is_reachable([(sp[0], sp[1], z)])[0]:
+            return sp
+        xyz = self.leg.xyz
+        if 'x' not in xyz:
+            return None
+        start = numpy.array([xyz['x'], xyz['y'], z])
+        end = numpy.array([sp[0], sp[1], z])
+        d = numpy.sqrt(((end - start) ** 2.).sum())
+        n = max(2, int(numpy.ceil(d / m.resolution)) * 2 + 1)
+        # from the target back to the foot
+        f = numpy.linspace(1., 0., n)[:, numpy.newaxis]
+        pts = start + (end - start) * f
+        ok = m.is_reachable(pts)
+        if not ok.any():
+            return None
+        x, y, _ = pts[numpy.argmax(ok)]
+        return x, y
+
     def _is_swing_done(self, xyz):
         tx, ty = self.swing_target
         d = ((tx - xyz['x']) ** 2. + (ty - xyz['y']) ** 2.) ** 0.5
@@ -289,34 +550,54 @@ class Foot(signaler.Signaler):
         return d < self.cfg.swing_slop
 
     def on_xyz(self, xyz):
+        # latest samples are processed by restriction.body.Body.step
         self.xyz = xyz
-        if self.angles is not None:
-            self.update()
 
     def on_angles(self, angles):
         self.angles = angles
-        if self.xyz is not None:
-            self.update()
+
+    @property
+    def has_sample(self):
+        return self.xyz is not None and self.angles is not None
 
     def update(self):
+        """Calculate restriction and update state for this foot only"""
         # TODO if angles['valid'] is False?
         self.calculate_restriction(self.xyz, self.angles)
+        self.update_state()
+
+    def update_state(self):
+        """Advance the state machine using the latest xyz and angles"""
         new_state = None
         if self.state is None:  # restriction control is disabled
             self.xyz = None
             self.angles = None
             return
         elif self.state == 'swing':
-            if self._is_swing_done(self.xyz):
+            if self.trajectory is not None:
+                if self.trajectory.advance(self.xyz):
+                    self.send_plan()
+                if self.trajectory.is_done(self.xyz, self.cfg.swing_slop):
+                    new_state = 'lower'
+            elif self._is_swing_done(self.xyz):
                 new_state = 'lower'
         elif self.state == 'lower':
+            lower_height = self.cfg.lower_height
+            if self.ground_height is not None:
+                lower_height = self.ground_height
+                if self._lower_fast and self.xyz['z'] < (
+                        lower_height + self.cfg.lower_approach):
+                    # near the expected ground, slow down
+                    self._lower_fast = False
+                    self.send_plan()
             # TODO check for loaded >L lbs
             #if self.xyz['z'] < self.lower_height:
             if (
                     (
-                        (self.xyz['z'] - self.cfg.lower_height) <
+                        (self.xyz['z'] - lower_height) <
                         self.cfg.height_slop) and
                     self.angles['calf'] > self.cfg.loaded_weight):
+                self.touchdown(self.xyz)
                 new_state = 'wait'
         elif self.state == 'wait':
             if self.restriction['dr'] > 0.:
@@ -332,9 +613,11 @@ class Foot(signaler.Signaler):
                     self.angles['calf'] < self.cfg.unloaded_weight):
                 self.unloaded_height = self.xyz['z']
             if (
-                    self.unloaded_height is not None and
-                    self.xyz['z'] > (
-                        self.unloaded_height + self.cfg.lift_height)):
+                    self.unloaded_height is not None and (
+                        self.cfg.swing_trajectory or
+                        self.xyz['z'] > (
+                            self.unloaded_height + self.cfg.lift_height))):
+                # a swing trajectory continues lifting from unloaded
                 new_state = 'swing'
             #if self.xyz['z'] > self.lift_height:
             #    new_state = 'swing'
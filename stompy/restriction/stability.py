@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Support polygon and stability margin
+
+Foot positions (leg frame) are transformed to the body frame together,
+the support polygon is the convex hull of the feet in stance (or wait)
+and the stability margin is the signed distance from the center of mass
+to the closest polygon edge (positive inside, negative outside,
+-inf with fewer than 3 supporting feet).
+"""
+
+import numpy
+
+from .. import kinematics
+from .. import signaler
+
+
+SUPPORT_STATES = ('stance', 'wait')
+
+
+def convex_hull(xy):
+    """Indices of the counterclockwise convex hull of (n, 2) points"""
+    xy = numpy.asarray(xy, dtype='f8')
+    order = numpy.lexsort((xy[:, 1], xy[:, 0]))
+
+    def cross(o, a, b):
+        return (
+            (xy[a, 0] - xy[o, 0]) * (xy[b, 1] - xy[o, 1]) -
+            (xy[a, 1] - xy[o, 1]) * (xy[b, 0] - xy[o, 0]))
+
+    # monotone chain
+    lower = []
+    for i in order:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], i) <= 0:
+            lower.pop()
+        lower.append(i)
+    upper = []
+    for i in order[::-1]:
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], i) <= 0:
+            upper.pop()
+        upper.append(i)
+    return lower[:-1] + upper[:-1]
+
+
+def support_margin(xy, com=(0., 0.)):
+    """Signed distance from com to the edge of the convex hull of xy"""
+    xy = numpy.asarray(xy, dtype='f8').reshape((-1, 2))
+    if len(xy) < 3:
+        return -numpy.inf
+    hull = xy[convex_hull(xy)]
+    if len(hull) < 3:
+        return -numpy.inf
+    e = numpy.roll(hull, -1, axis=0) - hull
+    c = numpy.asarray(com, dtype='f8') - hull
+    # distance to each edge line, positive on the inside (left)
+    d = (e[:, 0] * c[:, 1] - e[:, 1] * c[:, 0]) / numpy.hypot(
+        e[:, 0], e[:, 1])
+    return d.min()
+
+
+class SupportPolygon(signaler.Signaler):
+    """Track foot positions and the stability margin of supporting feet"""
+    def __init__(self, leg_numbers, com=(0., 0.)):
+        super(SupportPolygon, self).__init__()
+        self.leg_numbers = list(leg_numbers)
+        self.index = {ln: i for (i, ln) in enumerate(self.leg_numbers)}
+        self.com = com
+        self.transforms = numpy.array([
+            numpy.asarray(kinematics.body.leg_to_body_transforms[ln])
+            for ln in self.leg_numbers])
+        # latest foot positions, nan until a position is set
+        n = len(self.leg_numbers)
+        self.leg_xyz = numpy.empty((n, 3))
+        self.leg_xyz.fill(numpy.nan)
+        self.body_xyz = numpy.empty((n, 3))
+        self.body_xyz.fill(numpy.nan)
+        self._dirty = False
+        self.support_legs = []
+        self.margin = -numpy.inf
+
+    def set_position(self, leg_number, xyz):
+        """Set leg frame foot position (xyz dict)"""
+        self.leg_xyz[self.index[leg_number]] = (
+            xyz['x'], xyz['y'], xyz['z'])
+        self._dirty = True
+
+    def _transform(self):
+        if not self._dirty:
+            return
+        p = numpy.ones((len(self.leg_numbers), 4))
+        p[:, :3] = self.leg_xyz
+        self.body_xyz = numpy.einsum(
+            'nij,nj->ni', self.transforms, p)[:, :3]
+        self._dirty = False
+
+    def supporting(self, states, exclude=None):
+        """Legs supporting the body (in a support state with a position)"""
+        if exclude is None:
+            exclude = ()
+        return [
+            ln for ln in self.leg_numbers
+            if states.get(ln) in SUPPORT_STATES and ln not in exclude and
+            not numpy.isnan(self.leg_xyz[self.index[ln], 0])]
+
+    def compute_margin(self, states, exclude=None):
+        """Margin of the legs in support states, minus any in exclude"""
+        self._transform()
+        lns = self.supporting(states, exclude)
+        rows = [self.index[ln] for ln in lns]
+        return support_margin(self.body_xyz[rows, :2], self.com)
+
+    def update(self, states, t=None):
+        """Recompute the margin for foot states and signal 'margin'"""
+        self.support_legs = self.supporting(states)
+        self.margin = self.compute_margin(states)
+        self.trigger('margin', {
+            'time': t, 'margin': self.margin,
+            'support_legs': self.support_legs})
+        return self.margin
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+"""
+Sweep restriction config parameters in headless simulations
+
+Each simulation runs a restriction.body.Body on fake legs with a
+simulated clock (faster than real time) following a scripted joystick
+path. Configs are generated from a grid or by random search, run in a
+process pool and ranked by:
+    - joint limit violations (fewer is better)
+    - body speed (inches / second walked, higher is better)
+    - number of halts (fewer is better)
+    - minimum stability margin (see stability, higher is better)
+The closest any foot came to the edge of its workspace (see
+kinematics.reach) is also reported.
+
+python -m stompy sweep -P r_thresh=0.2,0.3,0.4 -P speeds.swing=12,16
+python -m stompy sweep -P r_thresh=0.2:0.5 -P eps=0.5:2 -N 50
+
+Parameters are RestrictionConfig attribute names, speeds are set with
+speeds.<mode>.
+"""
+
+import csv
+import itertools
+import logging
+import multiprocessing
+import os
+import random
+import sys
+
+import numpy
+
+from .. import consts
+from .. import kinematics
+from ..leg import teensy
+from . import body
+
+
+# joystick paths: list of (duration, x, y) with x and y in -1 to 1
+PATHS = {
+    'forward': [(30., 0., 1.)],
+    'arc': [(30., 0.5, 1.)],
+    'turn': [(30., 1., 0.)],
+    'mixed': [(10., 0., 1.), (10., 0.5, 1.), (10., -0.5, 1.)],
+}
+
+COLUMNS = [
+    'rank', 'speed', 'halts', 'halted', 'min_margin', 'min_reach',
+    'min_clearance', 'violations']
+
+
+def set_parameter(cfg, name, value):
+    if name.startswith('speeds.'):
+        cfg.speeds[name.split('.', 1)[1]] = value
+    elif not hasattr(cfg, name):
+        raise ValueError("Unknown restriction parameter: %s" % name)
+    else:
+        setattr(cfg, name, value)
+
+
+def default_value(name):
+    """Default RestrictionConfig value of parameter name"""
+    c = body.cfg.RestrictionConfig()
+    if name.startswith('speeds.'):
+        return c.speeds[name.split('.', 1)[1]]
+    if not hasattr(c, name):
+        raise ValueError("Unknown restriction parameter: %s" % name)
+    return getattr(c, name)
+
+
+def parse_value(s, default=None):
+    """Parse s as the type of the parameter default (number if None)"""
+    s = s.strip()
+    if s.lower() == 'none':
+        return None
+    if isinstance(default, bool):
+        if s.lower() in ('1', 'true', 'yes', 'on'):
+            return True
+        if s.lower() in ('0', 'false', 'no', 'off'):
+            return False
+        raise ValueError("Invalid bool parameter value: %s" % s)
+    if isinstance(default, int):
+        return int(s)
+    if isinstance(default, float):
+        return float(s)
+    try:
+        return int(s)
+    except ValueError:
+        return float(s)
+
+
+def parse_parameters(specs):
+    """Parse name=v0,v1,... (grid) or name=low:high (random) specs
+
+    Values are parsed as the type of the parameter's default value
+    (e.g. predictive=False is a bool)
+    """
+    grid = {}
+    ranges = {}
+    for spec in specs or []:
+        name, values = spec.split('=', 1)
+        default = default_value(name)
+        if ':' in values:
+            if isinstance(default, bool):
+                raise ValueError(
+                    "Bool parameter %s can't be a range" % name)
+            low, high = values.split(':')
+            ranges[name] = (
+                parse_value(low, default), parse_value(high, default))
+        else:
+            grid[name] = [
+                parse_value(v, default) for v in values.split(',')]
+    return grid, ranges
+
+
+def grid_configs(grid):
+    names = sorted(grid)
+    return [
+        dict(zip(names, values)) for values in
+        itertools.product(*[grid[n] for n in names])]
+
+
+def random_configs(ranges, n, grid=None, seed=None):
+    """n random configs, ranges are sampled uniformly (ints stay ints)"""
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(n):
+        c = {}
+        for name in sorted(ranges):
+            low, high = ranges[name]
+            if isinstance(low, int) and isinstance(high, int):
+                c[name] = rng.randint(low, high)
+            else:
+                c[name] = rng.uniform(low, high)
+        if grid:
+            for name in sorted(grid):
+                c[name] = rng.choice(grid[name])
+        configs.append(c)
+    return configs
+
+
+def joystick_target(res, x, y):
+    """BodyTarget for joystick x, y (see MultiLeg.set_target)"""
+    from ..controllers import multileg
+    crx = multileg.axis_to_radius(x)
+    rs = res.calc_stance_speed((crx, 0.), max(y, abs(x))) * numpy.sign(crx)
+    return body.BodyTarget((crx, 0.), rs, 0.)
+
+
+class Simulation(object):
+    def __init__(self, params=None, leg_numbers=None, dt=0.05):
+        if leg_numbers is None:
+            leg_numbers = [
+                consts.LEG_FL, consts.LEG_ML, consts.LEG_RL,
+                consts.LEG_RR, consts.LEG_MR, consts.LEG_FR]
+        self.dt = dt
+        self.t = 0.
+        self.legs = {
+            ln: teensy.FakeTeensy(ln) for ln in leg_numbers}
+        # feet read the simulated clock so lift timing doesn't depend
+        # on how fast the host runs the simulation
+        self.res = body.Body(self.legs, clock=self.clock)
+        for name in sorted(params or {}):
+            set_parameter(self.res.cfg, name, params[name])
+        self.violations = 0
+        for ln in self.legs:
+            l = self.legs[ln]
+            l._position_noise = 0.
+            l.on('estop', self.on_estop)
+        self._quiet_logs()
+
+    def clock(self):
+        return self.t
+
+    def _quiet_logs(self):
+        # drop events logged during setup and don't log the simulation
+        loggers = [self.res.logger]
+        for ln in self.legs:
+            loggers.append(self.legs[ln].log)
+            loggers.append(self.res.feet[ln].logger)
+        for l in loggers:
+            l.level = logging.CRITICAL + 1
+            l._events = []
+
+    def on_estop(self, value):
+        if value == consts.ESTOP_HOLD:
+            self.violations += 1
+
+    def stand(self):
+        """Put all feet down at lower_height with a vertical calf"""
+        cfg = self.res.cfg
+        z = cfg.lower_height
+        x = kinematics.leg.x_with_calf_angle(z, cfg.target_calf_angle)
+        for ln in self.legs:
+            l = self.legs[ln]
+            l.xyz.update({'x': x, 'y': 0., 'z': z})
+            l._follow_plan(self.t, 0.)
+            l.set_estop(consts.ESTOP_OFF)
+        for ln in self.res.feet:
+            self.res.feet[ln].state = 'stance'
+        self.res.enable(None)
+
+    def tick(self):
+        self.t += self.dt
+        for ln in self.legs:
+            l = self.legs[ln]
+            l._follow_plan(self.t, self.dt)
+            l.trigger('angles', l.angles)
+            l.trigger('xyz', l.xyz)
+        self.res.step()
+
+    def reach_margin(self):
+        """Smallest distance of any foot to its workspace boundary"""
+        return min([
+            self.res.feet[ln].reach_map.margin([(
+                self.legs[ln].xyz['x'], self.legs[ln].xyz['y'],
+                self.legs[ln].xyz['z'])])[0]
+            for ln in self.legs])
+
+    def run(self, path):
+        """Follow path [(duration, x, y), ...], returns stats dict"""
+        self.stand()
+        distance = 0.
+        halts = 0
+        halted_time = 0.
+        min_margin = numpy.inf
+        min_reach = numpy.inf
+        min_clearance = numpy.inf
+        duration = 0.
+        for (seg_duration, x, y) in path:
+            self.res.set_target(joystick_target(self.res, x, y))
+            end = self.t + seg_duration
+            while self.t < end:
+                was_halted = self.res.halted
+                self.tick()
+                if self.res.halted:
+                    halted_time += self.dt
+                    if not was_halted:
+                        halts += 1
+                else:
+                    target = self.res.target
+                    # speed is radians per plan tick
+                    distance += abs(
+                        target.speed *
+                        numpy.hypot(*target.rotation_center) *
+                        self.dt / consts.PLAN_TICK)
+                min_margin = min(min_margin, self.res.support.margin)
+                min_reach = min(min_reach, self.reach_margin())
+                min_clearance = min(
+                    min_clearance,
+                    numpy.nanmin(self.res.foot_index.foot_distances()))
+            duration += seg_duration
+        return {
+            'speed': distance / duration,
+            'halts': halts,
+            'halted': halted_time / duration,
+            'min_margin': min_margin,
+            'min_reach': min_reach,
+            'min_clearance': min_clearance,
+            'violations': self.violations,
+        }
+
+
+def simulate(params, path='forward', dt=0.05, quiet=True):
+    """Run one simulation of params on a named (or given) path"""
+    if not isinstance(path, (list, tuple)):
+        path = PATHS[path]
+    stdout = sys.stdout
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        return Simulation(params, dt=dt).run(path)
+    finally:
+        if quiet:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+
+def evaluate(args):
+    """Run params on all paths, combine results (for Pool.imap)"""
+    index, params, paths, dt = args
+    results = [simulate(params, path, dt) for path in paths]
+    return index, {
+        'speed': numpy.mean([r['speed'] for r in results]),
+        'halts': sum([r['halts'] for r in results]),
+        'halted': numpy.mean([r['halted'] for r in results]),
+        'min_margin': min([r['min_margin'] for r in results]),
+        'min_reach': min([r['min_reach'] for r in results]),
+        'min_clearance': min([r['min_clearance'] for r in results]),
+        'violations': sum([r['violations'] for r in results]),
+    }
+
+
+def rank_key(result):
+    return (
+        result['violations'], -result['speed'], result['halts'],
+        -result['min_margin'])
+
+
+def sweep(configs, paths=None, dt=0.05, processes=None):
+    """Simulate configs, returns [(params, result), ...] best first"""
+    if paths is None:
+        paths = ['forward']
+    jobs = [(i, c, paths, dt) for (i, c) in enumerate(configs)]
+    results = [None] * len(configs)
+    pool = multiprocessing.Pool(processes)
+    try:
+        for (n, (i, r)) in enumerate(pool.imap_unordered(evaluate, jobs)):
+            results[i] = r
+            print("%i/%i: %s %s" % (n + 1, len(jobs), configs[i], r))
+    finally:
+        pool.close()
+        pool.join()
+    ranked = sorted(zip(configs, results), key=lambda cr: rank_key(cr[1]))
+    for (i, (c, r)) in enumerate(ranked):
+        r['rank'] = i + 1
+    return ranked
+
+
+def write_table(ranked, filename):
+    names = sorted(set(itertools.chain(*[c.keys() for (c, r) in ranked])))
+    with open(filename, 'w') as f:
+        w = csv.writer(f)
+        w.writerow(COLUMNS + names)
+        for (c, r) in ranked:
+            w.writerow([r[k] for k in COLUMNS] + [c.get(n) for n in names])
+
+
+def format_value(v):
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return '%12.4g' % v
+    return '%12s' % (v, )
+
+
+def format_table(ranked, n=10):
+    names = sorted(set(itertools.chain(*[c.keys() for (c, r) in ranked])))
+    lines = [' '.join(
+        ['%4s %6s %5s %6s %7s %4s' % (
+            'rank', 'speed', 'halts', 'halted', 'margin', 'viol')] +
+        ['%12s' % name[-12:] for name in names])]
+    for (c, r) in ranked[:n]:
+        lines.append(' '.join(
+            ['%4i %6.2f %5i %6.2f %7.1f %4i' % (
+                r['rank'], r['speed'], r['halts'], r['halted'],
+                r['min_margin'], r['violations'])] +
+            [format_value(c.get(name, '-')) for name in names]))
+    return '\n'.join(lines)
+
+
+def run(
+        specs, n_random=None, paths=None, output='sweep.csv',
+        processes=None, seed=None):
+    grid, ranges = parse_parameters(specs)
+    if n_random:
+        configs = random_configs(ranges, n_random, grid, seed)
+    else:
+        if len(ranges):
+            raise ValueError(
+                "Parameter ranges (low:high) require a random search")
+        configs = grid_configs(grid)
+    if paths is None:
+        paths = ['forward']
+    print("Simulating %i configs on paths %s" % (len(configs), paths))
+    ranked = sweep(configs, paths, processes=processes)
+    write_table(ranked, output)
+    print(format_table(ranked))
+    print("Results written to %s" % output)
+    return ranked
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Ground height map built from foot touchdowns
+
+Touchdown points (body frame) are binned into a 2D grid. Each cell keeps
+a weighted mean height and the weight decays exponentially with time so
+old touchdowns (the body has moved since) are forgotten. Queries look up
+the cell under a point and its neighbors and return the weighted mean
+height or None if there is not enough (recent) data.
+"""
+
+import numpy
+
+
+class HeightMap(object):
+    def __init__(
+            self, resolution=6., extent=180., decay=20., min_weight=0.5):
+        """
+        resolution: cell size (inches)
+        extent: map covers -extent to extent in x and y (inches)
+        decay: time constant of weight decay (seconds)
+        min_weight: queries with less (decayed) weight return None
+        """
+        self.resolution = float(resolution)
+        self.extent = float(extent)
+        self.decay = float(decay)
+        self.min_weight = min_weight
+        self.n = int(numpy.ceil(2 * self.extent / self.resolution))
+        self.clear()
+
+    def clear(self):
+        self.height = numpy.zeros((self.n, self.n))
+        self.weight = numpy.zeros((self.n, self.n))
+        self.time = numpy.zeros((self.n, self.n))
+        self.n_touchdowns = 0
+
+    def cell(self, x, y):
+        """Grid index for body point x, y (None if outside the map)"""
+        i = int((x + self.extent) // self.resolution)
+        j = int((y + self.extent) // self.resolution)
+        if i < 0 or j < 0 or i >= self.n or j >= self.n:
+            return None
+        return i, j
+
+    def _decayed(self, s, t):
+        return self.weight[s] * numpy.exp(-(t - self.time[s]) / self.decay)
+
+    def add(self, x, y, z, t):
+        """Add a touchdown at body x, y, z at time t"""
+        c = self.cell(x, y)
+        if c is None:
+            return
+        w = self._decayed(c, t)
+        self.height[c] = (self.height[c] * w + z) / (w + 1.)
+        self.weight[c] = w + 1.
+        self.time[c] = t
+        self.n_touchdowns += 1
+
+    def query(self, x, y, t):
+        """Expected ground height at body x, y at time t (or None)"""
+        c = self.cell(x, y)
+        if c is None:
+            return None
+        i, j = c
+        s = (slice(max(0, i - 1), i + 2), slice(max(0, j - 1), j + 2))
+        w = self._decayed(s, t)
+        tw = w.sum()
+        if tw < self.min_weight:
+            return None
+        return float((self.height[s] * w).sum() / tw)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Swing trajectories
+
+A swing is precomputed as evenly spaced waypoints (leg frame) along a
+cubic bezier that rises vertically from the lift off point, crosses to
+above the swing target at peak height and descends vertically toward the
+ground. The whole path is checked against the joint limits before it is
+used.
+
+The trajectory is streamed to the leg as target plans to a waypoint
+lookahead waypoints beyond the one nearest the foot, so lift, swing and
+the start of lower blend into one motion without waiting on thresholds
+between them.
+"""
+
+import numpy
+
+from .. import geometry
+from .. import kinematics
+
+
+def bezier(p0, p1, p2, p3, n):
+    """n points along a cubic bezier with control points p0 - p3"""
+    u = numpy.linspace(0., 1., n)[:, numpy.newaxis]
+    v = 1. - u
+    return (
+        v * v * v * p0 + 3. * v * v * u * p1 + 3. * v * u * u * p2 +
+        u * u * u * p3)
+
+
+def resample(pts, spacing):
+    """Resample a polyline to points spacing apart (keeps the end points)"""
+    d = numpy.sqrt((numpy.diff(pts, axis=0) ** 2.).sum(axis=1))
+    s = numpy.concatenate(([0.], numpy.cumsum(d)))
+    n = max(2, int(numpy.ceil(s[-1] / spacing)) + 1)
+    si = numpy.linspace(0., s[-1], n)
+    return numpy.column_stack([
+        numpy.interp(si, s, pts[:, i]) for i in range(pts.shape[1])])
+
+
+def swing_path(start, end, peak_z, spacing=1.0, n_samples=200):
+    """Waypoints from start (x, y, z) to end (x, y, z) via peak_z
+
+    The path leaves start and arrives at end vertically and reaches
+    peak_z (if above start and end) halfway.
+    """
+    p0 = numpy.asarray(start, dtype='f8')
+    p3 = numpy.asarray(end, dtype='f8')
+    peak_z = max(peak_z, p0[2], p3[2])
+    # bezier z at u = 0.5 is (z0 + 6 zc + z3) / 8
+    zc = (8. * peak_z - p0[2] - p3[2]) / 6.
+    p1 = numpy.array([p0[0], p0[1], zc])
+    p2 = numpy.array([p3[0], p3[1], zc])
+    return resample(bezier(p0, p1, p2, p3, n_samples), spacing)
+
+
+def in_limits(leg_number, pts):
+    """True if all points are reachable within the joint limits"""
+    pts = numpy.asarray(pts)
+    with numpy.errstate(invalid='ignore'):
+        angles = kinematics.leg.point_to_angles(
+            pts[:, 0], pts[:, 1], pts[:, 2])
+    limits = geometry.get_limits(leg_number)
+    for (j, a) in zip(('hip', 'thigh', 'knee'), angles):
+        jmin, jmax = limits[j]
+        if numpy.any(numpy.isnan(a)) or a.min() < jmin or a.max() > jmax:
+            return False
+    return True
+
+
+class SwingTrajectory(object):
+    def __init__(self, waypoints, lookahead=3):
+        self.waypoints = numpy.asarray(waypoints)
+        self.lookahead = lookahead
+        self.index = 0
+
+    @property
+    def end(self):
+        return self.waypoints[-1]
+
+    @property
+    def target(self):
+        """Waypoint to send as the plan target"""
+        return self.waypoints[
+            min(self.index + self.lookahead, len(self.waypoints) - 1)]
+
+    def advance(self, xyz):
+        """Move index to the waypoint nearest xyz (never backwards)
+
+        Returns True if the plan target changed
+        """
+        p = numpy.array([xyz['x'], xyz['y'], xyz['z']])
+        # only look as far as the current target
+        stop = min(self.index + self.lookahead, len(self.waypoints) - 1)
+        w = self.waypoints[self.index:stop + 1]
+        i = self.index + int(((w - p) ** 2.).sum(axis=1).argmin())
+        if i == self.index:
+            return False
+        old_target = self.target
+        self.index = i
+        return not numpy.array_equal(old_target, self.target)
+
+    def is_done(self, xyz, slop):
+        p = numpy.array([xyz['x'], xyz['y'], xyz['z']])
+        return (
+            self.index + self.lookahead >= len(self.waypoints) - 1 and
+            numpy.sqrt(((self.end - p) ** 2.).sum()) < slop)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+"""
+Deadline scheduler for periodic and one-shot work
+
+Components (leg and body heartbeats, joystick reports, ui repaints...)
+register tasks with a scheduler, usually the module level default, and
+whoever owns the control loop calls run() once per tick. Deadlines are
+kept in a heap so a tick with nothing due only looks at the top of the heap.
+
+Due tasks run in priority order (lowest number first). If a tick runs past
+the scheduler budget, remaining tasks are deferred to the next tick except
+for heartbeats which always run. A task is never deferred twice in a row
+so low priority tasks are delayed but not starved. Periodic tasks keep
+their phase and skip missed periods instead of running several times to
+catch up.
+
+Lateness (time run - deadline) is recorded for every task. A task that
+raises is logged and counted (errors) and rescheduled like any other,
+it does not stop the other due tasks (e.g. the other legs' heartbeats).
+
+Tasks of long lived objects (legs, bodies, joysticks) hold their bound
+method weakly (weak=True) so the scheduler does not keep the object
+alive, the task is cancelled once the object is collected. Objects that
+can also be driven without a scheduler (scripts calling update) check
+running() and do the work themselves when no scheduler is running.
+"""
+
+import heapq
+import itertools
+import logging
+import time
+
+from . import signaler
+from . import utils
+
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HEARTBEAT = 0
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 20
+PRIORITY_LOW = 30
+
+
+class Task(object):
+    def __init__(
+            self, func, period=None, name=None, priority=PRIORITY_NORMAL,
+            weak=False):
+        """If weak func must be a bound method, the task is cancelled
+        when its object is collected"""
+        if name is None:
+            name = getattr(func, '__name__', repr(func))
+        if weak:
+            func = signaler.WeakCallback(func, lambda cb: self.cancel())
+        self.func = func
+        self.period = period
+        self.name = name
+        self.priority = priority
+        self.deadline = None
+        self.cancelled = False
+        self.lateness = utils.StatsMonitor()
+        self.n_runs = 0
+        self.n_deferred = 0
+        self.n_skipped = 0
+        self.n_errors = 0
+        self._deferred = False
+
+    @property
+    def periodic(self):
+        return self.period is not None
+
+    def cancel(self):
+        self.cancelled = True
+
+    def reset_stats(self):
+        self.lateness.reset()
+        self.n_runs = 0
+        self.n_deferred = 0
+        self.n_skipped = 0
+        self.n_errors = 0
+
+    def __repr__(self):
+        return "%s(%s, period=%s, priority=%s)" % (
+            self.__class__.__name__, self.name, self.period, self.priority)
+
+
+class Scheduler(object):
+    def __init__(self, budget=None, clock=time.time):
+        # max seconds per run for non-heartbeat tasks (None = no limit)
+        self.budget = budget
+        self.clock = clock
+        self.tasks = []
+        self._heap = []
+        self._counter = itertools.count()
+        self.n_overruns = 0
+        # time of the last call to run (None if never run)
+        self.last_run = None
+
+    def _push(self, task):
+        heapq.heappush(self._heap, (task.deadline, next(self._counter), task))
+
+    def add(self, task, deadline):
+        task.deadline = deadline
+        task.cancelled = False
+        if task not in self.tasks:
+            self.tasks.append(task)
+        self._push(task)
+        return task
+
+    def every(
+            self, period, func, name=None, priority=PRIORITY_NORMAL,
+            delay=None, weak=False):
+        """Run func every period seconds, first run after delay [period]"""
+        if delay is None:
+            delay = period
+        return self.add(
+            Task(func, period, name, priority, weak), self.clock() + delay)
+
+    def after(
+            self, delay, func, name=None, priority=PRIORITY_NORMAL,
+            weak=False):
+        """Run func once after delay seconds"""
+        return self.add(
+            Task(func, None, name, priority, weak), self.clock() + delay)
+
+    def cancel(self, task):
+        # removed from the heap when it comes due
+        task.cancel()
+        if task in self.tasks:
+            self.tasks.remove(task)
+
+    def running(self, timeout):
+        """True if run was called within the last timeout seconds"""
+        return (
+            self.last_run is not None and
+            (self.clock() - self.last_run) < timeout)
+
+    @property
+    def next_deadline(self):
+        heap = self._heap
+        while len(heap) and heap[0][2].cancelled:
+            heapq.heappop(heap)
+        if len(heap) == 0:
+            return None
+        return heap[0][0]
+
+    def _reschedule(self, task, t):
+        if task.cancelled:
+            # cancelled while running (or its object was collected)
+            if task in self.tasks:
+                self.tasks.remove(task)
+            return
+        if not task.periodic:
+            if task in self.tasks:
+                self.tasks.remove(task)
+            return
+        deadline = task.deadline + task.period
+        if deadline <= t:
+            # fell behind by more than a period, skip missed runs
+            n = int((t - task.deadline) / task.period)
+            task.n_skipped += n
+            deadline = task.deadline + (n + 1) * task.period
+        task.deadline = deadline
+        self._push(task)
+
+    def run(self, t=None):
+        """Run all due tasks, returns the number of tasks run"""
+        if t is None:
+            t = self.clock()
+        self.last_run = t
+        heap = self._heap
+        if len(heap) == 0 or heap[0][0] > t:
+            return 0
+        due = []
+        while len(heap) and heap[0][0] <= t:
+            task = heapq.heappop(heap)[2]
+            if not task.cancelled:
+                due.append(task)
+        due.sort(key=lambda task: (task.priority, task.deadline))
+        n = 0
+        over = False
+        for task in due:
+            if (
+                    not over and self.budget is not None and
+                    (self.clock() - t) > self.budget):
+                over = True
+                self.n_overruns += 1
+            if (
+                    over and task.priority > PRIORITY_HEARTBEAT and
+                    not task._deferred):
+                task._deferred = True
+                task.n_deferred += 1
+                self._push(task)
+                continue
+            task._deferred = False
+            now = self.clock()
+            task.lateness.update(now - task.deadline)
+            task.n_runs += 1
+            n += 1
+            try:
+                task.func()
+            except Exception:
+                task.n_errors += 1
+                logger.exception("Scheduled task %s failed" % task.name)
+            self._reschedule(task, now)
+        return n
+
+    def stats(self):
+        return {
+            task.name: {
+                'period': task.period,
+                'priority': task.priority,
+                'runs': task.n_runs,
+                'deferred': task.n_deferred,
+                'skipped': task.n_skipped,
+                'errors': task.n_errors,
+                'lateness': {
+                    'mean': task.lateness.mean,
+                    'min': task.lateness.min,
+                    'max': task.lateness.max,
+                },
+            } for task in self.tasks}
+
+    def reset_stats(self):
+        self.n_overruns = 0
+        for task in self.tasks:
+            task.reset_stats()
+
+    def __str__(self):
+        lines = ["%s[tasks=%i, overruns=%i]" % (
+            self.__class__.__name__, len(self.tasks), self.n_overruns)]
+        for task in sorted(self.tasks, key=lambda task: task.priority):
+            lines.append(
+                "  %s: runs=%i deferred=%i skipped=%i errors=%i "
+                "lateness=%s" % (
+                    task.name, task.n_runs, task.n_deferred, task.n_skipped,
+                    task.n_errors, task.lateness))
+        return '\n'.join(lines)
+
+
+# shared by all components, run once per control loop tick
+default = Scheduler(budget=0.005)
@@ -1,20 +1,160 @@
 #!/usr/bin/env python
+"""
+Named event callbacks
+
+Callbacks are kept per event as a tuple (rebuilt on on/remove_on, not
+on trigger). Bound methods can be registered weakly (on(..., weak=True))
+so the signaler doesn't keep their object alive, they are removed when
+the object is collected.
+
+Events can be deferred to an EventQueue (defer), the queue keeps only
+the latest arguments of each event of each signaler until it is flushed
+(e.g. once per control loop tick), without a queue events are triggered
+immediately.
+
+Dispatches are counted per event, with the profiler enabled dispatch
+time is also recorded (see event_stats).
+"""
+
+import collections
+import weakref
+
+from . import profiler
+
+
+# checked on every trigger
+_profiler = profiler.default
+
+
+class WeakCallback(object):
+    """Call a bound method without keeping its object alive"""
+    def __init__(self, method, on_dead):
+        self.ref = weakref.ref(method.__self__)
+        self.func = method.__func__
+        self.on_dead = on_dead
+
+    def __call__(self, *args, **kwargs):
+        obj = self.ref()
+        if obj is None:
+            self.on_dead(self)
+            return
+        return self.func(obj, *args, **kwargs)
+
+    def __eq__(self, other):
+        if isinstance(other, WeakCallback):
+            return self.ref == other.ref and self.func is other.func
+        return (
+            getattr(other, '__func__', None) is self.func and
+            getattr(other, '__self__', None) is self.ref())
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = object.__hash__
+
+
+class EventQueue(object):
+    """Deferred events coalesced by signaler and event name"""
+    def __init__(self):
+        self._events = collections.OrderedDict()
+        self.n_deferred = 0
+        self.n_coalesced = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def put(self, signaler, name, args):
+        key = (signaler, name)
+        if key in self._events:
+            # keeps the position of the first event
+            self.n_coalesced += 1
+        self._events[key] = args
+        self.n_deferred += 1
+
+    def flush(self):
+        """Trigger all queued events, returns the number triggered"""
+        events = self._events
+        self._events = collections.OrderedDict()
+        for ((s, name), args) in events.items():
+            s.trigger(name, *args)
+        return len(events)
+
+    def reset_stats(self):
+        self.n_deferred = 0
+        self.n_coalesced = 0
+
+    def __str__(self):
+        return "%s[deferred=%i, coalesced=%i]" % (
+            self.__class__.__name__, self.n_deferred, self.n_coalesced)
 
 
 class Signaler(object):
+    # events passed to defer are queued here (if not None)
+    event_queue = None
+
     def __init__(self):
         self._callbacks = {}
+        self._counts = collections.defaultdict(int)
+        self._times = collections.defaultdict(float)
 
-    def on(self, name, func):
-        self._callbacks[name] = self._callbacks.get(name, []) + [func, ]
+    def on(self, name, func, weak=False):
+        """Call func on event name, if weak func must be a bound method
+        and is removed when its object is collected"""
+        if weak:
+            if getattr(func, '__self__', None) is None:
+                raise ValueError(
+                    "Weak callbacks must be bound methods: %s" % (func, ))
+            func = WeakCallback(
+                func, lambda cb, name=name: self.remove_on(name, cb))
+        self._callbacks[name] = self._callbacks.get(name, ()) + (func, )
 
     def remove_on(self, name, func):
-        if name not in self._callbacks:
-            return
-        if func not in self._callbacks[name]:
-            return
-        self._callbacks[name].remove(func)
+        cbs = self._callbacks.get(name, ())
+        for (i, cbf) in enumerate(cbs):
+            if cbf is func or cbf == func:
+                cbs = cbs[:i] + cbs[i + 1:]
+                if len(cbs):
+                    self._callbacks[name] = cbs
+                else:
+                    del self._callbacks[name]
+                return
 
     def trigger(self, name, *args, **kwargs):
-        for cbf in self._callbacks.get(name, []):
+        cbs = self._callbacks.get(name)
+        if cbs is None:
+            return
+        self._counts[name] += 1
+        if _profiler.enabled:
+            return self._timed_trigger(name, cbs, args, kwargs)
+        if kwargs:
+            for cbf in cbs:
+                cbf(*args, **kwargs)
+        else:
+            for cbf in cbs:
+                cbf(*args)
+
+    def _timed_trigger(self, name, cbs, args, kwargs):
+        p = _profiler
+        t0 = p.clock()
+        for cbf in cbs:
             cbf(*args, **kwargs)
+        dt = p.clock() - t0
+        self._times[name] += dt
+        p.record('signal.%s.%s' % (self.__class__.__name__, name), dt)
+
+    def defer(self, name, *args):
+        """Queue event name on event_queue (replacing an already queued
+        event name), trigger now if there is no queue"""
+        if self.event_queue is None:
+            return self.trigger(name, *args)
+        self.event_queue.put(self, name, args)
+
+    def event_stats(self):
+        """Dispatch count and total time (while profiling) per event"""
+        return {
+            name: {'count': n, 'time': self._times.get(name, 0.)}
+            for (name, n) in self._counts.items()}
+
+    def reset_event_stats(self):
+        self._counts.clear()
+        self._times.clear()
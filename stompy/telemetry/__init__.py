@@ -0,0 +1,9 @@
+#!/usr/bin/env python
+
+from . import dashboard
+from . import shm
+from . import snapshot
+from . import udp
+
+
+__all__ = ['dashboard', 'shm', 'snapshot', 'udp']
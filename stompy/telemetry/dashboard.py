@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Headless text dashboard for udp telemetry
+
+python -m stompy dashboard -a 239.255.76.67:7667
+"""
+
+import sys
+import time
+
+from .. import consts
+from . import snapshot
+from . import udp
+
+
+CLEAR = '\x1b[2J\x1b[H'
+
+
+def _f(v, fmt='%7.2f'):
+    if v is None or v != v:  # nan
+        return ' ' * (len(fmt % 0.) - 1) + '-'
+    return fmt % v
+
+
+def format_snapshot(s, subscriber=None):
+    lines = []
+    lines.append(
+        "seq: %i  mode: %s  leg: %s  estop: %s  deadman: %s  "
+        "halted: %s  speed: %.2f" % (
+            s['seq'], s['mode'],
+            consts.LEG_NAME_BY_NUMBER.get(s['leg_index'], None),
+            snapshot.estop_name(s['estop']), s['deadman'], s['halted'],
+            s['speed']))
+    b = s['body']
+    lines.append(
+        "psi: %s  rpm: %s  oil: %s  heading: %s %s %s" % (
+            _f(b['feed_pressure'], '%5.0f'), _f(b['engine_rpm'], '%5.0f'),
+            _f(b['feed_oil_temp'], '%6.1f'),
+            _f(b['heading'][0]), _f(b['heading'][1]), _f(b['heading'][2])))
+    lines.append('')
+    lines.append(
+        "%-12s %7s %7s %7s %7s %7s %7s %7s %5s %6s %s" % (
+            'leg', 'x', 'y', 'z', 'hip', 'thigh', 'knee', 'calf',
+            'r', 'dr', 'state'))
+    for ln in sorted(s['legs']):
+        l = s['legs'][ln]
+        xyz = l['xyz']
+        a = l['angles']
+        r = l['restriction']
+        if r is None:
+            r = {'r': None, 'dr': None}
+        lines.append(
+            "%-12s %s %s %s %s %s %s %s %s %s %s%s" % (
+                consts.LEG_NAME_BY_NUMBER.get(ln, ln),
+                _f(xyz['x']), _f(xyz['y']), _f(xyz['z']),
+                _f(a['hip']), _f(a['thigh']), _f(a['knee']),
+                _f(a['calf'], '%7.0f'),
+                _f(r['r'], '%5.2f'), _f(r['dr'], '%6.2f'),
+                l['state'],
+                '' if l['estop'] == consts.ESTOP_OFF else ' [estop]'))
+    if subscriber is not None:
+        lines.append('')
+        lines.append(
+            "received: %i  lost: %i  stale: %i  invalid: %i  age: %.2fs" % (
+                subscriber.n_received, subscriber.n_lost,
+                subscriber.n_stale, subscriber.n_invalid,
+                time.time() - subscriber.last_receive))
+    return '\n'.join(lines)
+
+
+def run(address=None, period=0.25, stream=None):
+    if stream is None:
+        stream = sys.stdout
+    sub = udp.Subscriber(address)
+    print("Listening for telemetry on %s:%s" % sub.address)
+    try:
+        while True:
+            sub.poll()
+            if sub.latest is not None:
+                stream.write(CLEAR + format_snapshot(sub.latest, sub) + '\n')
+                stream.flush()
+            time.sleep(period)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sub.close()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+"""
+Shared memory telemetry bus
+
+The controller writes a snapshot (see snapshot.py) every tick into a
+memory mapped ring of slots. Readers (the ui running in another process)
+map the ring read-only and read the newest slot at their own rate.
+
+Ring layout:
+    header: magic, version, n_slots, slot_size, count
+    slots: [seq, frame] * n_slots
+
+count is the number of frames written. Each slot starts with the sequence
+number of the frame it holds. The writer zeros the sequence, writes the
+frame and then sets the sequence. A reader checks the sequence before and
+after copying a frame, if either does not match the slot was overwritten
+during the read and the copy is discarded (like a seqlock).
+
+Commands (set mode, set leg, config edits) are sent back to the
+controller over a non-blocking unix datagram socket as json.
+"""
+
+import errno
+import json
+import logging
+import mmap
+import os
+import socket
+import struct
+import tempfile
+import time
+
+from .. import log
+from . import snapshot
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'STRB'
+VERSION = 1
+HEADER = struct.Struct('<4sHIIQ')
+SEQ = struct.Struct('<Q')
+COUNT_OFFSET = HEADER.size - SEQ.size
+
+if os.path.isdir('/dev/shm'):
+    default_directory = '/dev/shm'
+else:
+    default_directory = tempfile.gettempdir()
+default_filename = os.path.join(default_directory, 'stompy_telemetry')
+default_address = os.path.join(tempfile.gettempdir(), 'stompy_commands')
+
+# max size of a command datagram
+MAX_COMMAND_SIZE = 65536
+
+
+class RingWriter(object):
+    def __init__(
+            self, filename=None, n_slots=64, slot_size=snapshot.FRAME_SIZE):
+        if filename is None:
+            filename = default_filename
+        self.filename = filename
+        self.n_slots = n_slots
+        self.slot_size = slot_size
+        self._stride = slot_size + SEQ.size
+        size = HEADER.size + self._stride * n_slots
+        self._f = open(filename, 'w+b')
+        self._f.truncate(size)
+        self._mm = mmap.mmap(self._f.fileno(), size)
+        self.count = 0
+        self._mm[:HEADER.size] = HEADER.pack(
+            MAGIC, VERSION, n_slots, slot_size, self.count)
+
+    def write(self, data):
+        if len(data) != self.slot_size:
+            raise ValueError(
+                "Invalid ring data size %s != %s" %
+                (len(data), self.slot_size))
+        seq = self.count + 1
+        o = HEADER.size + (self.count % self.n_slots) * self._stride
+        e = o + SEQ.size + self.slot_size
+        mm = self._mm
+        # invalidate slot, write data, then validate
+        mm[o:o + SEQ.size] = SEQ.pack(0)
+        mm[o + SEQ.size:e] = data
+        mm[o:o + SEQ.size] = SEQ.pack(seq)
+        mm[COUNT_OFFSET:HEADER.size] = SEQ.pack(seq)
+        self.count = seq
+
+    def close(self, remove=True):
+        if self._mm is None:
+            return
+        self._mm.close()
+        self._f.close()
+        self._mm = None
+        if remove and os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+class RingReader(object):
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = default_filename
+        self.filename = filename
+        self._f = open(filename, 'rb')
+        self._mm = mmap.mmap(
+            self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_slots, slot_size, _ = HEADER.unpack(
+            self._mm[:HEADER.size])
+        if magic != MAGIC:
+            raise IOError("Invalid telemetry ring: %s" % filename)
+        if version != VERSION:
+            raise IOError(
+                "Telemetry ring version mismatch: %s != %s" %
+                (version, VERSION))
+        self.n_slots = n_slots
+        self.slot_size = slot_size
+        self._stride = slot_size + SEQ.size
+        self.last_count = 0
+        self.n_torn = 0
+
+    @property
+    def count(self):
+        return SEQ.unpack(self._mm[COUNT_OFFSET:HEADER.size])[0]
+
+    def _read_slot(self, seq):
+        o = HEADER.size + ((seq - 1) % self.n_slots) * self._stride
+        e = o + SEQ.size + self.slot_size
+        buf = self._mm[o:e]
+        if (
+                SEQ.unpack(buf[:SEQ.size])[0] != seq or
+                SEQ.unpack(self._mm[o:o + SEQ.size])[0] != seq):
+            self.n_torn += 1
+            return None
+        return buf[SEQ.size:]
+
+    def read_latest(self):
+        """Return newest frame or None if no new frame is available"""
+        count = self.count
+        if count == 0 or count == self.last_count:
+            return None
+        # the newest slot can be overwritten while reading,
+        # fall back to the one before it
+        for seq in (count, count - 1):
+            if seq < 1:
+                break
+            data = self._read_slot(seq)
+            if data is not None:
+                self.last_count = seq
+                return data
+        return None
+
+    def read_new(self):
+        """Return all frames written since the last read (oldest first)"""
+        count = self.count
+        first = max(self.last_count + 1, count - self.n_slots + 2, 1)
+        frames = []
+        for seq in range(first, count + 1):
+            data = self._read_slot(seq)
+            if data is not None:
+                frames.append(data)
+        self.last_count = count
+        return frames
+
+    def close(self):
+        if self._mm is None:
+            return
+        self._mm.close()
+        self._f.close()
+        self._mm = None
+
+
+def _bind_unix(address):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    if os.path.exists(address):
+        os.remove(address)
+    s.bind(address)
+    s.setblocking(False)
+    return s
+
+
+class CommandServer(object):
+    """Receive and apply ui commands to a controller
+
+    Commands are json encoded lists: [command, args, reply]
+    where reply is True if the sender is waiting for the result.
+    """
+    def __init__(self, controller, address=None):
+        if address is None:
+            address = default_address
+        self.controller = controller
+        self.address = address
+        self.socket = _bind_unix(address)
+        self.handlers = {
+            'set_mode': self.controller.set_mode,
+            'set_leg': self.controller.set_leg,
+            'set_speed': self.controller.set_speed,
+            'set_config': self.set_config,
+            'get_config': self.controller.get_config,
+            'compute_calf_zero': self.compute_calf_zero,
+        }
+
+    def set_config(self, path, value):
+        value = self.controller.set_config(path, value)
+        self.controller.trigger('config_updated')
+        return value
+
+    def compute_calf_zero(self, leg_number):
+        self.controller.legs[leg_number].compute_calf_zero()
+
+    def _handle(self, msg):
+        cmd, args, reply = json.loads(msg.decode('utf-8'))
+        log.info({'telemetry_command': (cmd, args)})
+        if cmd not in self.handlers:
+            raise ValueError("Unknown command: %s" % (cmd, ))
+        return self.handlers[cmd](*args), reply
+
+    def poll(self, max_commands=10):
+        """Handle up to max_commands pending commands, never blocks"""
+        for _ in range(max_commands):
+            try:
+                msg, addr = self.socket.recvfrom(MAX_COMMAND_SIZE)
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            try:
+                result, reply = self._handle(msg)
+                response = {'result': result}
+            except Exception as e:
+                logger.error("telemetry command error: %s" % (e, ))
+                response = {'error': str(e)}
+                reply = True
+            if reply and addr:
+                try:
+                    self.socket.sendto(
+                        json.dumps(response).encode('utf-8'), addr)
+                except socket.error as e:
+                    logger.error("telemetry reply error: %s" % (e, ))
+
+    def close(self):
+        self.socket.close()
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+
+class CommandClient(object):
+    def __init__(self, address=None):
+        if address is None:
+            address = default_address
+        self.address = address
+        self.local_address = os.path.join(
+            tempfile.gettempdir(), 'stompy_client_%i' % os.getpid())
+        self.socket = _bind_unix(self.local_address)
+
+    def send(self, cmd, *args):
+        self._send(cmd, args, False)
+
+    def _send(self, cmd, args, reply):
+        self.socket.sendto(
+            json.dumps([cmd, args, reply]).encode('utf-8'), self.address)
+
+    def request(self, cmd, args=(), timeout=0.25):
+        """Send a command and wait for the result"""
+        # drop any stale replies
+        try:
+            while True:
+                self.socket.recv(MAX_COMMAND_SIZE)
+        except socket.error:
+            pass
+        self._send(cmd, args, True)
+        t0 = time.time()
+        while time.time() - t0 < timeout:
+            try:
+                msg = self.socket.recv(MAX_COMMAND_SIZE)
+            except socket.error:
+                time.sleep(0.001)
+                continue
+            response = json.loads(msg.decode('utf-8'))
+            if 'error' in response:
+                raise ValueError(response['error'])
+            return response['result']
+        raise IOError("Timeout waiting for reply to %s" % (cmd, ))
+
+    def close(self):
+        self.socket.close()
+        if os.path.exists(self.local_address):
+            os.remove(self.local_address)
+
+
+class Publisher(object):
+    """Controller side of the bus, call update once per controller tick"""
+    def __init__(self, controller, filename=None, address=None, n_slots=64):
+        self.snapshot = snapshot.SnapshotBuilder(controller)
+        self.ring = RingWriter(filename, n_slots)
+        self.commands = CommandServer(controller, address)
+
+    def update(self):
+        self.commands.poll()
+        self.ring.write(self.snapshot.pack())
+
+    def close(self):
+        self.ring.close()
+        self.commands.close()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+Fixed size binary snapshot of the controller state
+
+A frame is a single packed struct (little endian) containing:
+    - header: version, sequence, time, mode, selected leg, estop...
+    - MAX_LEGS leg records (unused records have leg_number 0)
+    - body sensors
+
+Values that are not (yet) known are packed as nan (or -1 for indices)
+"""
+
+import struct
+import time
+
+from .. import consts
+from ..controllers import multileg
+
+
+VERSION = 1
+
+# legs 1 - 6 and the fake leg
+MAX_LEGS = 7
+
+FOOT_STATES = [None, 'stance', 'lift', 'swing', 'lower', 'wait']
+
+MODES = multileg.MultiLeg.modes
+
+# version, seq, time, mode index, leg index, estop, n legs,
+# deadman, halted, speed scalar, config seq
+HEADER_FMT = 'HIdbbbB??fI'
+# leg number, estop, time, x, y, z, hip, thigh, knee, calf,
+# pid output (hip, thigh, knee), set point (...), error (...),
+# r, dr, idr, state index
+LEG_FMT = 'Bbd3f4f9f3fb'
+# feed pressure, engine rpm, feed oil temp, roll, pitch, yaw
+BODY_FMT = '6f'
+
+FRAME = struct.Struct('<' + HEADER_FMT + LEG_FMT * MAX_LEGS + BODY_FMT)
+FRAME_SIZE = FRAME.size
+
+N_HEADER = 11
+N_LEG = 23
+
+JOINTS = ('hip', 'thigh', 'knee')
+
+nan = float('nan')
+
+
+def _index(values, value):
+    try:
+        return values.index(value)
+    except ValueError:
+        return -1
+
+
+def _int_or(value, default=-1):
+    if value is None:
+        return default
+    return int(value)
+
+
+def pack_leg(leg, foot=None):
+    xyz = leg.xyz
+    angles = leg.angles
+    pid = leg.pid
+    values = [
+        leg.leg_number, _int_or(leg.estop), xyz.get('time', nan),
+        xyz.get('x', nan), xyz.get('y', nan), xyz.get('z', nan),
+        angles.get('hip', nan), angles.get('thigh', nan),
+        angles.get('knee', nan), angles.get('calf', nan)]
+    for k in ('output', 'set_point', 'error'):
+        d = pid.get(k, {})
+        values.extend([d.get(j, nan) for j in JOINTS])
+    if foot is None or foot.restriction is None:
+        values.extend([nan, nan, nan])
+    else:
+        r = foot.restriction
+        values.extend([r['r'], r['dr'], r['idr']])
+    if foot is None:
+        values.append(-1)
+    else:
+        values.append(_index(FOOT_STATES, foot.state))
+    return values
+
+
+EMPTY_LEG = [0, -1, nan] + [nan] * 19 + [-1]
+
+
+class SnapshotBuilder(object):
+    """Pack the state of a MultiLeg controller into frames
+
+    Body sensor values are only signaled so they are cached here
+    as they arrive.
+    """
+    def __init__(self, controller):
+        self.controller = controller
+        self.seq = 0
+        self.config_seq = 0
+        self.body = {
+            'feed_pressure': nan,
+            'engine_rpm': nan,
+            'feed_oil_temp': nan,
+            'heading': (nan, nan, nan),
+        }
+        for name in controller.bodies:
+            b = controller.bodies[name]
+            for k in ('feed_pressure', 'engine_rpm', 'feed_oil_temp'):
+                b.on(k, lambda v, k=k: self._on_body(k, v))
+            b.on(
+                'heading',
+                lambda r, p, y: self._on_body('heading', (r, p, y)))
+        controller.on('config_updated', self._on_config_updated)
+
+    def _on_body(self, key, value):
+        self.body[key] = value
+
+    def _on_config_updated(self):
+        self.config_seq += 1
+
+    def pack(self, t=None):
+        if t is None:
+            t = time.time()
+        c = self.controller
+        lns = sorted(c.legs)[:MAX_LEGS]
+        estops = [c.legs[ln].estop for ln in lns]
+        estops = [int(e) for e in estops if e is not None]
+        if len(estops):
+            estop = max(estops)
+        else:
+            estop = -1
+        if c.leg_index is None:
+            leg_index = -1
+        else:
+            leg_index = c.leg_index
+        self.seq += 1
+        values = [
+            VERSION, self.seq, t,
+            _index(MODES, c.mode), leg_index, estop, len(lns),
+            bool(c.deadman), bool(c.res.halted), c.speed_scalar,
+            self.config_seq]
+        for ln in lns:
+            values.extend(pack_leg(c.legs[ln], c.res.feet.get(ln, None)))
+        for _ in range(MAX_LEGS - len(lns)):
+            values.extend(EMPTY_LEG)
+        b = self.body
+        values.extend([
+            b['feed_pressure'], b['engine_rpm'], b['feed_oil_temp']])
+        values.extend(b['heading'])
+        return FRAME.pack(*values)
+
+
+def unpack_leg(values):
+    leg = {
+        'leg_number': values[0],
+        'estop': None if values[1] == -1 else values[1],
+        'xyz': {
+            'time': values[2],
+            'x': values[3], 'y': values[4], 'z': values[5]},
+        'angles': {
+            'time': values[2],
+            'hip': values[6], 'thigh': values[7], 'knee': values[8],
+            'calf': values[9]},
+        'pid': {
+            'time': values[2],
+            'output': dict(zip(JOINTS, values[10:13])),
+            'set_point': dict(zip(JOINTS, values[13:16])),
+            'error': dict(zip(JOINTS, values[16:19])),
+        },
+        'restriction': None,
+        'state': None,
+    }
+    if values[22] != -1:
+        leg['state'] = FOOT_STATES[values[22]]
+    if values[19] == values[19]:  # not nan
+        leg['restriction'] = {
+            'time': values[2],
+            'r': values[19], 'dr': values[20], 'idr': values[21]}
+    return leg
+
+
+def unpack(buf):
+    """Unpack a frame to a dict, raises ValueError on version mismatch"""
+    if len(buf) < FRAME_SIZE:
+        raise ValueError(
+            "Snapshot frame too short: %s < %s" % (len(buf), FRAME_SIZE))
+    values = FRAME.unpack(buf[:FRAME_SIZE])
+    if values[0] != VERSION:
+        raise ValueError(
+            "Snapshot version mismatch: %s != %s" % (values[0], VERSION))
+    h = values[:N_HEADER]
+    s = {
+        'version': h[0],
+        'seq': h[1],
+        'time': h[2],
+        'mode': None if h[3] == -1 else MODES[h[3]],
+        'leg_index': None if h[4] == -1 else h[4],
+        'estop': None if h[5] == -1 else h[5],
+        'deadman': h[7],
+        'halted': h[8],
+        'speed': h[9],
+        'config_seq': h[10],
+        'legs': {},
+    }
+    for i in range(h[6]):
+        o = N_HEADER + i * N_LEG
+        leg = unpack_leg(values[o:o + N_LEG])
+        s['legs'][leg['leg_number']] = leg
+    b = values[N_HEADER + MAX_LEGS * N_LEG:]
+    s['body'] = {
+        'feed_pressure': b[0],
+        'engine_rpm': b[1],
+        'feed_oil_temp': b[2],
+        'heading': tuple(b[3:6]),
+    }
+    return s
+
+
+def estop_name(value):
+    if value is None:
+        return 'unknown'
+    return consts.ESTOP_BY_NUMBER.get(value, str(value))
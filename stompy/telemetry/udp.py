@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+Stream snapshots (see snapshot.py) over udp for remote monitoring
+
+Each datagram holds exactly one versioned snapshot frame so packets can
+be lost or reordered without affecting later packets. Subscribers use the
+frame sequence number to drop stale packets and count lost ones.
+
+The address can be a multicast group (224.0.0.0 - 239.255.255.255) or a
+unicast host.
+"""
+
+import errno
+import socket
+import struct
+import time
+
+from . import snapshot
+
+
+default_address = ('239.255.76.67', 7667)
+
+# errors that mean 'try again later', never block the control loop on these
+SOFT_ERRORS = (
+    errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS,
+    errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH)
+
+
+def is_multicast(host):
+    try:
+        first = int(host.split('.')[0])
+    except ValueError:
+        return False
+    return 224 <= first <= 239
+
+
+def parse_address(address, default=None):
+    """Parse 'host:port', 'host' or ':port' to (host, port)"""
+    if default is None:
+        default = default_address
+    if address is None:
+        return default
+    if isinstance(address, (tuple, list)):
+        return tuple(address)
+    host, _, port = address.partition(':')
+    if host == '':
+        host = default[0]
+    if port == '':
+        port = default[1]
+    return (host, int(port))
+
+
+class Publisher(object):
+    """Send a snapshot every 1 / rate seconds, call update every tick"""
+    def __init__(self, controller, address=None, rate=10., ttl=1):
+        self.address = parse_address(address)
+        self.snapshot = snapshot.SnapshotBuilder(controller)
+        self.period = 1. / rate
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if is_multicast(self.address[0]):
+            self.socket.setsockopt(
+                socket.IPPROTO_IP, socket.IP_MULTICAST_TTL,
+                struct.pack('b', ttl))
+        self.socket.setblocking(False)
+        self.last_send = 0.
+        self.n_sent = 0
+        self.n_dropped = 0
+
+    @property
+    def rate(self):
+        return 1. / self.period
+
+    @rate.setter
+    def rate(self, rate):
+        self.period = 1. / rate
+
+    def send(self, t=None):
+        if t is None:
+            t = time.time()
+        self.last_send = t
+        try:
+            self.socket.sendto(self.snapshot.pack(t), self.address)
+            self.n_sent += 1
+        except socket.error as e:
+            if e.args[0] not in SOFT_ERRORS:
+                raise
+            self.n_dropped += 1
+
+    def update(self):
+        t = time.time()
+        if (t - self.last_send) >= self.period:
+            self.send(t)
+
+    def close(self):
+        self.socket.close()
+
+
+class Subscriber(object):
+    def __init__(self, address=None, interface='0.0.0.0'):
+        self.address = parse_address(address)
+        host, port = self.address
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if is_multicast(host):
+            self.socket.bind(('', port))
+            mreq = struct.pack(
+                '4s4s', socket.inet_aton(host), socket.inet_aton(interface))
+            self.socket.setsockopt(
+                socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        else:
+            self.socket.bind((host, port))
+        self.socket.setblocking(False)
+        self.latest = None
+        self.last_receive = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.n_received = 0
+        self.n_lost = 0
+        self.n_stale = 0
+        self.n_invalid = 0
+
+    def _receive(self, data):
+        try:
+            s = snapshot.unpack(data)
+        except (ValueError, struct.error):
+            self.n_invalid += 1
+            return None
+        if self.latest is not None:
+            last_seq = self.latest['seq']
+            if s['seq'] <= last_seq:
+                if s['seq'] > last_seq - 1000:
+                    # reordered or duplicated packet
+                    self.n_stale += 1
+                    return None
+                # large jump back: publisher restarted
+            else:
+                self.n_lost += s['seq'] - last_seq - 1
+        self.n_received += 1
+        self.latest = s
+        self.last_receive = time.time()
+        return s
+
+    def poll(self, max_packets=100):
+        """Read all pending packets, return list of new snapshots"""
+        new = []
+        for _ in range(max_packets):
+            try:
+                data = self.socket.recv(snapshot.FRAME_SIZE + 1)
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            s = self._receive(data)
+            if s is not None:
+                new.append(s)
+        return new
+
+    def wait(self, timeout=1.0):
+        """Block up to timeout seconds for a new snapshot"""
+        t0 = time.time()
+        while time.time() - t0 < timeout:
+            new = self.poll()
+            if len(new):
+                return new[-1]
+            time.sleep(0.001)
+        return None
+
+    def close(self):
+        self.socket.close()
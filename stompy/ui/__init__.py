@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 
+from . import remote
 from . import ui
 from .ui import start
 
 
-__all__ = ['ui', 'start']
+__all__ = ['remote', 'ui', 'start']
@@ -2,6 +2,7 @@
 """
 """
 
+import collections
 import sys
 import time
 
@@ -10,9 +11,15 @@ from PyQt4 import (QtGui, QtCore)
 
 from .. import kinematics
 from .. import geometry
+from .. import scheduler
 from .. import transforms
 
 
+# repaints are scheduled here and run by the ui (scheduler.default is
+# run by the controller which may be in another thread)
+display = scheduler.Scheduler()
+
+
 class Leg(object):
     def __init__(self, number=0):
         # joint angles
@@ -112,15 +119,30 @@ class LegDisplay(QtGui.QWidget):
             'calf': QtGui.QPen(QtCore.Qt.cyan, 1),
             'support': QtGui.QPen(QtCore.Qt.darkCyan, 1),
         }
-        self.paintsPerSecond = 10.
-        self._last_update_time = time.time() - 1.
+        # updates only mark the display dirty, repaint at most
+        # paintsPerSecond times a second
+        self._dirty = True
+        self.paint_task = display.every(
+            0.1, self._repaint, name='leg_display_paint',
+            priority=scheduler.PRIORITY_LOW)
+        self.destroyed.connect(
+            lambda *args: display.cancel(self.paint_task))
+
+    @property
+    def paintsPerSecond(self):
+        return 1. / self.paint_task.period
+
+    @paintsPerSecond.setter
+    def paintsPerSecond(self, value):
+        self.paint_task.period = 1. / value
+
+    def _repaint(self):
+        if self._dirty:
+            self._dirty = False
+            super(LegDisplay, self).update()
 
     def update(self, *args, **kwargs):
-        t = time.time()
-        dt = t - self._last_update_time
-        if dt > (1. / self.paintsPerSecond):
-            super(LegDisplay, self).update(*args, **kwargs)
-            self._last_update_time = t
+        self._dirty = True
 
     def resizeEvent(self, event):
         # account for any user applied offset
@@ -336,23 +358,135 @@ class BodyDisplay(LegDisplay):
         painter.end()
 
 
+def min_max_decimate(vs, n_bins):
+    """Reduce vs to the min and max of each of n_bins (contiguous) bins
+
+    Returns (positions, values), 2 points per bin: the bin min then max
+    both at the bin start index (vs is returned unchanged, with its
+    indices, if it has no more than 2 values per bin)
+    """
+    n = len(vs)
+    if n <= n_bins * 2:
+        return numpy.arange(n), vs
+    starts = numpy.linspace(0, n, n_bins + 1).astype('i8')[:-1]
+    pts = numpy.empty(n_bins * 2)
+    pts[0::2] = numpy.minimum.reduceat(vs, starts)
+    pts[1::2] = numpy.maximum.reduceat(vs, starts)
+    return numpy.repeat(starts, 2), pts
+
+
+_qreal_dtype = False
+
+
+def qreal_dtype():
+    """numpy dtype of qreal (double on most builds, float on some
+    arm/embedded builds), None if it can't be determined"""
+    global _qreal_dtype
+    if _qreal_dtype is not False:
+        return _qreal_dtype
+    _qreal_dtype = None
+    # two points so the buffer holds at least 16 bytes (the size of one
+    # point as f8) whatever qreal is, only the first point is read
+    polygon = QtGui.QPolygonF([
+        QtCore.QPointF(1.5, -2.5), QtCore.QPointF(1.5, -2.5)])
+    for dtype in ('f4', 'f8'):
+        size = numpy.dtype(dtype).itemsize * 2
+        ptr = polygon.data()
+        ptr.setsize(size)
+        if numpy.array_equal(
+                numpy.frombuffer(ptr, dtype=dtype)[:2], [1.5, -2.5]):
+            _qreal_dtype = dtype
+            break
+    return _qreal_dtype
+
+
+def array_to_polygon(xs, ys):
+    """Make a QPolygonF from x and y arrays, written directly to the
+    polygon's point buffer (as qreal_dtype, QPointFs if unknown)"""
+    n = len(xs)
+    dtype = qreal_dtype()
+    if dtype is None:
+        return QtGui.QPolygonF([
+            QtCore.QPointF(x, y) for (x, y) in zip(xs, ys)])
+    polygon = QtGui.QPolygonF(n)
+    if n == 0:
+        return polygon
+    ptr = polygon.data()
+    ptr.setsize(n * 2 * numpy.dtype(dtype).itemsize)
+    pts = numpy.frombuffer(ptr, dtype=dtype)
+    pts[0::2] = xs
+    pts[1::2] = ys
+    return polygon
+
+
 class ChartData(object):
+    """Last max_n values of a series, with running min and max
+
+    Values are written twice to a preallocated buffer (at i and
+    i + max_n) so the last values are always one contiguous slice
+    (get_data does not copy). Min and max are kept in monotonic queues
+    of (index, value) so each append costs O(1) (amortized).
+    """
     max_n = 200
 
-    def __init__(self, label=''):
-        self.data = []
-        self.label = ''
+    def __init__(self, label='', max_n=None):
+        if max_n is not None:
+            self.max_n = max_n
+        self.label = label
+        self._buffer = numpy.zeros(self.max_n * 2)
+        self.clear()
 
     def append(self, value):
-        self.data.append(value)
-        if len(self.data) > self.max_n:
-            self.data = self.data[-self.max_n:]
+        i = self._n_appended
+        m = self.max_n
+        self._buffer[i % m] = value
+        self._buffer[i % m + m] = value
+        self._n_appended += 1
+        # drop values that can no longer be the min (or max)
+        mins = self._mins
+        while len(mins) and mins[-1][1] >= value:
+            mins.pop()
+        mins.append((i, value))
+        if mins[0][0] <= i - m:
+            mins.popleft()
+        maxs = self._maxs
+        while len(maxs) and maxs[-1][1] <= value:
+            maxs.pop()
+        maxs.append((i, value))
+        if maxs[0][0] <= i - m:
+            maxs.popleft()
+
+    def __len__(self):
+        return min(self._n_appended, self.max_n)
+
+    @property
+    def min(self):
+        if not len(self._mins):
+            return numpy.nan
+        return self._mins[0][1]
+
+    @property
+    def max(self):
+        if not len(self._maxs):
+            return numpy.nan
+        return self._maxs[0][1]
 
     def get_data(self):
-        return self.data
+        """Oldest to newest values (a view of the buffer)"""
+        m = self.max_n
+        if self._n_appended < m:
+            return self._buffer[m:m + self._n_appended]
+        i = self._n_appended % m
+        return self._buffer[i:i + m]
+
+    def decimate(self, n_bins):
+        """min_max_decimate the data"""
+        return min_max_decimate(self.get_data(), n_bins)
 
     def clear(self):
-        self.data = []
+        self._n_appended = 0
+        self._mins = collections.deque()
+        self._maxs = collections.deque()
 
 
 class LineChart(QtGui.QWidget):
@@ -373,8 +507,9 @@ class LineChart(QtGui.QWidget):
         self._pen_index = 0
         super(LineChart, self).__init__(parent)
 
-    def addSeries(self, label, pen=None):
-        self.data[label] = ChartData(label=label)
+    def addSeries(self, label, pen=None, max_n=None):
+        """Add a series of the last max_n values [ChartData.max_n]"""
+        self.data[label] = ChartData(label=label, max_n=max_n)
         if pen is None:
             pen = self._pens[self._pen_index]
             self._pen_index = (self._pen_index + 1) % len(self._pens)
@@ -399,9 +534,7 @@ class LineChart(QtGui.QWidget):
         margin = self._cfg['margin']
         axis_margin = n_series * aw
         # give space for axes at left
-        xs = (
-            numpy.arange(ChartData.max_n) *
-            (ww - axis_margin - margin) / float(ChartData.max_n) + axis_margin)
+        plot_width = ww - axis_margin - margin
         for (series_i, label) in enumerate(self.data):
             # draw axis
             ax = series_i * aw
@@ -418,10 +551,10 @@ class LineChart(QtGui.QWidget):
             painter.drawLine(
                 ax + aw - 8, wh / 2, ax + aw - 2, wh / 2)
             # plot data
-            vs = numpy.array(self.data[label].get_data())
-            if len(vs) == 0:
+            data = self.data[label]
+            if len(data) == 0:
                 continue
-            minv, maxv = numpy.min(vs), numpy.max(vs)
+            minv, maxv = data.min, data.max
 
             painter.setFont(QtGui.QFont('Arial', 10, 1))
 
@@ -458,13 +591,17 @@ class LineChart(QtGui.QWidget):
                 QtCore.Qt.AlignRight, label)
             painter.restore()
 
+            # at most a min and max per pixel column
+            inds, vs = data.decimate(
+                max(1, plot_width * len(data) // data.max_n))
+            # newest value at the right edge
+            xs = (
+                (inds + (data.max_n - len(data))) *
+                plot_width / float(data.max_n) + axis_margin)
             ys = (
-                (1. - (vs - minv) / float(maxv - minv))
+                (1. - (vs - minv) / float(maxv - minv or 1.))
                 * (wh - margin * 2) + margin)
-            painter.drawPolyline(
-                QtGui.QPolygonF([
-                    QtCore.QPointF(x, y) for (x, y)
-                    in zip(xs[-len(ys):], ys)]))
+            painter.drawPolyline(array_to_polygon(xs, ys))
 
         painter.end()
 
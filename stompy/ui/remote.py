@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+"""
+Run the ui apart from the controller (in a separate process, or beside
+the control loop thread started by ui.start)
+
+The controller publishes snapshots to a shared memory ring
+(see telemetry.shm). RemoteController reads the ring and mimics
+the parts of MultiLeg used by the ui (legs, res.feet, bodies and
+their signals). Commands are forwarded to the controller.
+"""
+
+import time
+
+import numpy
+
+from .. import consts
+from .. import signaler
+from ..telemetry import shm
+from ..telemetry import snapshot
+from . import nogl
+from . import ui
+from .. import utils
+
+
+class RemoteLeg(signaler.Signaler):
+    def __init__(self, leg_number, client):
+        super(RemoteLeg, self).__init__()
+        self.leg_number = leg_number
+        self.leg_name = consts.LEG_NAME_BY_NUMBER[leg_number]
+        self._client = client
+        self.estop = None
+        self.adc = {}
+        self.angles = {}
+        self.xyz = {}
+        self.pid = {}
+        self.pwm = {}
+        self.loop_time_stats = utils.StatsMonitor()
+
+    def compute_calf_zero(self):
+        self._client.send('compute_calf_zero', self.leg_number)
+
+    def update_from(self, s):
+        if s['estop'] != self.estop:
+            self.estop = s['estop']
+            self.trigger('estop', self.estop)
+        t = s['xyz']['time']
+        if t != t or t == self.xyz.get('time', None):  # nan or not new
+            return
+        self.xyz = s['xyz']
+        self.angles = s['angles']
+        self.pid = s['pid']
+        self.trigger('pid', self.pid)
+        self.trigger('angles', self.angles)
+        self.trigger('xyz', self.xyz)
+
+
+class RemoteFoot(signaler.Signaler):
+    def __init__(self, leg_number):
+        super(RemoteFoot, self).__init__()
+        self.leg_number = leg_number
+        self.state = None
+        self.restriction = None
+        self.restriction_modifier = 0.
+
+    def update_from(self, s):
+        if s['state'] != self.state:
+            self.state = s['state']
+            self.trigger('state', self.state)
+        r = s['restriction']
+        if r is not None and r != self.restriction:
+            self.restriction = r
+            self.trigger('restriction', self.restriction)
+
+
+class RemoteRestriction(object):
+    def __init__(self, feet):
+        self.feet = feet
+        self.halted = False
+
+
+class RemoteBody(signaler.Signaler):
+    def __init__(self, name):
+        super(RemoteBody, self).__init__()
+        self.name = name
+        self.values = {}
+
+    def update_from(self, s):
+        for k in s:
+            v = s[k]
+            if k == 'heading':
+                if numpy.any(numpy.isnan(v)):
+                    continue
+            elif numpy.isnan(v):
+                continue
+            if self.values.get(k, None) == v:
+                continue
+            self.values[k] = v
+            if k == 'heading':
+                self.trigger(k, *v)
+            else:
+                self.trigger(k, v)
+
+
+class RemoteController(signaler.Signaler):
+    modes = snapshot.MODES
+
+    def __init__(self, filename=None, address=None, timeout=5.0):
+        super(RemoteController, self).__init__()
+        self.reader = shm.RingReader(filename)
+        self.client = shm.CommandClient(address)
+        s = self._wait_for_snapshot(timeout)
+        self.legs = {}
+        feet = {}
+        for ln in s['legs']:
+            self.legs[ln] = RemoteLeg(ln, self.client)
+            feet[ln] = RemoteFoot(ln)
+        self.res = RemoteRestriction(feet)
+        self.bodies = {'imu': RemoteBody('imu')}
+        self.mode = s['mode']
+        self.leg_index = s['leg_index']
+        if self.leg_index is None:
+            self.leg = None
+        else:
+            self.leg = self.legs[self.leg_index]
+        self.estop = s['estop']
+        self.deadman = s['deadman']
+        self.speed_scalar = s['speed']
+        self.config_seq = s['config_seq']
+        self.update_from(s)
+
+    def _wait_for_snapshot(self, timeout):
+        t0 = time.time()
+        while time.time() - t0 < timeout:
+            data = self.reader.read_latest()
+            if data is not None:
+                return snapshot.unpack(data)
+            time.sleep(0.01)
+        raise IOError(
+            "No telemetry found in %s, is the controller running?" %
+            self.reader.filename)
+
+    def set_mode(self, mode):
+        self.client.send('set_mode', mode)
+
+    def set_leg(self, index):
+        self.client.send('set_leg', index)
+
+    def set_speed(self, speed):
+        self.client.send('set_speed', speed)
+
+    def get_config(self, path):
+        return self.client.request('get_config', (path, ))
+
+    def set_config(self, path, value):
+        return self.client.request('set_config', (path, value))
+
+    def update_from(self, s):
+        for ln in s['legs']:
+            if ln not in self.legs:
+                continue
+            self.legs[ln].update_from(s['legs'][ln])
+            self.res.feet[ln].update_from(s['legs'][ln])
+        self.bodies['imu'].update_from(s['body'])
+        self.res.halted = s['halted']
+        self.deadman = s['deadman']
+        if s['mode'] != self.mode:
+            self.mode = s['mode']
+            self.trigger('mode', self.mode)
+        if s['leg_index'] != self.leg_index:
+            self.leg_index = s['leg_index']
+            if self.leg_index is None:
+                self.leg = None
+            else:
+                self.leg = self.legs[self.leg_index]
+            self.trigger('set_leg', self.leg_index)
+        if s['estop'] != self.estop:
+            self.estop = s['estop']
+            if self.estop is not None:
+                self.trigger('estop', self.estop)
+        if s['speed'] != self.speed_scalar:
+            self.speed_scalar = s['speed']
+            self.trigger('speed', self.speed_scalar)
+        if s['config_seq'] != self.config_seq:
+            self.config_seq = s['config_seq']
+            self.trigger('config_updated')
+        zs = [
+            self.legs[ln].xyz['z'] for ln in self.legs
+            if 'z' in self.legs[ln].xyz]
+        if len(zs):
+            self.trigger('height', -numpy.mean(sorted(zs)[:3]))
+
+    def update(self):
+        nogl.display.run()
+        data = self.reader.read_latest()
+        if data is None:
+            return
+        self.update_from(snapshot.unpack(data))
+
+    def close(self):
+        self.reader.close()
+        self.client.close()
+
+
+def start(filename=None, address=None):
+    c = RemoteController(filename, address)
+    print("Connected to controller with legs: %s" % (sorted(c.legs), ))
+    ui.run_ui(ui.load_ui(c))
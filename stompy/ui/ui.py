@@ -6,15 +6,19 @@ import traceback
 import numpy
 from PyQt4 import QtCore, QtGui
 
-from .. import body
 from .. import calibration
 from .. import consts
 from .. import controllers
 from . import base
-from .. import joystick
+from .. import headless
 from .. import kinematics
-from .. import leg
 from .. import log
+from . import nogl
+from .. import profiler
+
+
+# ms between ui updates (reading controller state and repaints)
+DISPLAY_PERIOD_MS = 33
 
 
 class Tab(object):
@@ -23,7 +27,7 @@ class Tab(object):
         self.controller = controller
         if self.controller is not None:
             self._last_leg_index = None
-            self.controller.on('set_leg', self.set_leg_index)
+            self.controller.on('set_leg', self.set_leg_index, weak=True)
             self.set_leg_index(self.controller.leg_index)
 
     def set_leg_index(self, index):
@@ -424,21 +428,12 @@ class BodyTab(Tab):
             attr, value = str(item.text(0)), str(item.text(1))
             if parent is not None:
                 attr = '.'.join((parent, attr))
-            ts = attr.split('.')
-            obj = self.controller
-            assert ts[0] == 'controller'
-            ts = ts[1:]
-            while len(ts) > 1:
-                obj = getattr(obj, ts.pop(0))
-                if obj is None:
-                    break
-            if obj is not None:
-                attr = ts[0]
-                if isinstance(obj, dict):
-                    old_value = obj[attr]
-                else:
-                    old_value = getattr(obj, attr)
+            try:
+                old_value = self.controller.get_config(attr)
                 item.setText(1, str(old_value))
+            except AttributeError:
+                # part of the path is None or missing
+                pass
         for i in range(item.childCount()):
             self.set_config_values(item.child(i))
         if item == self.ui.configTree.invisibleRootItem():
@@ -501,6 +496,50 @@ class BodyTab(Tab):
         # TODO calculate pitch and roll
 
 
+class ProfileTab(Tab):
+    """Control loop stage, leg and signal timing (see profiler)"""
+    def __init__(self, ui, controller):
+        self.widget = QtGui.QWidget()
+        layout = QtGui.QVBoxLayout(self.widget)
+        buttons = QtGui.QHBoxLayout()
+        self.enable_check = QtGui.QCheckBox("Enabled")
+        self.enable_check.setChecked(profiler.default.enabled)
+        self.enable_check.toggled.connect(profiler.default.enable)
+        buttons.addWidget(self.enable_check)
+        reset_button = QtGui.QPushButton("Reset")
+        reset_button.clicked.connect(
+            lambda c: profiler.default.reset_stats())
+        buttons.addWidget(reset_button)
+        log_button = QtGui.QPushButton("Log")
+        log_button.clicked.connect(
+            lambda c: log.info({'profile': profiler.default.stats()}))
+        buttons.addWidget(log_button)
+        buttons.addStretch()
+        layout.addLayout(buttons)
+        self.text = QtGui.QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setFont(QtGui.QFont('Monospace'))
+        layout.addWidget(self.text)
+        ui.tabs.addTab(self.widget, "Profile")
+        self.timer = None
+        super(ProfileTab, self).__init__(ui, controller)
+
+    def update_text(self):
+        self.text.setPlainText(str(profiler.default))
+
+    def start_showing(self):
+        self.enable_check.setChecked(profiler.default.enabled)
+        self.update_text()
+        if self.timer is None:
+            self.timer = QtCore.QTimer()
+            self.timer.timeout.connect(self.update_text)
+        self.timer.start(500)
+
+    def stop_showing(self):
+        if self.timer is not None:
+            self.timer.stop()
+
+
 class TabManager(object):
     def __init__(self, tab_widget):
         self.tab_widget = tab_widget
@@ -575,6 +614,7 @@ def load_ui(controller=None):
     tm.add_tab('PID', PIDTab(ui, controller))
     tm.add_tab('Leg', LegTab(ui, controller))
     tm.add_tab('Body', BodyTab(ui, controller))
+    tm.add_tab('Profile', ProfileTab(ui, controller))
     tm.show_current()
 
     if 'imu' in controller.bodies:
@@ -606,29 +646,10 @@ def load_ui(controller=None):
         if parent is not None:
             attr = '.'.join((parent, attr))
         # get old value
-        ts = attr.split('.')
-        obj = controller
-        assert ts[0] == 'controller'
-        ts = ts[1:]
-        while len(ts) > 1:
-            obj = getattr(obj, ts.pop(0))
-        attr = ts[0]
-        if isinstance(obj, dict):
-            old_value = obj[attr]
-        else:
-            old_value = getattr(obj, attr)
+        old_value = controller.get_config(attr)
         print("Old value: %s" % old_value)
         try:
-            value = type(old_value)(value)
-        except Exception as e:
-            print("Error converting value %s: %s [%s]" % (attr, value, e))
-            item.setText(1, str(old_value))
-            return
-        try:
-            if isinstance(obj, dict):
-                obj[attr] = value
-            else:
-                setattr(obj, attr, value)
+            controller.set_config(attr, value)
         except Exception as e:
             print("Error setting config %s = %s [%s]" % (attr, value, e))
             item.setText(1, str(old_value))
@@ -636,10 +657,10 @@ def load_ui(controller=None):
 
     ui.configTree.itemChanged.connect(item_changed)
     MainWindow.show()
-    timer = None
+    # the ui only observes the controller (see start), the timer reads
+    # the latest state and runs display repaints
+    timer = QtCore.QTimer()
     if controller is not None:
-        timer = QtCore.QTimer()
-
         def update():
             try:
                 controller.update()
@@ -647,11 +668,10 @@ def load_ui(controller=None):
                 ex_type, ex, tb = sys.exc_info()
                 print("controller update error: %s" % e)
                 traceback.print_tb(tb)
-                # TODO stop updates on error?
-                #timer.stop()
-        #timer.timeout.connect(controller.update)
         timer.timeout.connect(update)
-        timer.start(10)
+    else:
+        timer.timeout.connect(nogl.display.run)
+    timer.start(DISPLAY_PERIOD_MS)
     return {
         'app': app, 'ui': ui, 'window': MainWindow, 'tab_manager': tm,
         'timer': timer}
@@ -661,29 +681,23 @@ def run_ui(ui):
     sys.exit(ui['app'].exec_())
 
 
-def start():
-    if joystick.ps3.available():
-        joy = joystick.ps3.PS3Joystick()
-    elif joystick.steel.available():
-        joy = joystick.steel.SteelJoystick()
-        print("Connected to steel joystick")
-    else:
-        joy = None
-
-    legs = leg.teensy.connect_to_teensies()
-
-    if len(legs) == 0:
-        raise IOError("No teensies found")
-
-    lns = sorted(legs.keys())
-    print("Connected to legs: %s" % (lns, ))
-
-    bodies = body.connect_to_teensies()
-    print("Connected to bodies: %s" % (sorted(bodies.keys())))
-
-    c = controllers.multileg.MultiLeg(legs, joy, bodies)
-
-    run_ui(load_ui(c))
+def start(leg_ports=None, body_ports=None):
+    """Run the controller loop in its own thread (so the ui can't delay
+    controller updates), the ui observes it through telemetry and sends
+    commands as a remote ui would (see remote)"""
+    from . import remote
+    c = controllers.multileg.connect(leg_ports, body_ports)
+    runner = headless.Runner(c, status_period=None)
+    runner.start()
+    try:
+        rc = remote.RemoteController(
+            runner.bus.ring.filename, runner.bus.commands.address)
+        ui = load_ui(rc)
+        r = ui['app'].exec_()
+        rc.close()
+    finally:
+        runner.close()
+    sys.exit(r)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 #import glob
+import collections
 import os
 #import subprocess
 
@@ -110,3 +111,56 @@ class StatsMonitor(object):
     def __str__(self):
         return "%s[n=%i, mean=%.2g, min=%.2g, max=%.2g]" % (
             self.__class__.__name__, self.n, self.mean, self.min, self.max)
+
+
+class LRUCache(object):
+    """Bounded mapping that evicts the least recently used item"""
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self._items = collections.OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            self.misses += 1
+            return default
+        self.hits += 1
+        # move to most recently used
+        value = self._items.pop(key)
+        self._items[key] = value
+        return value
+
+    def set(self, key, value):
+        if key in self._items:
+            del self._items[key]
+        self._items[key] = value
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compute(self, key, func, *args, **kwargs):
+        if key in self._items:
+            return self.get(key)
+        self.misses += 1
+        value = func(*args, **kwargs)
+        self.set(key, value)
+        return value
+
+    def clear(self):
+        self._items.clear()
+
+    def __str__(self):
+        return "%s[size=%i/%i, hits=%i, misses=%i, evictions=%i]" % (
+            self.__class__.__name__, len(self), self.max_size,
+            self.hits, self.misses, self.evictions)
@@ -26,6 +26,7 @@ def idle(leg, seconds, idle_timeout=0.005, break_check=None):
     t0 = time.time()
     while ((time.time() - t0) < seconds) and not break_check():
         leg.update()
+        stompy.scheduler.default.run()
         time.sleep(idle_timeout)
 
 
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Time the imports of each 'python -m stompy' entry point
+
+Each import runs in a new interpreter (repeated -n times, the minimum
+is reported) along with heavy modules it pulled in that it shouldn't
+(the ui is allowed a gui toolkit). Exits with an error if any entry
+point takes longer than -m seconds.
+
+    python tests/startup_time.py [-n 5] [-m 0.5] [-c run,program]
+"""
+
+import argparse
+import subprocess
+import sys
+
+
+# command: module imported by stompy/__main__.py
+entry_points = [
+    ('program', 'stompy.utils'),
+    ('run', 'stompy.headless'),
+    ('dashboard', 'stompy.telemetry.dashboard'),
+    ('emulate', 'stompy.emulator'),
+    ('sweep', 'stompy.restriction.sweep'),
+    ('ui', 'stompy.ui'),
+]
+
+# should only be imported on use
+heavy_modules = ['pylab', 'matplotlib', 'PyQt4', 'scipy']
+
+script = """
+import sys
+import time
+t0 = time.time()
+import %s
+t = time.time() - t0
+print(t)
+print(','.join([m for m in %r if m in sys.modules]))
+"""
+
+
+def time_import(module):
+    """Return import time (seconds) and heavy modules loaded"""
+    out = subprocess.check_output(
+        [sys.executable, '-c', script % (module, heavy_modules)],
+        universal_newlines=True)
+    # the last 2 lines (module imports may print)
+    t, heavy = out.split('\n')[-3:-1]
+    return float(t), heavy
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-n", "--repeat", type=int, default=5)
+parser.add_argument(
+    "-m", "--max-time", type=float, default=None,
+    help="fail if an entry point takes longer (seconds)")
+parser.add_argument(
+    "-c", "--commands", type=str, default=None,
+    help="comma separated commands to time")
+args = parser.parse_args()
+
+commands = None
+if args.commands is not None:
+    commands = args.commands.split(',')
+
+failed = []
+print("%-10s %-28s %8s  %s" % ('command', 'module', 'time s', 'heavy'))
+for (command, module) in entry_points:
+    if commands is not None and command not in commands:
+        continue
+    try:
+        times = []
+        for _ in range(args.repeat):
+            t, heavy = time_import(module)
+            times.append(t)
+    except subprocess.CalledProcessError:
+        print("%-10s %-28s %8s" % (command, module, 'failed'))
+        continue
+    t = min(times)
+    if command == 'ui':
+        heavy = ','.join([m for m in heavy.split(',') if m != 'PyQt4'])
+    print("%-10s %-28s %8.3f  %s" % (command, module, t, heavy))
+    if args.max_time is not None and t > args.max_time:
+        failed.append(command)
+
+if len(failed):
+    print("Too slow: %s" % (', '.join(failed), ))
+    sys.exit(1)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+"""
+FootIndex swing clearance with one or more legs
+
+python tests/test_collision.py (or pytest tests)
+"""
+
+import numpy
+
+from stompy.restriction import collision
+
+
+def test_single_leg_swing_clearance():
+    index = collision.FootIndex([1], [[0., 0.]])
+    index.set_positions([[1., 0.]])
+    fd, hd = index.swing_clearance(1, (1., 0.), (2., 0.))
+    assert fd == numpy.inf
+    assert hd == numpy.inf
+    assert index.check(0.5, 0.5) == []
+
+
+def test_two_leg_swing_clearance():
+    index = collision.FootIndex([1, 2], [[0., 0.], [0., 3.]])
+    index.set_positions([[1., 0.], [1., 3.]])
+    # swing leg 1 towards leg 2's foot
+    fd, hd = index.swing_clearance(1, (1., 0.), (1., 2.))
+    assert abs(fd - 1.) < 1E-9
+    assert abs(hd - numpy.sqrt(2.)) < 1E-9
+
+
+if __name__ == '__main__':
+    test_single_leg_swing_clearance()
+    test_two_leg_swing_clearance()
+    print("ok")
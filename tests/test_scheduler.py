@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""
+A task that raises must not stop (or unschedule) the other due tasks
+
+python tests/test_scheduler.py (or pytest tests)
+"""
+
+import logging
+
+from stompy import scheduler
+
+
+class Clock(object):
+    def __init__(self):
+        self.t = 0.
+
+    def __call__(self):
+        return self.t
+
+
+def test_raising_task_keeps_others_running():
+    logging.getLogger('stompy.scheduler').disabled = True
+    clock = Clock()
+    s = scheduler.Scheduler(clock=clock)
+    runs = {'a': 0, 'b': 0, 'c': 0}
+
+    def a():
+        runs['a'] += 1
+        raise ValueError("a failed")
+
+    def b():
+        runs['b'] += 1
+
+    def c():
+        runs['c'] += 1
+
+    ta = s.every(1., a, name='a', priority=scheduler.PRIORITY_HEARTBEAT)
+    s.every(1., b, name='b', priority=scheduler.PRIORITY_HEARTBEAT)
+    s.every(1., c, name='c', priority=scheduler.PRIORITY_LOW)
+    for i in range(3):
+        clock.t += 1.
+        assert s.run() == 3
+    assert runs == {'a': 3, 'b': 3, 'c': 3}
+    assert ta.n_errors == 3
+    # all tasks are still scheduled
+    assert sorted([t.name for (_, _, t) in s._heap]) == ['a', 'b', 'c']
+    assert s.stats()['a']['errors'] == 3
+
+
+if __name__ == '__main__':
+    test_raising_task_keeps_others_running()
+    print("ok")